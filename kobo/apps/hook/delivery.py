@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+from collections import defaultdict
+from datetime import timedelta
+import math
+from multiprocessing.pool import ThreadPool
+import os
+import threading
+
+import constance
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+import requests
+from requests.adapters import HTTPAdapter
+
+from .constants import HOOK_LOG_PENDING
+from .models import EndpointHealth, HookLog
+from kpi.constants import INSTANCE_FORMAT_TYPE_JSON
+from kpi.deployment_backends.kc_access.proxy import RejectCookiesPolicy
+from kpi.utils.log import logging
+
+class DeliveryInProgress(Exception):
+    """
+    Another process is delivering to the same endpoint
+    """
+    pass
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_hook_session():
+    """
+    Returns the `requests.Session` shared by this process to send data to
+    external endpoints. It keeps up to `HOOK_DELIVERY_CONCURRENCY` connections
+    alive per host, never stores cookies and never retries by itself:
+    retries follow `HookLog.get_remaining_seconds()`.
+    A new session is created after forking, since sockets must not be shared
+    between processes.
+
+    :return: requests.Session
+    """
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            adapter = HTTPAdapter(pool_maxsize=settings.HOOK_DELIVERY_CONCURRENCY,
+                                  max_retries=0)
+            session = requests.Session()
+            session.cookies.set_policy(RejectCookiesPolicy())
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+            _session_pid = os.getpid()
+        return _session
+
+
+def get_due_filter():
+    """
+    Returns the filter of pending logs that are ready to be sent: new logs,
+    and logs whose last try is older than `HookLog.get_remaining_seconds()`
+    Logs are given up after `constance.config.HOOK_MAX_RETRIES` retries.
+
+    :return: Q
+    """
+    now = timezone.now()
+    due_filter = Q(tries=0)
+    for tries in range(1, constance.config.HOOK_MAX_RETRIES + 1):
+        seconds = HookLog.get_remaining_seconds(tries - 1)
+        due_filter |= Q(tries=tries,
+                        date_modified__lte=now - timedelta(seconds=seconds))
+    return Q(status=HOOK_LOG_PENDING, hook__active=True) & due_filter
+
+
+def get_due_endpoints():
+    """
+    :return: list. Endpoints with at least one log ready to be sent, except
+        those whose circuit is open
+    """
+    parked_endpoints = EndpointHealth.objects.filter(
+        state=EndpointHealth.OPEN, retry_at__gt=timezone.now()
+    ).values_list("endpoint", flat=True)
+    return list(HookLog.objects.filter(get_due_filter())
+                .exclude(hook__endpoint__in=parked_endpoints)
+                .order_by()
+                .values_list("hook__endpoint", flat=True)
+                .distinct())
+
+
+def deliver_hook_logs(endpoint):
+    """
+    Sends up to `HOOK_DELIVERY_BATCH_SIZE` logs that are ready to be sent to
+    `endpoint`, `HOOK_DELIVERY_CONCURRENCY` at a time. Only one process
+    delivers to the same endpoint at once; see `EndpointHealth.acquire()`.
+    Fewer logs, or none, are sent while the endpoint is unhealthy;
+    see `EndpointHealth`.
+
+    Submissions are retrieved and logs are saved in the calling thread; the
+    other threads only wait for the endpoint.
+
+    :param endpoint: str.
+    :return: bool. Whether some logs may still be waiting
+    :raises DeliveryInProgress: if another process owns the endpoint
+    """
+    # Longest time a batch may take if every request times out
+    lock_timeout = int(math.ceil(float(settings.HOOK_DELIVERY_BATCH_SIZE) /
+                                 settings.HOOK_DELIVERY_CONCURRENCY) *
+                       settings.HOOK_DELIVERY_TIMEOUT * 2)
+    health = EndpointHealth.objects.get_or_create(endpoint=endpoint)[0]
+    if not health.acquire(lock_timeout):
+        raise DeliveryInProgress(endpoint)
+
+    try:
+        batch_size = health.get_batch_size()
+        if batch_size == 0:
+            # Circuit is open, logs stay pending until `health.retry_at`
+            return False
+
+        hook_logs = list(HookLog.objects.filter(get_due_filter(), hook__endpoint=endpoint)
+                         .select_related("hook__asset")
+                         .order_by("date_modified")[:batch_size])
+        if not hook_logs:
+            return False
+
+        service_definitions = _get_service_definitions(hook_logs)
+        session = get_hook_session()
+        pool = ThreadPool(min(health.get_concurrency(), len(service_definitions)))
+        try:
+            results = pool.map(lambda service_definition: service_definition.post(session),
+                               service_definitions)
+        finally:
+            pool.close()
+            pool.join()
+
+        status_codes = []
+        for service_definition, result in zip(service_definitions, results):
+            success, status_code, message = result
+            service_definition.save_log(status_code, message, success)
+            if service_definition.has_data:
+                status_codes.append(status_code)
+
+        closed = health.record(status_codes)
+    finally:
+        health.release()
+
+    # Keep draining, unless the circuit has just been opened or the probe failed
+    return closed and len(hook_logs) == batch_size
+
+
+def _get_service_definitions(hook_logs):
+    """
+    Prepares data of each log. JSON submissions of the same asset are
+    retrieved with one query.
+
+    :param hook_logs: list. HookLog objects
+    :return: list. ServiceDefinition objects
+    """
+    instances_ids_by_asset = defaultdict(set)
+    assets = {}
+    for hook_log in hook_logs:
+        if hook_log.hook.export_type == INSTANCE_FORMAT_TYPE_JSON:
+            asset = hook_log.hook.asset
+            assets[asset.pk] = asset
+            instances_ids_by_asset[asset.pk].add(hook_log.instance_id)
+
+    submissions_by_asset = {}
+    for asset_id, instances_ids in instances_ids_by_asset.items():
+        deployment = assets[asset_id].deployment
+        try:
+            submissions = deployment.get_submissions(
+                INSTANCE_FORMAT_TYPE_JSON, instances_ids=list(instances_ids))
+            submissions_by_asset[asset_id] = dict(
+                (submission.get(deployment.INSTANCE_ID_FIELDNAME), submission)
+                for submission in submissions
+            )
+        except Exception as e:
+            # Each submission is retrieved separately instead
+            logging.error("deliver_hook_logs - Asset #{} - {}".format(
+                assets[asset_id].uid, str(e)), exc_info=True)
+
+    service_definitions = []
+    for hook_log in hook_logs:
+        submission = submissions_by_asset.get(hook_log.hook.asset_id, {}).get(
+            hook_log.instance_id)
+        ServiceDefinition = hook_log.hook.get_service_definition()
+        service_definitions.append(
+            ServiceDefinition(hook_log.hook, hook_log.instance_id, submission))
+
+    return service_definitions
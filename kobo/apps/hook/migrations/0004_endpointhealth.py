@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hook', '0003_add_subset_fields_to_hook_model'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EndpointHealth',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('endpoint', models.CharField(unique=True, max_length=500)),
+                ('state', models.CharField(default=b'closed', max_length=10, choices=[(b'closed', b'closed'), (b'open', b'open')])),
+                ('success_count', models.PositiveIntegerField(default=0)),
+                ('failure_count', models.PositiveIntegerField(default=0)),
+                ('consecutive_failures', models.PositiveIntegerField(default=0)),
+                ('open_count', models.PositiveIntegerField(default=0)),
+                ('probe_failures', models.PositiveSmallIntegerField(default=0)),
+                ('concurrency', models.PositiveSmallIntegerField(null=True)),
+                ('retry_at', models.DateTimeField(null=True)),
+                ('date_modified', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def populate_hook_log_counts(apps, schema_editor):
+    HookLog = apps.get_model('hook', 'HookLog')
+    HookLogCount = apps.get_model('hook', 'HookLogCount')
+    totals = HookLog.objects.order_by().values('hook_id', 'status').annotate(
+        values_count=models.Count('pk'))
+    HookLogCount.objects.bulk_create(
+        HookLogCount(hook_id=total['hook_id'], status=total['status'],
+                     count=total['values_count'])
+        for total in totals.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hook', '0004_endpointhealth'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HookLogCount',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('status', models.PositiveSmallIntegerField(default=1)),
+                ('count', models.IntegerField(default=0)),
+                ('hook', models.ForeignKey(related_name='log_counts', to='hook.Hook')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='hooklogcount',
+            unique_together=set([('hook', 'status')]),
+        ),
+        migrations.RunPython(populate_hook_log_counts,
+                             migrations.RunPython.noop),
+    ]
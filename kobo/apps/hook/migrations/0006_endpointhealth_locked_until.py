@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hook', '0005_hooklogcount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='endpointhealth',
+            name='locked_until',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
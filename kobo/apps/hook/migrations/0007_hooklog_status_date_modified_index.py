@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hook', '0006_endpointhealth_locked_until'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='hooklog',
+            index_together=set([('status', 'date_modified')]),
+        ),
+    ]
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 
+from .endpoint_health import EndpointHealth
 from .hook import Hook
-from .hook_log import HookLog
\ No newline at end of file
+from .hook_log import HookLog
+from .hook_log_count import HookLogCount
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+
+class EndpointHealth(models.Model):
+    """
+    Circuit breaker of an external endpoint, shared by all hooks which send
+    data to it.
+
+    After `HOOK_CIRCUIT_BREAKER_THRESHOLD` consecutive failures, the circuit
+    opens: pending logs are left untouched (they do not use any tries)
+    until `retry_at`. Then one log is sent as a probe. If it fails, the circuit
+    stays open twice as long as before (up to `HOOK_CIRCUIT_BREAKER_MAX_SECONDS`).
+    If it succeeds, the circuit closes and the backlog is drained with one
+    request at a time first, twice as many after each successful round, up to
+    `HOOK_DELIVERY_CONCURRENCY`.
+    """
+
+    # States
+    CLOSED = "closed"
+    OPEN = "open"
+
+    # States list
+    STATE_CHOICES = (
+        (CLOSED, CLOSED),
+        (OPEN, OPEN)
+    )
+
+    endpoint = models.CharField(max_length=500, unique=True)
+    state = models.CharField(choices=STATE_CHOICES, default=CLOSED, max_length=10)
+    success_count = models.PositiveIntegerField(default=0)
+    failure_count = models.PositiveIntegerField(default=0)
+    consecutive_failures = models.PositiveIntegerField(default=0)
+    # Number of times the circuit opened
+    open_count = models.PositiveIntegerField(default=0)
+    # Number of failed probes since the circuit opened
+    probe_failures = models.PositiveSmallIntegerField(default=0)
+    # Number of simultaneous requests while draining the backlog.
+    # `None` means `HOOK_DELIVERY_CONCURRENCY`
+    concurrency = models.PositiveSmallIntegerField(null=True)
+    retry_at = models.DateTimeField(null=True)
+    # Set while a process delivers to this endpoint; see `acquire()`
+    locked_until = models.DateTimeField(null=True)
+    date_modified = models.DateTimeField(default=timezone.now)
+
+    def __unicode__(self):
+        return u"%s - %s" % (self.endpoint, self.state)
+
+    def acquire(self, seconds):
+        """
+        Takes ownership of deliveries to the endpoint for `seconds` at most,
+        unless another process already has it. The conditional update is
+        atomic, so only one process among those sharing the database succeeds.
+
+        :param seconds: int.
+        :return: bool. Whether ownership was taken
+        """
+        now = timezone.now()
+        locked_until = now + timedelta(seconds=seconds)
+        acquired = type(self).objects.filter(
+            Q(locked_until__isnull=True) | Q(locked_until__lte=now),
+            pk=self.pk,
+        ).update(locked_until=locked_until)
+        if acquired:
+            self.refresh_from_db()
+        return acquired > 0
+
+    def release(self):
+        type(self).objects.filter(
+            pk=self.pk, locked_until=self.locked_until
+        ).update(locked_until=None)
+        self.locked_until = None
+
+    @staticmethod
+    def is_failure(status_code):
+        """
+        Whether a response means the endpoint is unhealthy. Other client
+        errors (e.g. 400) are caused by the data, not by the endpoint.
+
+        :param status_code: int. `None` if no response was received
+        :return: bool
+        """
+        return status_code is None or status_code >= 500 or status_code == 429
+
+    @property
+    def is_parked(self):
+        return self.state == self.OPEN and self.retry_at > timezone.now()
+
+    @property
+    def is_probing(self):
+        return self.state == self.OPEN and not self.is_parked
+
+    def get_batch_size(self):
+        """
+        Returns the number of logs that can be sent at once
+
+        :return: int
+        """
+        if self.is_parked:
+            return 0
+        if self.is_probing:
+            return 1
+        return self.concurrency or settings.HOOK_DELIVERY_BATCH_SIZE
+
+    def get_concurrency(self):
+        """
+        Returns the number of simultaneous requests allowed
+
+        :return: int
+        """
+        if self.state == self.OPEN:
+            return 1
+        return self.concurrency or settings.HOOK_DELIVERY_CONCURRENCY
+
+    def record(self, status_codes):
+        """
+        Updates counters and state with the responses of a batch, and saves.
+        The row is reloaded and locked first, so that no concurrent change is
+        overwritten.
+
+        :param status_codes: list. Status codes, in the order requests were sent
+        :return: bool. Whether the circuit is closed
+        """
+        with transaction.atomic():
+            saved = type(self).objects.select_for_update().get(pk=self.pk)
+            for field in self._meta.concrete_fields:
+                setattr(self, field.attname, getattr(saved, field.attname))
+            self._record(status_codes)
+            self.save()
+        return self.state == self.CLOSED
+
+    def _record(self, status_codes):
+        failures = 0
+        for status_code in status_codes:
+            if self.is_failure(status_code):
+                failures += 1
+                self.failure_count += 1
+                self.consecutive_failures += 1
+            else:
+                self.success_count += 1
+                self.consecutive_failures = 0
+
+        if self.state == self.OPEN:
+            if failures < len(status_codes):
+                # Probe succeeded, drain the backlog slowly
+                self.state = self.CLOSED
+                self.probe_failures = 0
+                self.concurrency = 1
+                self.retry_at = None
+            elif failures:
+                self.probe_failures += 1
+                self.retry_at = timezone.now() + self._get_open_duration()
+        elif self.consecutive_failures >= settings.HOOK_CIRCUIT_BREAKER_THRESHOLD:
+            self.state = self.OPEN
+            self.open_count += 1
+            self.probe_failures = 0
+            self.concurrency = None
+            self.retry_at = timezone.now() + self._get_open_duration()
+        elif self.concurrency and not failures:
+            self.concurrency *= 2
+            if self.concurrency >= settings.HOOK_DELIVERY_CONCURRENCY:
+                self.concurrency = None
+
+        self.date_modified = timezone.now()
+
+    def _get_open_duration(self):
+        seconds = min(
+            settings.HOOK_CIRCUIT_BREAKER_MIN_SECONDS * 2 ** self.probe_failures,
+            settings.HOOK_CIRCUIT_BREAKER_MAX_SECONDS)
+        return timedelta(seconds=seconds)
@@ -86,19 +86,18 @@ class Hook(models.Model):
         return self.__totals.get(HOOK_LOG_PENDING)
 
     def _get_totals(self):
-        # TODO add some cache
-        queryset = self.logs.values("status").annotate(values_count=models.Count("status"))
-        queryset.query.clear_ordering(True)
-
+        # Counts are maintained by `HookLogCount`, instead of counting logs.
+        # `all()` uses `prefetch_related("log_counts")` if any.
         # Initialize totals
         self.__totals = {
             HOOK_LOG_SUCCESS: 0,
             HOOK_LOG_FAILED: 0,
             HOOK_LOG_PENDING: 0
         }
-        for record in queryset:
-            self.__totals[record.get("status")] = record.get("values_count")
+        for log_count in self.log_counts.all():
+            self.__totals[log_count.status] = log_count.count
 
     def reset_totals(self):
-        # TODO remove cache when it's enabled
-        self.__totals = {}
\ No newline at end of file
+        self.__totals = {}
+        # Drop `prefetch_related("log_counts")` results, if any
+        getattr(self, "_prefetched_objects_cache", {}).pop("log_counts", None)
\ No newline at end of file
@@ -3,7 +3,7 @@ from datetime import datetime, timedelta
 from importlib import import_module
 
 import constance
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django.utils.translation import ugettext as _
 from jsonbfield.fields import JSONField as JSONBField
@@ -12,6 +12,7 @@ from rest_framework import status
 from rest_framework.reverse import reverse
 
 from ..constants import HOOK_LOG_PENDING, HOOK_LOG_FAILED, HOOK_LOG_SUCCESS, KOBO_INTERNAL_ERROR_STATUS_CODE
+from .hook_log_count import HookLogCount
 from kpi.fields import KpiUidField
 from kpi.utils.log import logging
 
@@ -30,6 +31,13 @@ class HookLog(models.Model):
 
     class Meta:
         ordering = ["-date_created"]
+        # Pending logs which are ready to be sent; see `delivery.get_due_filter()`
+        index_together = [("status", "date_modified")]
+
+    def __init__(self, *args, **kwargs):
+        super(HookLog, self).__init__(*args, **kwargs)
+        # Status saved in DB, to keep `HookLogCount` up to date
+        self.__saved_status = self.status if self.pk else None
 
     def can_retry(self):
         """
@@ -105,8 +113,14 @@ class HookLog(models.Model):
         # We don't want to alter tries when we only change the status
         if kwargs.pop("reset_status", False) is False:
             self.tries += 1
-            self.hook.reset_totals()
-        super(HookLog, self).save(*args, **kwargs)
+        with transaction.atomic():
+            super(HookLog, self).save(*args, **kwargs)
+            if self.status != self.__saved_status:
+                if self.__saved_status is not None:
+                    HookLogCount.increment(self.hook_id, self.__saved_status, -1)
+                HookLogCount.increment(self.hook_id, self.status)
+                self.hook.reset_totals()
+        self.__saved_status = self.status
 
     @property
     def status_str(self):
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+
+from ..constants import HOOK_LOG_PENDING
+
+
+class HookLogCount(models.Model):
+    """
+    Number of logs of a hook with a given status.
+    Kept up to date by `HookLog.save()` and `HookUtils.call_services_bulk()`,
+    in the same transaction as the logs.
+    The command `reconcile_hook_log_counts` recalculates them from the logs.
+    """
+
+    hook = models.ForeignKey("Hook", related_name="log_counts", on_delete=models.CASCADE)
+    status = models.PositiveSmallIntegerField(default=HOOK_LOG_PENDING)
+    # Not positive, so that a drift never blocks saving logs
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("hook", "status")
+
+    @classmethod
+    def increment(cls, hook_id, status, delta=1):
+        """
+        Adds `delta` (which can be negative) to the number of logs of `hook_id`
+        with `status`
+
+        :param hook_id: int. Hook PK
+        :param status: int.
+        :param delta: int.
+        """
+        if cls.objects.filter(hook_id=hook_id, status=status).update(
+                count=F("count") + delta):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(hook_id=hook_id, status=status, count=delta)
+        except IntegrityError:
+            # Created by someone else in the meantime
+            cls.objects.filter(hook_id=hook_id, status=status).update(
+                count=F("count") + delta)
+
+    @classmethod
+    def reconcile(cls, hook_ids=None):
+        """
+        Recalculates counts from the logs
+
+        :param hook_ids: list. Optional. Hooks PKs. All hooks if `None`
+        :return: int. Number of counts which were wrong
+        """
+        # Avoid circular import
+        from .hook import Hook
+        from .hook_log import HookLog
+
+        hooks = Hook.objects.all()
+        if hook_ids is not None:
+            hooks = hooks.filter(pk__in=hook_ids)
+        logs = HookLog.objects.filter(hook__in=hooks).order_by()
+
+        fixed = 0
+        with transaction.atomic():
+            # Logs saved meanwhile wait until counts are fixed
+            stored_counts = list(cls.objects.select_for_update().filter(hook__in=hooks))
+            actual_counts = dict(
+                ((record["hook_id"], record["status"]), record["values_count"])
+                for record in logs.values("hook_id", "status").annotate(
+                    values_count=models.Count("pk"))
+            )
+            for log_count in stored_counts:
+                count = actual_counts.pop((log_count.hook_id, log_count.status), 0)
+                if log_count.count != count:
+                    log_count.count = count
+                    log_count.save(update_fields=["count"])
+                    fixed += 1
+            for (hook_id, status), count in actual_counts.items():
+                cls.objects.create(hook_id=hook_id, status=status, count=count)
+                fixed += 1
+
+        return fixed
@@ -7,6 +7,7 @@ import os
 import re
 
 import constance
+from django.conf import settings
 import requests
 from rest_framework import status
 
@@ -20,17 +21,28 @@ class ServiceDefinitionInterface(object):
 
     __metaclass__ = ABCMeta
 
-    def __init__(self, hook, instance_id):
+    def __init__(self, hook, instance_id, submission=None):
+        """
+        :param hook: Hook.
+        :param instance_id: int. Instance primary key
+        :param submission: json|xml. Optional. Already retrieved submission
+        """
         self._hook = hook
         self._instance_id = instance_id
-        self._data = self._get_data()
+        self._data = self._get_data(submission)
+
+    @property
+    def has_data(self):
+        return bool(self._data)
 
-    def _get_data(self):
+    def _get_data(self, submission=None):
         """
-        Retrieves data from deployment backend of the asset.
+        Retrieves data from deployment backend of the asset, unless
+        `submission` is provided.
         """
         try:
-            submission = self._hook.asset.deployment.get_submission(self._instance_id, self._hook.export_type)
+            if submission is None:
+                submission = self._hook.asset.deployment.get_submission(self._instance_id, self._hook.export_type)
             return self._parse_data(submission, self._hook.subset_fields)
         except Exception as e:
             logging.error("service_json.ServiceDefinition._get_data - Hook #{} - Data #{} - {}".format(
@@ -64,13 +76,27 @@ class ServiceDefinitionInterface(object):
         """
         pass
 
-    def send(self):
+    def send(self, session=None):
         """
-        Sends data to external endpoint
+        Sends data to external endpoint and saves the result in the log
+        :param session: requests.Session. Optional
         :return: bool
         """
+        success, status_code, message = self.post(session)
+        self.save_log(status_code, message, success)
+        return success
+
+    def post(self, session=None):
+        """
+        Sends data to external endpoint without saving anything, so it can be
+        called outside of the main thread.
+
+        :param session: requests.Session. Optional. Reuses its connections
+        :return: tuple. (success, status_code, message)
+        """
 
         success = False
+        status_code = KOBO_INTERNAL_ERROR_STATUS_CODE
         response = None  # Need to declare response before requests.post assignment in case of RequestException
         if self._data:
             try:
@@ -95,32 +121,28 @@ class ServiceDefinitionInterface(object):
                         "auth": (self._hook.settings.get("username"),
                                  self._hook.settings.get("password"))
                     })
-                response = requests.post(self._hook.endpoint, timeout=30, **request_kwargs)
+                response = (session or requests).post(
+                    self._hook.endpoint, timeout=settings.HOOK_DELIVERY_TIMEOUT, **request_kwargs)
                 response.raise_for_status()
-                self.save_log(response.status_code, response.text, True)
+                status_code = response.status_code
+                message = response.text
                 success = True
             except requests.exceptions.RequestException as e:
                 # If request fails to communicate with remote server. Exception is raised before
                 # request.post can return something. Thus, response equals None
-                status_code = KOBO_INTERNAL_ERROR_STATUS_CODE
-                text = str(e)
+                message = str(e)
                 if response is not None:
-                    text = response.text
+                    message = response.text
                     status_code = response.status_code
-                self.save_log(status_code, text)
 
             except Exception as e:
                 logging.error("service_json.ServiceDefinition.send - Hook #{} - Data #{} - {}".format(
                     self._hook.uid, self._instance_id, str(e)), exc_info=True)
-                self.save_log(
-                    KOBO_INTERNAL_ERROR_STATUS_CODE,
-                    "An error occurred when sending data to external endpoint")
+                message = "An error occurred when sending data to external endpoint"
         else:
-            self.save_log(
-                KOBO_INTERNAL_ERROR_STATUS_CODE,
-                "No data available")
+            message = "No data available"
 
-        return success
+        return success, status_code, message
 
     def save_log(self, status_code, message, success=False):
         """
@@ -6,21 +6,56 @@ from django.utils.translation import ugettext as _
 from rest_framework import serializers
 from rest_framework.reverse import reverse
 
+from ..models.endpoint_health import EndpointHealth
 from ..models.hook import Hook
 
 
+class HookListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        """
+        Retrieves the health of all endpoints at once, instead of one query per hook
+        """
+        hooks = list(data.all() if hasattr(data, "all") else data)
+        health_by_endpoint = dict(
+            (health.endpoint, health) for health in
+            EndpointHealth.objects.filter(endpoint__in=set(hook.endpoint for hook in hooks))
+        )
+        for hook in hooks:
+            hook.prefetched_endpoint_health = health_by_endpoint.get(hook.endpoint)
+        return super(HookListSerializer, self).to_representation(hooks)
+
+
 class HookSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Hook
+        list_serializer_class = HookListSerializer
         fields = ("url", "logs_url", "asset", "uid", "name", "endpoint", "active", "export_type",
                   "auth_level", "success_count", "failed_count", "pending_count", "settings",
-                  "date_modified", "email_notification", "subset_fields")
+                  "date_modified", "email_notification", "subset_fields", "endpoint_health")
 
         read_only_fields = ("asset", "uid", "date_modified", "success_count", "failed_count", "pending_count")
 
     url = serializers.SerializerMethodField()
     logs_url = serializers.SerializerMethodField()
+    endpoint_health = serializers.SerializerMethodField()
+
+    def get_endpoint_health(self, hook):
+        if hasattr(hook, "prefetched_endpoint_health"):
+            health = hook.prefetched_endpoint_health
+        else:
+            health = EndpointHealth.objects.filter(endpoint=hook.endpoint).first()
+        if health is None:
+            health = EndpointHealth(endpoint=hook.endpoint)
+        return {
+            "state": health.state,
+            "success_count": health.success_count,
+            "failure_count": health.failure_count,
+            "consecutive_failures": health.consecutive_failures,
+            "open_count": health.open_count,
+            "retry_at": health.retry_at,
+        }
 
     def get_url(self, hook):
         return reverse("hook-detail", args=(hook.asset.uid, hook.uid),
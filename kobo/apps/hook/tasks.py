@@ -1,46 +1,89 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 
+from collections import OrderedDict
+import hashlib
+from itertools import groupby
+from operator import itemgetter
 import time
 
 from celery import shared_task
 import constance
 from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.mail import EmailMessage, EmailMultiAlternatives, get_connection
+from django.db.models import Count
 from django.template import Context
 from django.template.loader import get_template
 from django.utils import translation, timezone
 from django_celery_beat.models import PeriodicTask
 
+from . import delivery
 from .constants import HOOK_LOG_FAILED
 from .models import Hook, HookLog
 from kpi.utils.log import logging
 
+DELIVERY_RETRY_CACHE_KEY = "hook-delivery-retry-{}"
 
-@shared_task(bind=True)
-def service_definition_task(self, hook_id, instance_id):
+
+@shared_task
+def service_definition_task(hook_id, instance_id):
+    """
+    Kept for tasks queued before deliveries were batched.
+    Makes sure the log exists and lets `deliver_hook_logs` send it.
+
+    :param hook_id: int. Hook PK
+    :param instance_id: int. Instance PK
+    """
+    hook = Hook.objects.get(id=hook_id)
+    if not HookLog.objects.filter(hook=hook, instance_id=instance_id).exists():
+        HookLog(hook=hook, instance_id=instance_id).save(reset_status=True)
+    deliver_hook_logs.delay(hook.endpoint)
+
+    return True
+
+
+@shared_task
+def deliver_hook_logs(endpoint):
     """
-    Tries to send data to the endpoint of the hook
-    It retries n times (n = `constance.config.HOOK_MAX_RETRIES`)
+    Sends pending logs of `endpoint` which are ready to be sent.
+    Queues itself again until there are none left.
+    Failed logs are retried n times (n = `constance.config.HOOK_MAX_RETRIES`)
+    by `deliver_pending_hook_logs`
 
     - after 1 minutes,
     - after 10 minutes,
     - after 100 minutes
     etc ...
 
-    :param self: Celery.Task.
-    :param hook_id: int. Hook PK
-    :param instance_id: int. Instance PK
+    :param endpoint: str.
     """
-    hook = Hook.objects.get(id=hook_id)
-    # Use camelcase (even if it's not PEP-8 compliant)
-    # because variable represents the class, not the instance.
-    ServiceDefinition = hook.get_service_definition()
-    service_definition = ServiceDefinition(hook, instance_id)
-    if not service_definition.send():
-        # Countdown is in seconds
-        countdown = HookLog.get_remaining_seconds(self.request.retries)
-        raise self.retry(countdown=countdown, max_retries=constance.config.HOOK_MAX_RETRIES)
+    try:
+        if delivery.deliver_hook_logs(endpoint):
+            deliver_hook_logs.delay(endpoint)
+    except delivery.DeliveryInProgress:
+        # Logs created during the current batch are sent shortly after it,
+        # instead of waiting for `deliver_pending_hook_logs`.
+        # One retry per endpoint at a time (per process) is enough.
+        countdown = settings.HOOK_DELIVERY_BUSY_COUNTDOWN
+        retry_key = DELIVERY_RETRY_CACHE_KEY.format(
+            hashlib.md5(endpoint.encode("utf-8")).hexdigest())
+        if cache.add(retry_key, True, countdown):
+            deliver_hook_logs.apply_async(args=(endpoint,), countdown=countdown)
+        return False
+
+    return True
+
+
+@shared_task
+def deliver_pending_hook_logs():
+    """
+    Queues the delivery of every endpoint which has logs ready to be sent
+    (e.g. logs to retry).
+    """
+    for endpoint in delivery.get_due_endpoints():
+        deliver_hook_logs.delay(endpoint)
 
     return True
 
@@ -62,6 +105,9 @@ def retry_all_task(hooklogs_ids):
 def failures_reports():
     """
     Notifies owners' assets by email of hooks failures.
+    Logs are read in chunks of owners, `HOOK_FAILURES_REPORTS_CHUNK_SIZE` logs
+    at most (unless one owner has more), and each email is sent as soon as
+    it is ready.
     :return: bool
     """
     beat_schedule = settings.CELERY_BEAT_SCHEDULE.get("send-hooks-failures-reports")
@@ -69,13 +115,14 @@ def failures_reports():
     failures_reports_period_task = PeriodicTask.objects.filter(enabled=True, task=beat_schedule.get("task"))\
         .order_by("-last_run_at").first()
 
+    success = True
     if failures_reports_period_task:
-        
+
         last_run_at = failures_reports_period_task.last_run_at
-        queryset = HookLog.objects.filter(hook__email_notification=True, status=HOOK_LOG_FAILED)
+        queryset = HookLog.objects.filter(hook__email_notification=True,
+                                          status=HOOK_LOG_FAILED)
         if last_run_at:
             queryset = queryset.filter(date_modified__gte=last_run_at)
-        queryset = queryset.order_by("hook__asset__name", "hook__uid", "-date_modified")
 
         # PeriodicTask are updated every 3 minutes (default).
         # It means, if this task interval is less than 3 minutes, some data can be duplicated in emails.
@@ -84,74 +131,124 @@ def failures_reports():
         # see: http://docs.celeryproject.org/en/latest/userguide/configuration.html#beat-sync-every
         PeriodicTask.objects.filter(task=beat_schedule.get("task")).update(last_run_at=timezone.now())
 
-        records = {}
-        max_length = 0
-
-        # Prepare data for templates.
-        # All logs will be grouped under their respective asset and user.
-        for record in queryset:
-            # if users don't exist in dict, add them
-            if record.hook.asset.owner.id not in records:
-                records[record.hook.asset.owner.id] = {
-                    "username": record.hook.asset.owner.username,
-                    # language is not implemented yet.
-                    # TODO add language to user table in registration process
-                    "language": getattr(record.hook.asset.owner, "language", "en"),
-                    "email": record.hook.asset.owner.email,
-                    "assets": {}
-                }
-
-            # if asset doesn't exist in user's asset dict, add it
-            if record.hook.asset.id not in records[record.hook.asset.owner.id]["assets"]:
-                max_length = 0
-                records[record.hook.asset.owner.id]["assets"][record.hook.asset.id] = {
-                    "name": record.hook.asset.name,
-                    "max_length": 0,
-                    "logs": []
-                }
-
-            # Add log to corresponding asset and user
-            records[record.hook.asset.owner.id]["assets"][record.hook.asset.id]["logs"].append({
-                "hook_name": record.hook.name,
-                "uid": record.uid,
-                "date_modified": record.date_modified,
-                "status_code": record.status_code,
-                "message": record.message
-            })
-            hook_name_length = len(record.hook.name)
-
-            # Max Length is used for plain text template. To display fixed size columns.
-            max_length = max(max_length, hook_name_length)
-            records[record.hook.asset.owner.id]["assets"][record.hook.asset.id]["max_length"] = max_length
-
         # Get templates
         plain_text_template = get_template("reports/failures_email_body.txt")
         html_template = get_template("reports/failures_email_body.html")
-        email_messages = []
 
-        for owner_id, record in records.items():
-            variables = {
-                "username": record.get("username"),
-                "assets": record.get("assets")
+        support_email = constance.config.SUPPORT_EMAIL
+
+        try:
+            with get_connection() as connection:
+                for owner, logs in _get_failures_by_owner(queryset):
+                    record = _get_failures_record(owner, logs)
+                    variables = {
+                        "username": record.get("username"),
+                        "assets": record.get("assets")
+                    }
+                    # Localize templates
+                    translation.activate(record.get("language"))
+                    text_content = plain_text_template.render(Context(variables))
+                    html_content = html_template.render(Context(variables))
+
+                    msg = EmailMultiAlternatives(translation.ugettext("REST Services Failure Report"), text_content,
+                                                 support_email,
+                                                 [record.get("email")])
+                    msg.attach_alternative(html_content, "text/html")
+                    # Send email message. A failure does not prevent other owners from being notified
+                    try:
+                        connection.send_messages([msg])
+                    except Exception as e:
+                        logging.error("failures_reports - {} - {}".format(
+                            record.get("username"), str(e)), exc_info=True)
+                        success = False
+        except Exception as e:
+            logging.error("failures_reports - {}".format(str(e)), exc_info=True)
+            return False
+
+    return success
+
+
+def _get_failures_by_owner(queryset):
+    """
+    Yields failed logs of `queryset` grouped by owner of their asset.
+    Owners are processed in chunks of `HOOK_FAILURES_REPORTS_CHUNK_SIZE` logs,
+    with two queries per chunk.
+
+    :param queryset: QuerySet. HookLog objects
+    :return: generator. (dict, list) tuples, i.e. owner's `id`, `username`
+        and `email`, and owner's logs, sorted by asset, hook and date
+    """
+    totals = queryset.order_by("hook__asset__owner_id")\
+        .values("hook__asset__owner_id")\
+        .annotate(logs_count=Count("pk"))
+
+    chunk = []
+    chunk_logs_count = 0
+    for total in totals.iterator():
+        if chunk and chunk_logs_count + total["logs_count"] > settings.HOOK_FAILURES_REPORTS_CHUNK_SIZE:
+            for owner_logs in _get_failures_of_owners(queryset, chunk):
+                yield owner_logs
+            chunk = []
+            chunk_logs_count = 0
+        chunk.append(total["hook__asset__owner_id"])
+        chunk_logs_count += total["logs_count"]
+
+    if chunk:
+        for owner_logs in _get_failures_of_owners(queryset, chunk):
+            yield owner_logs
+
+
+def _get_failures_of_owners(queryset, owner_ids):
+    owners = dict(
+        (owner["id"], owner) for owner in
+        User.objects.filter(pk__in=owner_ids).values("id", "username", "email")
+    )
+    logs = queryset.filter(hook__asset__owner_id__in=owner_ids)\
+        .order_by("hook__asset__owner_id", "hook__asset__name", "hook__asset_id",
+                  "hook__uid", "-date_modified")\
+        .values("hook__asset__owner_id", "hook__asset_id", "hook__asset__name",
+                "hook__name", "uid", "date_modified", "status_code", "message")
+    for owner_id, owner_logs in groupby(logs.iterator(), itemgetter("hook__asset__owner_id")):
+        yield owners[owner_id], owner_logs
+
+
+def _get_failures_record(owner, logs):
+    """
+    Prepares data for templates.
+    All logs are grouped under their respective asset.
+
+    :param owner: dict.
+    :param logs: iterable. Logs of `owner`
+    :return: dict
+    """
+    record = {
+        "username": owner.get("username"),
+        # language is not implemented yet.
+        # TODO add language to user table in registration process
+        "language": "en",
+        "email": owner.get("email"),
+        "assets": OrderedDict()
+    }
+    for log in logs:
+        asset_id = log.get("hook__asset_id")
+        # if asset doesn't exist in user's asset dict, add it
+        if asset_id not in record["assets"]:
+            record["assets"][asset_id] = {
+                "name": log.get("hook__asset__name"),
+                "max_length": 0,
+                "logs": []
             }
-            # Localize templates
-            translation.activate(record.get("language"))
-            text_content = plain_text_template.render(Context(variables))
-            html_content = html_template.render(Context(variables))
-
-            msg = EmailMultiAlternatives(translation.ugettext("REST Services Failure Report"), text_content,
-                                         constance.config.SUPPORT_EMAIL,
-                                         [record.get("email")])
-            msg.attach_alternative(html_content, "text/html")
-            email_messages.append(msg)
-
-        # Send email messages
-        if len(email_messages) > 0:
-            try:
-                with get_connection() as connection:
-                    connection.send_messages(email_messages)
-            except Exception as e:
-                logging.error("failures_reports - {}".format(str(e)), exc_info=True)
-                return False
 
-    return True
+        asset = record["assets"][asset_id]
+        # Add log to corresponding asset
+        asset["logs"].append({
+            "hook_name": log.get("hook__name"),
+            "uid": log.get("uid"),
+            "date_modified": log.get("date_modified"),
+            "status_code": log.get("status_code"),
+            "message": log.get("message")
+        })
+        # Max Length is used for plain text template. To display fixed size columns.
+        asset["max_length"] = max(asset["max_length"], len(log.get("hook__name")))
+
+    return record
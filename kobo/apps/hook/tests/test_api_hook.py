@@ -4,12 +4,14 @@ from __future__ import absolute_import
 import json
 
 import constance
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
 import requests
 import responses
 from rest_framework import status
 
 from .hook_test_case import HookTestCase
+from ..models import HookLogCount
 from kpi.constants import INSTANCE_FORMAT_TYPE_JSON
 
 
@@ -78,6 +80,76 @@ class ApiHookTestCase(HookTestCase):
         response = self.client.post(hook_signal_url, data=data, format='json')
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    @responses.activate
+    def test_bulk_data_submission(self):
+        hook = self._create_hook(name="dummy external service",
+                                 endpoint="http://dummy.service.local/",
+                                 settings={})
+        responses.add(responses.POST, hook.endpoint,
+                      status=status.HTTP_200_OK,
+                      content_type="application/json")
+        submissions = self.asset.deployment.get_submissions()
+        for instance_id in (2, 3):
+            submissions.append(dict(submissions[0], id=instance_id))
+        self.asset.deployment.mock_submissions(submissions)
+        hook_signal_url = reverse("hook-signal-bulk", kwargs={"parent_lookup_asset": self.asset.uid})
+
+        data = {"instance_ids": [1, 2, 2, 4]}  # Instance #4 doesn't belong to `self.asset`
+        response = self.client.post(hook_signal_url, data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data.get("accepted"), [1, 2])
+        self.assertEqual(response.data.get("already_submitted"), [])
+        self.assertEqual(response.data.get("not_found"), [4])
+
+        data = {"instance_ids": [1, 2, 3]}
+        response = self.client.post(hook_signal_url, data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data.get("accepted"), [3])
+        self.assertEqual(response.data.get("already_submitted"), [1, 2])
+        self.assertEqual(hook.logs.count(), 3)
+        self.assertEqual(len(responses.calls), 3)
+
+        response = self.client.post(hook_signal_url, data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        data = {"instance_ids": [4]}
+        response = self.client.post(hook_signal_url, data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        data = {"instance_ids": "1"}
+        response = self.client.post(hook_signal_url, data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @responses.activate
+    def test_log_counts(self):
+        hook = self._create_hook(name="dummy external service",
+                                 endpoint="http://dummy.service.local/",
+                                 settings={})
+        responses.add(responses.POST, hook.endpoint,
+                      status=status.HTTP_200_OK,
+                      content_type="application/json")
+        hook_signal_url = reverse("hook-signal-list", kwargs={"parent_lookup_asset": self.asset.uid})
+        submissions = self.asset.deployment.get_submissions()
+        data = {"instance_id": submissions[0].get("id")}
+        response = self.client.post(hook_signal_url, data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        detail_url = reverse("hook-detail", kwargs={
+            "parent_lookup_asset": self.asset.uid,
+            "uid": hook.uid,
+        })
+        response = self.client.get(detail_url)
+        self.assertEqual(response.data.get("success_count"), 1)
+        self.assertEqual(response.data.get("pending_count"), 0)
+        self.assertEqual(response.data.get("failed_count"), 0)
+
+        # Counts which drifted are fixed from the logs
+        HookLogCount.objects.filter(hook=hook).update(count=10)
+        call_command("reconcile_hook_log_counts", verbosity=0)
+        response = self.client.get(detail_url)
+        self.assertEqual(response.data.get("success_count"), 1)
+        self.assertEqual(response.data.get("pending_count"), 0)
+
     def test_non_owner_cannot_access(self):
         hook = self._create_hook()
         self.client.logout()
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+from datetime import timedelta
+
+from django.core.urlresolvers import reverse
+from django.test.utils import override_settings
+from django.utils import timezone
+import mock
+import responses
+from rest_framework import status
+
+from .hook_test_case import HookTestCase
+from ..constants import HOOK_LOG_PENDING, HOOK_LOG_SUCCESS
+from ..delivery import DeliveryInProgress, deliver_hook_logs, get_due_endpoints
+from ..models import EndpointHealth, HookLog
+from ..utils import HookUtils
+from kpi.deployment_backends.mock_backend import MockDeploymentBackend
+
+
+class HookDeliveryTestCase(HookTestCase):
+
+    @responses.activate
+    def test_deliver_logs_in_batch(self):
+        hook = self._create_hook()
+        other_hook = self._create_hook(name="other external service")
+        responses.add(responses.POST, hook.endpoint,
+                      status=status.HTTP_200_OK,
+                      content_type="application/json")
+        instances_ids = [submission.get("id") for submission
+                         in self.asset.deployment.get_submissions()]
+
+        # Pending logs are created for each hook without sending anything yet
+        with mock.patch("kobo.apps.hook.utils.deliver_hook_logs.delay") as delay:
+            for instance_id in instances_ids:
+                self.assertTrue(HookUtils.call_services(self.asset, instance_id))
+        delay.assert_called_with(hook.endpoint)
+        self.assertEqual(HookLog.objects.filter(status=HOOK_LOG_PENDING, tries=0).count(),
+                         len(instances_ids) * 2)
+        # Instances already have a log
+        self.assertFalse(HookUtils.call_services(self.asset, instances_ids[0]))
+
+        # Both hooks share the same endpoint: submissions are retrieved at once
+        with mock.patch.object(MockDeploymentBackend, "get_submissions",
+                               wraps=self.asset.deployment.get_submissions) as get_submissions, \
+                mock.patch.object(MockDeploymentBackend, "get_submission") as get_submission:
+            self.assertFalse(deliver_hook_logs(hook.endpoint))
+        self.assertEqual(get_submissions.call_count, 1)
+        self.assertFalse(get_submission.called)
+
+        self.assertEqual(len(responses.calls), len(instances_ids) * 2)
+        for hook_log in HookLog.objects.filter(hook__in=[hook, other_hook]):
+            self.assertEqual(hook_log.status, HOOK_LOG_SUCCESS)
+            self.assertEqual(hook_log.tries, 1)
+
+    @responses.activate
+    def test_retry_when_due(self):
+        hook = self._create_hook()
+        responses.add(responses.POST, hook.endpoint,
+                      status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        instance_id = self.asset.deployment.get_submissions()[0].get("id")
+        self.assertTrue(HookUtils.call_services(self.asset, instance_id))
+        hook_log = HookLog.objects.get(hook=hook, instance_id=instance_id)
+        self.assertEqual(hook_log.status, HOOK_LOG_PENDING)
+        self.assertEqual(hook_log.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertEqual(hook_log.tries, 1)
+
+        # Too early to retry
+        deliver_hook_logs(hook.endpoint)
+        self.assertEqual(len(responses.calls), 1)
+
+        HookLog.objects.filter(pk=hook_log.pk).update(
+            date_modified=timezone.now() - timedelta(
+                seconds=HookLog.get_remaining_seconds(0)))
+        deliver_hook_logs(hook.endpoint)
+        self.assertEqual(len(responses.calls), 2)
+        self.assertEqual(HookLog.objects.get(pk=hook_log.pk).tries, 2)
+
+    @responses.activate
+    def test_one_delivery_per_endpoint(self):
+        hook = self._create_hook()
+        responses.add(responses.POST, hook.endpoint,
+                      status=status.HTTP_200_OK,
+                      content_type="application/json")
+        instance_id = self.asset.deployment.get_submissions()[0].get("id")
+        HookLog(hook=hook, instance_id=instance_id).save(reset_status=True)
+
+        # Another process owns deliveries to this endpoint
+        health = EndpointHealth.objects.create(endpoint=hook.endpoint)
+        self.assertTrue(health.acquire(60))
+        with self.assertRaises(DeliveryInProgress):
+            deliver_hook_logs(hook.endpoint)
+        self.assertEqual(len(responses.calls), 0)
+
+        health.release()
+        deliver_hook_logs(hook.endpoint)
+        self.assertEqual(len(responses.calls), 1)
+        self.assertIsNone(EndpointHealth.objects.get(pk=health.pk).locked_until)
+
+    @responses.activate
+    @override_settings(HOOK_CIRCUIT_BREAKER_THRESHOLD=2)
+    def test_circuit_breaker(self):
+        hook = self._create_hook()
+        submissions = self.asset.deployment.get_submissions()
+        for instance_id in range(2, 6):
+            submissions.append(dict(submissions[0], id=instance_id))
+        self.asset.deployment.mock_submissions(submissions)
+        for submission in submissions:
+            HookLog(hook=hook, instance_id=submission.get("id")).save(reset_status=True)
+
+        responses.add(responses.POST, hook.endpoint,
+                      status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertFalse(deliver_hook_logs(hook.endpoint))
+        self.assertEqual(len(responses.calls), 5)
+        health = EndpointHealth.objects.get(endpoint=hook.endpoint)
+        self.assertEqual(health.state, EndpointHealth.OPEN)
+
+        # Logs are parked while the circuit is open
+        HookLog.objects.filter(hook=hook).update(
+            date_modified=timezone.now() - timedelta(
+                seconds=HookLog.get_remaining_seconds(0)))
+        self.assertEqual(get_due_endpoints(), [])
+        self.assertFalse(deliver_hook_logs(hook.endpoint))
+        self.assertEqual(len(responses.calls), 5)
+
+        # One probe first, then the backlog is drained more and more quickly
+        EndpointHealth.objects.filter(pk=health.pk).update(retry_at=timezone.now())
+        responses.reset()
+        responses.add(responses.POST, hook.endpoint,
+                      status=status.HTTP_200_OK,
+                      content_type="application/json")
+        self.assertTrue(deliver_hook_logs(hook.endpoint))
+        self.assertEqual(len(responses.calls), 1)
+        self.assertTrue(deliver_hook_logs(hook.endpoint))
+        self.assertEqual(len(responses.calls), 2)
+        self.assertTrue(deliver_hook_logs(hook.endpoint))
+        self.assertEqual(len(responses.calls), 4)
+        self.assertFalse(deliver_hook_logs(hook.endpoint))
+        self.assertEqual(len(responses.calls), 5)
+        self.assertEqual(HookLog.objects.filter(hook=hook, status=HOOK_LOG_SUCCESS).count(), 5)
+
+        url = reverse("hook-detail", kwargs={
+            "parent_lookup_asset": self.asset.uid,
+            "uid": hook.uid,
+        })
+        endpoint_health = self.client.get(url).data.get("endpoint_health")
+        self.assertEqual(endpoint_health.get("state"), EndpointHealth.CLOSED)
+        self.assertEqual(endpoint_health.get("failure_count"), 5)
+        self.assertEqual(endpoint_health.get("success_count"), 5)
+        self.assertEqual(endpoint_health.get("open_count"), 1)
@@ -2,19 +2,27 @@
 from __future__ import absolute_import
 
 import json
+import os
+import unittest
 
 from django.conf import settings
+from django.contrib.auth.models import User
 from django.core import mail
+from django.db import connection
 from django_celery_beat.models import PeriodicTask
 from django.template import Context
 from django.template.loader import get_template
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.utils import translation, dateparse
 import responses
 from rest_framework import status
 
 from .hook_test_case import HookTestCase
+from ..constants import HOOK_LOG_FAILED
+from ..models import Hook, HookLog, HookLogCount
 from ..tasks import failures_reports
 from kpi.constants import INSTANCE_FORMAT_TYPE_JSON
+from kpi.models import Asset
 
 
 class EmailTestCase(HookTestCase):
@@ -64,3 +72,58 @@ class EmailTestCase(HookTestCase):
         text_content = plain_text_template.render(Context(variables))
 
         self.assertEqual(mail.outbox[0].body, text_content)
+
+
+@unittest.skipUnless(
+    os.environ.get("KPI_RUN_BENCHMARKS", "False") == "True",
+    "set KPI_RUN_BENCHMARKS=True to run"
+)
+class FailuresReportsBenchmarkTestCase(HookTestCase):
+    """
+    Large volumes of failures
+    """
+    OWNERS_COUNT = 4
+    LOGS_PER_OWNER = 100000
+
+    def setUp(self):
+        super(FailuresReportsBenchmarkTestCase, self).setUp()
+        beat_schedule = settings.CELERY_BEAT_SCHEDULE.get("send-hooks-failures-reports")
+        PeriodicTask.objects.create(name="Periodic Task Mock",
+                                    enabled=True,
+                                    task=beat_schedule.get("task"))
+        self._create_failures_fixture()
+
+    def _create_failures_fixture(self):
+        hook_ids = []
+        for owner_index in range(self.OWNERS_COUNT):
+            owner = User.objects.create(username="failures_owner_{}".format(owner_index),
+                                        email="failures_owner_{}@example.com".format(owner_index))
+            for asset_index in range(2):
+                asset = Asset.objects.create(owner=owner, asset_type="survey",
+                                             name="asset {}".format(asset_index))
+                hook = Hook.objects.create(asset=asset, name="hook {}".format(asset_index),
+                                           endpoint="http://external.service.local/")
+                hook_ids.append(hook.pk)
+                HookLog.objects.bulk_create(
+                    HookLog(hook=hook, instance_id=instance_id, status=HOOK_LOG_FAILED,
+                            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            message="Internal Server Error")
+                    for instance_id in range(self.LOGS_PER_OWNER // 2)
+                )
+        HookLogCount.reconcile(hook_ids)
+
+    def test_failures_reports(self):
+        # Two owners per chunk
+        chunk_size = (self.LOGS_PER_OWNER // 2) * 2 * 2
+        with override_settings(HOOK_FAILURES_REPORTS_CHUNK_SIZE=chunk_size), \
+                CaptureQueriesContext(connection) as queries:
+            self.assertTrue(failures_reports())
+
+        # Periodic task, its update, support email, totals by owner, then
+        # owners and logs for each chunk, whatever the number of logs
+        self.assertLessEqual(len(queries), 4 + 2 * (self.OWNERS_COUNT // 2))
+        self.assertEqual(len(mail.outbox), self.OWNERS_COUNT)
+        for owner_index, message in enumerate(mail.outbox):
+            self.assertEqual(message.to, ["failures_owner_{}@example.com".format(owner_index)])
+            self.assertEqual(message.body.count("Internal Server Error"),
+                             (self.LOGS_PER_OWNER // 2) * 2)
@@ -1,8 +1,14 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 
+from collections import Counter
+
+from django.db import transaction
+
+from .constants import HOOK_LOG_PENDING
 from .models.hook_log import HookLog
-from .tasks import service_definition_task
+from .models.hook_log_count import HookLogCount
+from .tasks import deliver_hook_logs
 
 
 class HookUtils(object):
@@ -14,15 +20,48 @@ class HookUtils(object):
 
         :param asset: Asset.
         :param instance_id: int. Instance primary key
+        :return: bool. Whether data is going to be sent to at least one endpoint
+        """
+        return len(HookUtils.call_services_bulk(asset, [instance_id])) > 0
+
+    @staticmethod
+    def call_services_bulk(asset, instances_ids):
         """
-        # Retrieve `Hook` ids, to send data to their respective endpoint.
-        hooks_ids = asset.hooks.filter(active=True).values_list("id", flat=True).distinct()
-        # At least, one of the hooks must not have a log that corresponds to `instance_id`
-        # to make success equal True
-        success = False
-        for hook_id in hooks_ids:
-            if not HookLog.objects.filter(instance_id=instance_id, hook_id=hook_id).exists():
-                success = True
-                service_definition_task.delay(hook_id, instance_id)
-
-        return success
+        Delegates to Celery data submission of several instances to remote
+        servers. Instances which already have a log for a hook are skipped
+        for that hook.
+
+        :param asset: Asset.
+        :param instances_ids: list. Instances primary keys
+        :return: list. Instances primary keys which are going to be sent to
+            at least one endpoint
+        """
+        # Retrieve active hooks, to send data to their respective endpoint.
+        hooks = list(asset.hooks.filter(active=True).only("id", "endpoint"))
+        if not hooks:
+            return []
+
+        existing_logs = set(HookLog.objects.filter(hook__in=hooks, instance_id__in=instances_ids)
+                            .order_by()
+                            .values_list("hook_id", "instance_id"))
+        # Pending logs, sent with the other pending logs of the same endpoint
+        hook_logs = []
+        endpoints = set()
+        accepted_instances_ids = set()
+        for hook in hooks:
+            for instance_id in instances_ids:
+                if (hook.id, instance_id) not in existing_logs:
+                    hook_logs.append(HookLog(hook=hook, instance_id=instance_id))
+                    existing_logs.add((hook.id, instance_id))
+                    endpoints.add(hook.endpoint)
+                    accepted_instances_ids.add(instance_id)
+
+        with transaction.atomic():
+            HookLog.objects.bulk_create(hook_logs)
+            for hook_id, count in Counter(hook_log.hook_id for hook_log in hook_logs).items():
+                HookLogCount.increment(hook_id, HOOK_LOG_PENDING, count)
+        for endpoint in endpoints:
+            deliver_hook_logs.delay(endpoint)
+
+        return [instance_id for instance_id in instances_ids
+                if instance_id in accepted_instances_ids]
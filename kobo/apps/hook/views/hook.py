@@ -5,6 +5,7 @@ import json
 
 import constance
 from django.utils import timezone
+from django.db import transaction
 from django.db.models import Q
 from django.shortcuts import get_object_or_404
 from django.utils.translation import ugettext as _
@@ -15,7 +16,7 @@ from rest_framework_extensions.mixins import NestedViewSetMixin
 
 from ..constants import HOOK_LOG_FAILED, HOOK_LOG_PENDING
 from ..tasks import retry_all_task
-from ..models import Hook, HookLog
+from ..models import Hook, HookLog, HookLogCount
 from ..serializers.hook import HookSerializer
 from kpi.constants import INSTANCE_FORMAT_TYPE_JSON
 from kpi.models import Asset
@@ -160,6 +161,8 @@ class HookViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
         asset_uid = self.get_parents_query_dict().get("asset")
         queryset = self.model.objects.filter(asset__uid=asset_uid)
         queryset = queryset.select_related("asset__uid")
+        # Totals of logs are read from `HookLogCount`
+        queryset = queryset.prefetch_related("log_counts")
         return queryset
 
     def perform_create(self, serializer):
@@ -187,7 +190,12 @@ class HookViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
 
             if len(records) > 0:
                 # Mark all logs as PENDING
-                HookLog.objects.filter(id__in=hooklogs_ids).update(status=HOOK_LOG_PENDING)
+                with transaction.atomic():
+                    failed_count = HookLog.objects.filter(
+                        id__in=hooklogs_ids, status=HOOK_LOG_FAILED).update(status=HOOK_LOG_PENDING)
+                    if failed_count:
+                        HookLogCount.increment(hook.id, HOOK_LOG_FAILED, -failed_count)
+                        HookLogCount.increment(hook.id, HOOK_LOG_PENDING, failed_count)
                 # Delegate to Celery
                 retry_all_task.delay(hooklogs_ids)
                 response.update({
@@ -13,13 +13,29 @@ from rest_framework import serializers
 from .constants import SPECIFIC_REPORTS_KEY, DEFAULT_REPORTS_KEY
 from kpi.utils.log import logging
 
+# Submission metadata that is always read from the deployment, in addition to
+# the fields being exported or reported on
+SUBMISSION_METADATA_FIELDS = (
+    '_id',
+    '_uuid',
+    '_submission_time',
+    '_validation_status',
+)
 
-def build_formpack(asset, submission_stream=None, use_all_form_versions=True):
+
+def build_formpack(asset, submission_stream=None, use_all_form_versions=True,
+                   field_names=None, submission_filters=None):
     '''
     Return a tuple containing a `FormPack` instance and the iterable stream of
     submissions for the given `asset`. If `use_all_form_versions` is `False`,
     then only the newest version of the form is considered, and all submissions
     are assumed to have been collected with that version of the form.
+
+    If `submission_stream` is `None`, submissions are read from the deployment
+    of `asset` once the stream is first iterated, passing the
+    `submission_filters` dictionary to `get_submissions()`.
+    Only the fields named in `field_names` (all fields when `None`), the
+    submission metadata, and the version ids are requested.
     '''
     FUZZY_VERSION_ID_KEY = '_version_'
     INFERRED_VERSION_ID_KEY = '__inferred_version__'
@@ -27,13 +43,19 @@ def build_formpack(asset, submission_stream=None, use_all_form_versions=True):
     if not asset.has_deployment:
         raise Exception('Cannot build formpack for asset without deployment')
 
+    # The content is only needed for versions whose schemas are not cached
+    # yet. See `AssetVersion.to_formpack_schema()`
+    _versions = asset.deployed_versions.defer(
+        'version_content', 'deployed_content')
     if use_all_form_versions:
-        _versions = asset.deployed_versions
+        _versions = list(_versions)
     else:
-        _versions = [asset.deployed_versions.first()]
+        _versions = [_versions.first()]
 
     schemas = []
     version_ids_newest_first = []
+    # Keys of the submission that may hold its version id
+    version_id_keys = set()
     for v in _versions:
         try:
             fp_schema = v.to_formpack_schema()
@@ -47,6 +69,11 @@ def build_formpack(asset, submission_stream=None, use_all_form_versions=True):
                  exc_info=True
             )
         else:
+            version_id_keys.add(fp_schema['version_id_key'])
+            version_id_keys.update(
+                row['name'] for row in fp_schema['content'].get('survey', [])
+                if FUZZY_VERSION_ID_KEY in (row.get('name') or '')
+            )
             fp_schema['version_id_key'] = INFERRED_VERSION_ID_KEY
             schemas.append(fp_schema)
             version_ids_newest_first.append(v.uid)
@@ -69,48 +96,109 @@ def build_formpack(asset, submission_stream=None, use_all_form_versions=True):
     # `_version_`, `_version__001`, `_version__002`, each with a different
     # version id (see https://github.com/kobotoolbox/kpi/issues/1465). To cope,
     # assume that the newest version of this asset whose id appears in the
-    # submission is the proper one to use
-    def _infer_version_id(submission):
+    # submission is the proper one to use. Rank each id that may appear, the
+    # newest being 0, so that a submission needs one lookup per version key
+    version_ranks = {}
+    for rank, version_id in enumerate(version_ids_newest_first):
+        version_ranks.setdefault(version_id, rank)
+    # Deprecated reversion IDs rank as their corresponding AssetVersions
+    for reversion_id, version_uid in _reversion_ids.items():
+        if version_uid in version_ranks:
+            version_ranks[reversion_id] = version_ranks[version_uid]
+        else:
+            version_ranks.pop(reversion_id, None)
+
+    def _infer_version_id(submission, version_keys):
         if not use_all_form_versions:
             submission[INFERRED_VERSION_ID_KEY] = version_ids_newest_first[0]
             return submission
 
-        submission_version_ids = [
-            val for key, val in submission.iteritems()
-                if FUZZY_VERSION_ID_KEY in key
-        ]
-        # Replace any deprecated reversion IDs with the UIDs of their
-        # corresponding AssetVersions
-        submission_version_ids = [
-            _reversion_ids[x] if x in _reversion_ids
-                else x for x in submission_version_ids
+        if version_keys is None:
+            submission_version_ids = [
+                val for key, val in submission.iteritems()
+                    if FUZZY_VERSION_ID_KEY in key
+            ]
+        else:
+            submission_version_ids = [
+                submission[key] for key in version_keys if key in submission
+            ]
+        # Fall back on the latest version
+        # TODO: log a warning?
+        inferred_rank = 0
+        ranks = [
+            version_ranks.get(version_id)
+                for version_id in submission_version_ids
         ]
-        inferred_version_id = None
-        for extant_version_id in version_ids_newest_first:
-            if extant_version_id in submission_version_ids:
-                inferred_version_id = extant_version_id
-                break
-        if not inferred_version_id:
-            # Fall back on the latest version
-            # TODO: log a warning?
-            inferred_version_id = version_ids_newest_first[0]
-        submission[INFERRED_VERSION_ID_KEY] = inferred_version_id
+        ranks = [rank for rank in ranks if rank is not None]
+        if ranks:
+            inferred_rank = min(ranks)
+        submission[INFERRED_VERSION_ID_KEY] = version_ids_newest_first[
+            inferred_rank]
         return submission
 
+    # The keys of a submission that may hold version ids, if known in advance
+    version_keys = None
     if submission_stream is None:
         _userform_id = asset.deployment.mongo_userform_id
-        if not _userform_id.startswith(asset.owner.username):
+        # Only KC deployments have a `mongo_userform_id`
+        if _userform_id is not None and not _userform_id.startswith(
+                asset.owner.username):
             raise Exception('asset has unexpected `mongo_userform_id`')
 
-        submission_stream = asset.deployment.get_submissions()
+        submission_fields = _get_submission_fields(
+            pack, field_names, version_id_keys)
+        # No other keys are read
+        version_keys = [
+            field for field in submission_fields
+                if FUZZY_VERSION_ID_KEY in field
+        ]
+        submission_stream = _read_submissions(
+            asset.deployment,
+            submission_fields,
+            submission_filters if submission_filters is not None else {}
+        )
 
     submission_stream = (
-        _infer_version_id(submission) for submission in submission_stream
+        _infer_version_id(submission, version_keys)
+            for submission in submission_stream
     )
 
     return pack, submission_stream
 
 
+def _get_submission_fields(pack, field_names, version_id_keys):
+    '''
+    Return the top-level submission keys needed to read the fields of `pack`
+    named in `field_names`, or all its fields if `None`, along with
+    `SUBMISSION_METADATA_FIELDS` and `version_id_keys`
+    '''
+    fields = pack.get_fields_for_versions(versions=pack.versions.keys())
+    if field_names is not None:
+        field_names = set(field_names)
+        fields = [field for field in fields if field.name in field_names]
+    submission_fields = set(SUBMISSION_METADATA_FIELDS)
+    submission_fields.update(version_id_keys)
+    for field in fields:
+        # Questions in groups are stored as `group/question`, but those in
+        # repeating groups are nested in a list under `group/repeat`. Asking
+        # for every ancestor path covers both without knowing which groups
+        # repeat
+        path = field.path.split('/')
+        for depth in range(1, len(path) + 1):
+            submission_fields.add('/'.join(path[:depth]))
+    return sorted(submission_fields)
+
+
+def _read_submissions(deployment, fields, submission_filters):
+    '''
+    A generator, so that `get_submissions()` is called only when the first
+    submission is needed
+    '''
+    for submission in deployment.get_submissions(
+            fields=fields, **submission_filters):
+        yield submission
+
+
 def _vnames(asset, cache=False):
     if not cache or not hasattr(asset, '_available_report_uids'):
         content = deepcopy(asset.content)
@@ -124,7 +212,25 @@ def _vnames(asset, cache=False):
 def data_by_identifiers(asset, field_names=None, submission_stream=None,
                         report_styles=None, lang=None, fields=None,
                         split_by=None):
-    pack, submission_stream = build_formpack(asset, submission_stream)
+    stats = get_report_stats(asset, field_names, submission_stream,
+                             lang=lang, split_by=split_by)
+    return apply_report_styles(asset, stats, report_styles)
+
+
+def get_report_stats(asset, field_names=None, submission_stream=None,
+                     lang=None, split_by=None):
+    '''
+    Return the statistics of the fields of `asset` named in `field_names`, or
+    of all its fields if `None`, without the report styles. See
+    `apply_report_styles()`
+    '''
+    submission_field_names = None
+    if field_names is not None:
+        submission_field_names = list(field_names)
+        if split_by:
+            submission_field_names.append(split_by)
+    pack, submission_stream = build_formpack(
+        asset, submission_stream, field_names=submission_field_names)
     _all_versions = pack.versions.keys()
     report = pack.autoreport(versions=_all_versions)
     fields_by_name = OrderedDict([
@@ -138,10 +244,6 @@ def data_by_identifiers(asset, field_names=None, submission_stream=None,
     if split_by and (fields_by_name[split_by].data_type != 'select_one'):
         raise serializers.ValidationError(_("`split_by` field '{}' is not a select one question.").
                                           format(split_by))
-    if report_styles is None:
-        report_styles = asset.report_styles
-    specified_styles = report_styles.get('specified', {})
-    kuids = report_styles.get('kuid_names', {})
 
     def _stat_dict_to_array(stat, field_name):
         freq = stat.pop('frequency', [])
@@ -157,7 +259,6 @@ def data_by_identifiers(asset, field_names=None, submission_stream=None,
                          'percentages': percentages})
 
     def _package_stat(field, _, stat, split_by):
-        identifier = kuids.get(field.name)
         if not split_by:
             _stat_dict_to_array(stat, field.name)
         elif 'values' in stat:
@@ -167,8 +268,6 @@ def data_by_identifiers(asset, field_names=None, submission_stream=None,
             'name': field.name,
             'row': {'type': fields_by_name.get(field.name).data_type},
             'data': stat,
-            'kuid': identifier,
-            'style': specified_styles.get(identifier, {}),
         }
 
     return [_package_stat(*stat_tup, split_by=split_by) for
@@ -177,3 +276,25 @@ def data_by_identifiers(asset, field_names=None, submission_stream=None,
                                          lang=lang,
                                          split_by=split_by)
     ]
+
+
+def apply_report_styles(asset, stats, report_styles=None):
+    '''
+    Return a copy of `stats`, as returned by `get_report_stats()`, with the
+    `kuid` and `style` of each field taken from `report_styles`, or from
+    `asset.report_styles` if `None`
+    '''
+    if report_styles is None:
+        report_styles = asset.report_styles
+    specified_styles = report_styles.get('specified', {})
+    kuids = report_styles.get('kuid_names', {})
+    styled_stats = []
+    for stat in stats:
+        identifier = kuids.get(stat['name'])
+        styled_stat = dict(stat)
+        styled_stat.update({
+            'kuid': identifier,
+            'style': specified_styles.get(identifier, {}),
+        })
+        styled_stats.append(styled_stat)
+    return styled_stats
@@ -2,6 +2,7 @@
 from rest_framework import serializers
 from rest_framework.reverse import reverse
 
+from kpi.models import ReportStatistics
 import report_data
 
 
@@ -24,7 +25,9 @@ class ReportsDetailSerializer(serializers.BaseSerializer):
 
         split_by = request.query_params.get('split_by', None)
 
-        _list = report_data.data_by_identifiers(obj, vnames, split_by=split_by)
+        stats = ReportStatistics.get_stats(
+            obj, split_by=split_by, field_names=vnames)
+        _list = report_data.apply_report_styles(obj, stats)
 
         return {
             'url': reverse('reports-detail', args=(obj.uid,), request=request),
@@ -256,6 +256,10 @@ SUBMISSION_LIST_LIMIT = 30000
 # REMOVE the oldest if a user exceeds this many exports for a particular form
 MAXIMUM_EXPORTS_PER_USER_PER_FORM = 10
 
+# Split CSV exports of more than this many submissions into shards of this
+# size, each rendered by its own Celery task. `0` disables sharding
+EXPORT_SHARD_SIZE = int(os.environ.get('EXPORT_SHARD_SIZE', 0))
+
 # Private media file configuration
 PRIVATE_STORAGE_ROOT = os.path.join(BASE_DIR, 'media')
 PRIVATE_STORAGE_AUTH_FUNCTION = \
@@ -362,6 +366,24 @@ if 'KOBOCAT_URL' in os.environ:
     DEFAULT_DEPLOYMENT_BACKEND = 'kobocat'
 else:
     DEFAULT_DEPLOYMENT_BACKEND = 'mock'
+# Requests to KoBoCAT share a pool of keep-alive connections in each process
+KOBOCAT_HTTP_POOL_SIZE = int(os.environ.get('KOBOCAT_HTTP_POOL_SIZE', 10))
+KOBOCAT_HTTP_CONNECT_TIMEOUT = float(
+    os.environ.get('KOBOCAT_HTTP_CONNECT_TIMEOUT', 5))
+KOBOCAT_HTTP_READ_TIMEOUT = float(
+    os.environ.get('KOBOCAT_HTTP_READ_TIMEOUT', 120))
+# Failed connections, and idempotent requests answered with a 502, 503 or
+# 504, are retried with an exponential backoff; see urllib3's `Retry`
+KOBOCAT_HTTP_MAX_RETRIES = int(os.environ.get('KOBOCAT_HTTP_MAX_RETRIES', 3))
+KOBOCAT_HTTP_BACKOFF_FACTOR = float(
+    os.environ.get('KOBOCAT_HTTP_BACKOFF_FACTOR', 0.5))
+# Asset lists show submission counts that are at most this many seconds old
+KOBOCAT_SUBMISSION_STATS_CACHE_TIMEOUT = int(
+    os.environ.get('KOBOCAT_SUBMISSION_STATS_CACHE_TIMEOUT', 15))
+# API tokens sent to KoBoCAT are cached this many seconds. Other processes
+# may keep using a replaced token until then, unless the cache is shared
+KOBOCAT_TOKEN_CACHE_TIMEOUT = int(
+    os.environ.get('KOBOCAT_TOKEN_CACHE_TIMEOUT', 60))
 
 # Following the uWSGI mountpoint convention, this should have a leading slash
 # but no trailing slash
@@ -459,6 +481,20 @@ CELERY_BEAT_SCHEDULE = {
         "schedule": crontab(hour=0, minute=0),
         'options': {'queue': 'kpi_queue'}
     },
+    # Deliver the pending hook logs whose retry is due
+    "deliver-pending-hook-logs": {
+        "task": "kobo.apps.hook.tasks.deliver_pending_hook_logs",
+        "schedule": timedelta(minutes=1),
+        "options": {"queue": "kpi_queue"}
+    },
+    # Catch up on the report statistics of assets whose new submissions do
+    # not go through the hook signal
+    'refresh-report-statistics': {
+        'task': 'kpi.tasks.refresh_report_statistics',
+        'schedule': timedelta(minutes=int(os.environ.get(
+            'REPORT_STATISTICS_REFRESH_PERIOD_MINUTES', 60))),
+        'options': {'queue': 'kpi_queue'}
+    },
 }
 
 CELERY_BROKER_TRANSPORT_OPTIONS = {
@@ -472,6 +508,46 @@ CELERY_BROKER_TRANSPORT_OPTIONS = {
 
 CELERY_TASK_DEFAULT_QUEUE = "kpi_queue"
 
+# Pending hook logs are delivered in batches of `HOOK_DELIVERY_BATCH_SIZE` per
+# endpoint, with at most `HOOK_DELIVERY_CONCURRENCY` simultaneous requests
+# to the same endpoint
+HOOK_DELIVERY_BATCH_SIZE = int(os.environ.get('HOOK_DELIVERY_BATCH_SIZE', 100))
+HOOK_DELIVERY_CONCURRENCY = int(
+    os.environ.get('HOOK_DELIVERY_CONCURRENCY', 5))
+HOOK_DELIVERY_TIMEOUT = float(os.environ.get('HOOK_DELIVERY_TIMEOUT', 30))
+# Delay before delivering again to an endpoint which was busy
+HOOK_DELIVERY_BUSY_COUNTDOWN = int(
+    os.environ.get('HOOK_DELIVERY_BUSY_COUNTDOWN', 10))
+# Maximum number of instances per request to `hook-signal/bulk/`
+HOOK_SIGNAL_BULK_MAX_SIZE = int(
+    os.environ.get('HOOK_SIGNAL_BULK_MAX_SIZE', 1000))
+# Failure reports read logs of as many owners at once as fit in this number
+HOOK_FAILURES_REPORTS_CHUNK_SIZE = int(
+    os.environ.get('HOOK_FAILURES_REPORTS_CHUNK_SIZE', 5000))
+# Deliveries to an endpoint stop after `HOOK_CIRCUIT_BREAKER_THRESHOLD`
+# consecutive failures, for `HOOK_CIRCUIT_BREAKER_MIN_SECONDS` at first, then
+# twice as long after each failed probe, up to `HOOK_CIRCUIT_BREAKER_MAX_SECONDS`
+HOOK_CIRCUIT_BREAKER_THRESHOLD = int(
+    os.environ.get('HOOK_CIRCUIT_BREAKER_THRESHOLD', 5))
+HOOK_CIRCUIT_BREAKER_MIN_SECONDS = int(
+    os.environ.get('HOOK_CIRCUIT_BREAKER_MIN_SECONDS', 60))
+HOOK_CIRCUIT_BREAKER_MAX_SECONDS = int(
+    os.environ.get('HOOK_CIRCUIT_BREAKER_MAX_SECONDS', 3600))
+
+# Recalculate the inherited permissions of descendants in a Celery task
+# instead of during the request. Changes to the same collection tree made
+# within `PERMISSION_PROPAGATION_DELAY` seconds are merged into one
+# recalculation
+ASYNC_PERMISSION_PROPAGATION = (
+    os.environ.get('ASYNC_PERMISSION_PROPAGATION', 'False') == 'True')
+PERMISSION_PROPAGATION_DELAY = int(
+    os.environ.get('PERMISSION_PROPAGATION_DELAY', 5))
+
+# Report statistics are refreshed this many seconds after a new submission
+# is signaled, so that submissions arriving in bursts are counted together
+REPORT_STATISTICS_REFRESH_DELAY = int(
+    os.environ.get('REPORT_STATISTICS_REFRESH_DELAY', 60))
+
 if 'KOBOCAT_URL' in os.environ:
     SYNC_KOBOCAT_XFORMS = (os.environ.get('SYNC_KOBOCAT_XFORMS', 'True') == 'True')
     SYNC_KOBOCAT_PERMISSIONS = (
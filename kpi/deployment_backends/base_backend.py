@@ -21,6 +21,15 @@ class BaseDeploymentBackend(object):
     def delete(self):
         self.asset._deployment_data.clear()
 
+    @classmethod
+    def prefetch_submission_stats(cls, assets):
+        '''
+        Prepare `submission_count` and `last_submission_time` for all
+        `assets`, which use this backend, at once. Does nothing unless the
+        backend has a faster way than asking asset by asset
+        '''
+        pass
+
     @classmethod
     def validate_submission_list_params(cls, **kwargs):
         """
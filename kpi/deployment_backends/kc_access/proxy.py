@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import cookielib
+import hashlib
+import os
+import re
+import threading
+import time
+import urlparse
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+from rest_framework.authtoken.models import Token
+
+TOKEN_CACHE_KEY = 'kc-token-{}'
+
+# Upper bounds, in seconds, of the latency histogram buckets. Slower requests
+# fall in a last, unbounded bucket
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LATENCY_ENDPOINTS_CACHE_KEY = 'kc-latency-endpoints'
+LATENCY_CACHE_KEY = 'kc-latency-{}-{}'
+
+
+class RejectCookiesPolicy(cookielib.DefaultCookiePolicy):
+    ''' Never store cookies: the session is shared by requests made on behalf
+    of different users '''
+    def set_ok(self, cookie, request):
+        return False
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+# Endpoints known to be in the shared list of `LATENCY_ENDPOINTS_CACHE_KEY`
+_known_endpoints = set()
+
+
+def get_kc_session():
+    '''
+    Return the `requests.Session` shared by this process for requests to KC.
+    It keeps up to `KOBOCAT_HTTP_POOL_SIZE` connections alive per host and
+    retries failed connections, as well as idempotent requests that fail
+    with a 502, 503 or 504, with an exponential backoff. A new session is
+    created after forking, since sockets must not be shared between
+    processes
+    '''
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            retry = Retry(
+                total=settings.KOBOCAT_HTTP_MAX_RETRIES,
+                backoff_factor=settings.KOBOCAT_HTTP_BACKOFF_FACTOR,
+                status_forcelist=(502, 503, 504),
+                # Return the last response instead of raising once retries
+                # are exhausted, as without retries
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(
+                pool_connections=settings.KOBOCAT_HTTP_POOL_SIZE,
+                pool_maxsize=settings.KOBOCAT_HTTP_POOL_SIZE,
+                max_retries=retry,
+            )
+            session = requests.Session()
+            session.cookies.set_policy(RejectCookiesPolicy())
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+            _session_pid = os.getpid()
+        return _session
+
+
+def get_kc_token_key(user):
+    '''
+    Return the API token of `user`, creating it if needed. Tokens are cached
+    for `KOBOCAT_TOKEN_CACHE_TIMEOUT` seconds. `kpi.signals` forgets them
+    when they change, but only in the cache of the process that changed
+    them, unless the cache backend is shared
+    '''
+    cache_key = TOKEN_CACHE_KEY.format(user.pk)
+    token_key = cache.get(cache_key)
+    if token_key is None:
+        token, created = Token.objects.get_or_create(user=user)
+        token_key = token.key
+        cache.set(cache_key, token_key, settings.KOBOCAT_TOKEN_CACHE_TIMEOUT)
+    return token_key
+
+
+def send_kc_request(kc_request, user=None):
+    '''
+    Send `kc_request`, a `requests.Request`, through the pooled session,
+    adding the API token of `user` unless it is `None` or anonymous, and
+    record how long KC took to respond
+
+    :param kc_request: requests.models.Request
+    :param user: User
+    :return: requests.models.Response
+    '''
+    if user is not None and not user.is_anonymous() and (
+        user.pk != settings.ANONYMOUS_USER_ID
+    ):
+        kc_request.headers['Authorization'] = 'Token %s' % get_kc_token_key(
+            user)
+    prepared_request = kc_request.prepare()
+    start = time.time()
+    try:
+        return get_kc_session().send(prepared_request, timeout=(
+            settings.KOBOCAT_HTTP_CONNECT_TIMEOUT,
+            settings.KOBOCAT_HTTP_READ_TIMEOUT,
+        ))
+    finally:
+        record_kc_latency(
+            prepared_request.method, prepared_request.url,
+            time.time() - start
+        )
+
+
+def _get_endpoint(method, url):
+    '''
+    Group requests by method and path, ignoring the query string and
+    replacing numeric ids, e.g. `PATCH /api/v1/data/{id}/{id}/validation_status`
+    '''
+    path = urlparse.urlsplit(url).path
+    path = re.sub(r'/\d+(?=/|$)', '/{id}', path)
+    return u'{} {}'.format(method, path)
+
+
+def _get_latency_cache_key(endpoint, suffix):
+    # Endpoints contain characters that some cache backends do not accept in
+    # keys
+    return LATENCY_CACHE_KEY.format(
+        hashlib.md5(endpoint.encode('utf-8')).hexdigest(), suffix)
+
+
+def _incr(key, delta):
+    if cache.add(key, delta, None):
+        return
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # Evicted in the meantime
+        cache.set(key, delta, None)
+
+
+def record_kc_latency(method, url, seconds):
+    '''
+    Add a request that took `seconds` to the latency histogram of its
+    endpoint. Histograms are kept in the default cache: they only cover
+    every process if its backend is shared (e.g. Redis or Memcached); with
+    the default local-memory cache, each process has its own
+    '''
+    endpoint = _get_endpoint(method, url)
+    if endpoint not in _known_endpoints:
+        endpoints = cache.get(LATENCY_ENDPOINTS_CACHE_KEY, [])
+        if endpoint not in endpoints:
+            cache.set(LATENCY_ENDPOINTS_CACHE_KEY, endpoints + [endpoint], None)
+        _known_endpoints.add(endpoint)
+    bucket = len(LATENCY_BUCKETS)
+    for index, upper_bound in enumerate(LATENCY_BUCKETS):
+        if seconds <= upper_bound:
+            bucket = index
+            break
+    _incr(_get_latency_cache_key(endpoint, bucket), 1)
+    _incr(_get_latency_cache_key(endpoint, 'ms'), int(seconds * 1000))
+
+
+def get_kc_latency_histograms():
+    '''
+    Return a dictionary of the recorded latency histograms by endpoint. Each
+    has the number of requests (`count`), their total duration in seconds
+    (`total`), and a list of `(upper_bound, count)` tuples (`buckets`), the
+    last upper bound being `None`
+    '''
+    histograms = {}
+    upper_bounds = list(LATENCY_BUCKETS) + [None]
+    for endpoint in cache.get(LATENCY_ENDPOINTS_CACHE_KEY, []):
+        keys = [_get_latency_cache_key(endpoint, bucket)
+                for bucket in range(len(upper_bounds))]
+        ms_key = _get_latency_cache_key(endpoint, 'ms')
+        values = cache.get_many(keys + [ms_key])
+        buckets = [(upper_bound, values.get(key, 0))
+                   for upper_bound, key in zip(upper_bounds, keys)]
+        histograms[endpoint] = {
+            'count': sum(count for _, count in buckets),
+            'total': values.get(ms_key, 0) / 1000.0,
+            'buckets': buckets,
+        }
+    return histograms
+
+
+def reset_kc_latency_histograms():
+    endpoints = cache.get(LATENCY_ENDPOINTS_CACHE_KEY, [])
+    keys = [LATENCY_ENDPOINTS_CACHE_KEY]
+    for endpoint in endpoints:
+        keys.extend(_get_latency_cache_key(endpoint, bucket)
+                    for bucket in range(len(LATENCY_BUCKETS) + 1))
+        keys.append(_get_latency_cache_key(endpoint, 'ms'))
+    cache.delete_many(keys)
+    _known_endpoints.clear()
@@ -14,6 +14,7 @@ import requests
 
 from kpi.exceptions import KoboCatProfileException
 from kpi.utils.log import logging
+from .proxy import send_kc_request
 from .shadow_models import (
     safe_kc_read,
     ReadOnlyXForm,
@@ -28,9 +29,8 @@ def _trigger_kc_profile_creation(user):
     UserProfile if none exists already
     '''
     url = settings.KOBOCAT_URL + '/api/v1/user'
-    token, _ = Token.objects.get_or_create(user=user)
-    response = requests.get(
-        url, headers={'Authorization': 'Token ' + token.key})
+    response = send_kc_request(
+        requests.Request(method='GET', url=url), user)
     if not response.status_code == 200:
         raise KoboCatProfileException(
             'Bad HTTP status code `{}` when retrieving KoBoCAT user profile'
@@ -56,6 +56,31 @@ def last_submission_time(xform_id_string, user_id):
     ).last_submission_time
 
 
+@safe_kc_read
+def get_submission_stats(xforms):
+    '''
+    Return the number of submissions and the last submission time of each
+    XForm in `xforms`, an iterable of `(user_id, id_string)` tuples, as a
+    dictionary keyed by those tuples. XForms that do not exist are omitted.
+    Only one query is made
+    '''
+    xforms = set(xforms)
+    if not xforms:
+        return {}
+    # Fetches a superset of `xforms`, since `id_string` is only unique per
+    # user
+    xform_stats = ReadOnlyXForm.objects.filter(
+        user_id__in=set(user_id for user_id, _ in xforms),
+        id_string__in=set(id_string for _, id_string in xforms),
+    ).values_list(
+        'user_id', 'id_string', 'num_of_submissions', 'last_submission_time')
+    submission_stats = {}
+    for user_id, id_string, count, submission_time in xform_stats:
+        if (user_id, id_string) in xforms:
+            submission_stats[(user_id, id_string)] = (count, submission_time)
+    return submission_stats
+
+
 @safe_kc_read
 def get_kc_profile_data(user_id):
     '''
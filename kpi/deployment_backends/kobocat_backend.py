@@ -12,17 +12,22 @@ import posixpath
 
 from bson import json_util
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
 from django.http import HttpResponse
 from django.utils.translation import ugettext_lazy as _
 from pyxform.xls2json_backends import xls_to_dict
 from rest_framework import exceptions, status, serializers
 from rest_framework.request import Request
-from rest_framework.authtoken.models import Token
 
 from ..exceptions import BadFormatException, KobocatDeploymentException
 from .base_backend import BaseDeploymentBackend
-from .kc_access.utils import instance_count, last_submission_time
+from .kc_access.utils import (
+    get_submission_stats,
+    instance_count,
+    last_submission_time,
+)
+from .kc_access.proxy import send_kc_request
 from .kc_access.shadow_models import ReadOnlyInstance, ReadOnlyXForm
 from kpi.constants import INSTANCE_FORMAT_TYPE_JSON, INSTANCE_FORMAT_TYPE_XML
 from kpi.utils.mongo_helper import MongoHelper
@@ -400,7 +405,52 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
         }
         return links
 
+    SUBMISSION_STATS_CACHE_KEY = 'kc-submission-stats-{}-{}'
+
+    @classmethod
+    def prefetch_submission_stats(cls, assets):
+        '''
+        Fetch the submission counts and last submission times of all `assets`
+        from the shared cache, or with a single KC query for those missing,
+        and keep them on each asset. They are cached for
+        `KOBOCAT_SUBMISSION_STATS_CACHE_TIMEOUT` seconds, so only use this
+        where slightly outdated values are acceptable, e.g. asset lists
+        '''
+        cache_keys = {}
+        for asset in assets:
+            id_string = asset._deployment_data['backend_response']['id_string']
+            cache_key = cls.SUBMISSION_STATS_CACHE_KEY.format(
+                asset.owner_id, id_string)
+            cache_keys[cache_key] = (asset.owner_id, id_string)
+        submission_stats = dict(
+            (cache_keys[cache_key], stats)
+            for cache_key, stats in cache.get_many(cache_keys.keys()).items()
+        )
+        missing_xforms = set(cache_keys.values()).difference(submission_stats)
+        if missing_xforms:
+            fetched_stats = get_submission_stats(missing_xforms)
+            for xform in missing_xforms:
+                # Like `instance_count()`, count no submissions for a missing
+                # XForm
+                fetched_stats.setdefault(xform, (0, None))
+            cache.set_many(
+                dict(
+                    (cls.SUBMISSION_STATS_CACHE_KEY.format(*xform), stats)
+                    for xform, stats in fetched_stats.items()
+                ),
+                settings.KOBOCAT_SUBMISSION_STATS_CACHE_TIMEOUT
+            )
+            submission_stats.update(fetched_stats)
+        for asset in assets:
+            id_string = asset._deployment_data['backend_response']['id_string']
+            asset.prefetched_submission_stats = submission_stats[
+                (asset.owner_id, id_string)]
+
     def _submission_count(self):
+        prefetched_stats = getattr(
+            self.asset, 'prefetched_submission_stats', None)
+        if prefetched_stats is not None:
+            return prefetched_stats[0]
         _deployment_data = self.asset._deployment_data
         id_string = _deployment_data['backend_response']['id_string']
         # avoid migrations from being created for kc_access mocked models
@@ -441,6 +491,10 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
         return self.__prepare_as_drf_response_signature(kc_response)
 
     def _last_submission_time(self):
+        prefetched_stats = getattr(
+            self.asset, 'prefetched_submission_stats', None)
+        if prefetched_stats is not None:
+            return prefetched_stats[1]
         _deployment_data = self.asset._deployment_data
         id_string = _deployment_data['backend_response']['id_string']
         return last_submission_time(
@@ -580,7 +634,8 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
             limit = offset + params.get("limit")
             queryset = queryset[offset:limit]
 
-        return (lazy_instance.xml for lazy_instance in queryset)
+        # Skip the queryset's result cache; only the XML is needed
+        return queryset.values_list('xml', flat=True).iterator()
 
     @staticmethod
     def __kobocat_proxy_request(kc_request, user=None):
@@ -593,11 +648,7 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
         :param user: User
         :return: requests.models.Response
         """
-        if not user.is_anonymous() and user.pk != settings.ANONYMOUS_USER_ID:
-            token, created = Token.objects.get_or_create(user=user)
-            kc_request.headers['Authorization'] = 'Token %s' % token.key
-        session = requests.Session()
-        return session.send(kc_request.prepare())
+        return send_kc_request(kc_request, user)
 
     @staticmethod
     def __prepare_as_drf_response_signature(requests_response):
@@ -2,6 +2,10 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, unicode_literals
 import re
+import operator
+
+import pytz
+import dateutil.parser
 
 from django.core.urlresolvers import reverse
 from django.http import HttpResponse
@@ -113,6 +117,17 @@ class MockDeploymentBackend(BaseDeploymentBackend):
         submissions = self.asset._deployment_data.get('submissions', [])
         return len(submissions)
 
+    def _last_submission_time(self):
+        submissions = self.asset._deployment_data.get('submissions', [])
+        submission_times = [submission['_submission_time']
+                            for submission in submissions
+                            if '_submission_time' in submission]
+        if not submission_times:
+            return None
+        # Like Mongo, the mock stores UTC timestamps without a timezone
+        return dateutil.parser.parse(max(submission_times)).replace(
+            tzinfo=pytz.UTC)
+
     def _mock_submission(self, submission):
         """
         @TODO may be useless because of mock_submissions. Remove if it's not used anymore anywhere else.
@@ -153,12 +168,64 @@ class MockDeploymentBackend(BaseDeploymentBackend):
                                map(int, instances_ids)]
 
         params = self.validate_submission_list_params(**kwargs)
+        if params['query']:
+            submissions = [submission for submission in submissions
+                           if self._matches_query(submission, params['query'])]
+        if len(params['sort']) == 1:
+            sort_key, sort_dir = params['sort'].items()[0]
+            submissions = sorted(
+                submissions,
+                key=lambda submission: submission.get(sort_key),
+                reverse=int(sort_dir) < 0
+            )
+        if params['fields'] and format_type == INSTANCE_FORMAT_TYPE_JSON:
+            # Like Mongo, always include `_id`
+            fields = set(params['fields'])
+            fields.add('_id')
+            submissions = [
+                dict((key, value) for key, value in submission.items()
+                     if key in fields)
+                for submission in submissions
+            ]
         # TODO: support other query parameters?
+        if params['start']:
+            submissions = submissions[params['start']:]
         if 'limit' in params:
             submissions = submissions[:params['limit']]
 
         return submissions
 
+    @staticmethod
+    def _matches_query(submission, query):
+        """
+        Evaluate a minimal subset of Mongo queries: equality, comparisons,
+        and `$and`
+        """
+        comparisons = {
+            '$gt': operator.gt,
+            '$gte': operator.ge,
+            '$lt': operator.lt,
+            '$lte': operator.le,
+        }
+        for key, condition in query.items():
+            if key == '$and':
+                if not all(MockDeploymentBackend._matches_query(submission, q)
+                           for q in condition):
+                    return False
+                continue
+            value = submission.get(key)
+            if isinstance(condition, dict):
+                for operator_name, operand in condition.items():
+                    if operator_name not in comparisons:
+                        raise NotImplementedError(
+                            '`{}` is not supported'.format(operator_name))
+                    if value is None or not comparisons[operator_name](
+                            value, operand):
+                        return False
+            elif value != condition:
+                return False
+        return True
+
     def get_submission(self, pk, format_type=INSTANCE_FORMAT_TYPE_JSON, **kwargs):
         if pk:
             submissions = list(self.get_submissions(format_type, [pk], **kwargs))
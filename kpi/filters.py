@@ -91,8 +91,7 @@ class KpiObjectPermissionsFilter(object):
         else:
             owned_and_explicitly_shared = get_objects_for_user(
                 user, permission, queryset)
-        public = get_objects_for_user(
-            get_anonymous_user(), permission, queryset)
+        public = get_objects_for_user(AnonymousUser(), permission, queryset)
         if view.action != 'list':
             # Not a list, so discoverability doesn't matter
             return (owned_and_explicitly_shared | public).distinct()
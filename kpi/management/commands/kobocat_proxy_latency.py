@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from kpi.deployment_backends.kc_access.proxy import (
+    LATENCY_BUCKETS,
+    get_kc_latency_histograms,
+    reset_kc_latency_histograms,
+)
+
+
+class Command(BaseCommand):
+    help = ('Prints the latency histograms of requests made to KoBoCAT, by '
+            'endpoint. Requests made by other processes are only included '
+            'if the cache backend is shared')
+    option_list = BaseCommand.option_list + (
+        make_option('--reset',
+                    action='store_true',
+                    dest='reset',
+                    default=False,
+                    help='Start over after printing'),
+                    )
+
+    def handle(self, *args, **options):
+        headers = ['<={}s'.format(upper_bound)
+                   for upper_bound in LATENCY_BUCKETS]
+        headers.append('>{}s'.format(LATENCY_BUCKETS[-1]))
+        self.stdout.write('\t'.join(
+            ['endpoint', 'count', 'mean'] + headers))
+        histograms = get_kc_latency_histograms()
+        for endpoint, histogram in sorted(histograms.items()):
+            count = histogram['count']
+            mean = histogram['total'] / count if count else 0
+            self.stdout.write('\t'.join(
+                [endpoint, str(count), '{:.3f}s'.format(mean)] +
+                [str(bucket_count) for _, bucket_count in histogram['buckets']]
+            ))
+        if options['reset']:
+            reset_kc_latency_histograms()
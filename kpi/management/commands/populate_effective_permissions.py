@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import defaultdict
+from optparse import make_option
+
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+
+from kpi.models import Asset, Collection, EffectivePermission, ObjectPermission
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds the stored effective permissions of every asset and '
+            'collection from their object permissions')
+    option_list = BaseCommand.option_list + (
+        make_option('--users',
+                    action='store',
+                    dest='filter_users_str',
+                    default=False,
+                    help='Only rebuild objects owned by a comma-delimited'
+                         ' list of users (quicker)'),
+                    )
+
+    def handle(self, *args, **options):
+        kw = {}
+        if options['filter_users_str']:
+            kw['filter_usernames'] = options['filter_users_str'].split(',')
+        counts = populate_effective_permissions(
+            Asset, Collection, ContentType, Permission, ObjectPermission,
+            EffectivePermission, **kw)
+        for model_name, count in counts:
+            print('refreshed effective permissions for {} {} records'.format(
+                count, model_name))
+
+
+def populate_effective_permissions(_Asset, _Collection, _ContentType,
+                                   _Permission, _ObjectPermission,
+                                   _EffectivePermission,
+                                   filter_usernames=None):
+    '''
+    Rebuild the effective permissions of every asset and collection. Works
+    with the historical models of a migration: the database is only accessed
+    through the given models, and grants are resolved by unsaved instances of
+    the current `Asset` and `Collection`, which only need their pk and owner.
+    Returns a list of (model name, number of objects) tuples
+    '''
+    codenames = dict(_Permission.objects.values_list('pk', 'codename'))
+    counts = []
+    for _model, model in ((_Collection, Collection), (_Asset, Asset)):
+        content_type = _ContentType.objects.filter(
+            app_label=_model._meta.app_label,
+            model=_model._meta.model_name
+        ).first()
+        if content_type is None:
+            # Created after the first migrations; there is nothing to do
+            counts.append((_model._meta.model_name, 0))
+            continue
+        queryset = _model.objects.all()
+        if filter_usernames:
+            queryset = queryset.filter(owner__username__in=filter_usernames)
+        objects = list(queryset.order_by('pk').values_list('pk', 'owner_id'))
+        for start in xrange(0, len(objects), BATCH_SIZE):
+            batch = objects[start:start + BATCH_SIZE]
+            object_ids = [pk for pk, owner_id in batch]
+            perm_rows_by_object_id = defaultdict(list)
+            for object_id, user_id, permission_id, deny in \
+                    _ObjectPermission.objects.filter(
+                        content_type_id=content_type.pk,
+                        object_id__in=object_ids
+                    ).values_list(
+                        'object_id', 'user_id', 'permission_id', 'deny'
+                    ):
+                perm_rows_by_object_id[object_id].append(
+                    (user_id, codenames[permission_id], deny))
+            effective_perms = []
+            for pk, owner_id in batch:
+                obj = model(pk=pk, owner_id=owner_id)
+                for user_id, codename in obj._calculate_effective_perms(
+                        perm_rows_by_object_id[pk]):
+                    effective_perms.append(_EffectivePermission(
+                        content_type_id=content_type.pk,
+                        object_id=pk,
+                        user_id=user_id,
+                        codename=codename
+                    ))
+            _EffectivePermission.objects.filter(
+                content_type_id=content_type.pk, object_id__in=object_ids
+            ).delete()
+            _EffectivePermission.objects.bulk_create(effective_perms)
+        counts.append((_model._meta.model_name, len(objects)))
+    return counts
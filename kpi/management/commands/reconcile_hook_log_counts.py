@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from kobo.apps.hook.models import Hook, HookLogCount
+
+
+class Command(BaseCommand):
+    help = ('Recalculates the numbers of logs by status of REST services '
+            'from their logs, and fixes those which drifted')
+    option_list = BaseCommand.option_list + (
+        make_option('--hook',
+                    action='append',
+                    dest='hook_uids',
+                    default=None,
+                    help='Only reconcile the hook with this uid (repeatable)'),
+                    )
+
+    def handle(self, *args, **options):
+        hook_ids = None
+        if options['hook_uids']:
+            hook_ids = list(Hook.objects.filter(
+                uid__in=options['hook_uids']).values_list('pk', flat=True))
+        fixed = HookLogCount.reconcile(hook_ids)
+        if int(options['verbosity']) > 0:
+            self.stdout.write('{} count(s) fixed'.format(fixed))
@@ -390,6 +390,7 @@ def _sync_permissions(asset, xform):
                 content_type=ASSET_CT,
                 object_id=asset.pk
             ).delete()
+            asset.refresh_effective_perms()
         if perms_to_assign or perms_to_revoke:
             affected_usernames.append(user_obj.username)
 
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.conf import settings
+
+from kpi.management.commands.populate_effective_permissions import \
+    populate_effective_permissions as _populate
+
+
+def populate_effective_permissions(apps, schema_editor):
+    if settings.SKIP_HEAVY_MIGRATIONS:
+        print("""
+            !!! ATTENTION !!!
+            If you have existing projects you need to run this management command:
+
+               > python manage.py populate_effective_permissions
+
+            Otherwise, users will lose access to objects shared before this
+            migration. This command can take a long time, but it is idempotent
+            so you can run it even if you are not sure if it is necessary.
+            """)
+    else:
+        _populate(apps.get_model('kpi', 'Asset'),
+                  apps.get_model('kpi', 'Collection'),
+                  apps.get_model('contenttypes', 'ContentType'),
+                  apps.get_model('auth', 'Permission'),
+                  apps.get_model('kpi', 'ObjectPermission'),
+                  apps.get_model('kpi', 'EffectivePermission'),
+                  )
+
+
+# allow this command to be run backwards
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('kpi', '0022_assetfile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EffectivePermission',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('codename', models.CharField(max_length=100)),
+                ('object_id', models.PositiveIntegerField()),
+                ('content_type', models.ForeignKey(related_name='+', to='contenttypes.ContentType')),
+                ('user', models.ForeignKey(related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='effectivepermission',
+            unique_together=set([('content_type', 'object_id', 'codename', 'user')]),
+        ),
+        migrations.RunPython(populate_effective_permissions, noop),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0001_initial'),
+        ('kpi', '0023_effectivepermission'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PermissionPropagation',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('object_id', models.PositiveIntegerField()),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('content_type', models.ForeignKey(related_name='+', to='contenttypes.ContentType')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='permissionpropagation',
+            unique_together=set([('content_type', 'object_id')]),
+        ),
+    ]
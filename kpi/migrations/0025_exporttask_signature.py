@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kpi', '0024_permissionpropagation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exporttask',
+            name='signature',
+            field=models.CharField(
+                max_length=40, blank=True, default='', db_index=True),
+        ),
+        migrations.AddField(
+            model_name='exporttask',
+            name='submission_count',
+            field=models.PositiveIntegerField(null=True),
+        ),
+    ]
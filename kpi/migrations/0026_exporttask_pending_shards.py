@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kpi', '0025_exporttask_signature'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exporttask',
+            name='pending_shards',
+            field=models.PositiveIntegerField(null=True),
+        ),
+    ]
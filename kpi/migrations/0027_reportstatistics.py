@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kpi', '0026_exporttask_pending_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportStatistics',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('split_by', models.CharField(default='', max_length=255, blank=True)),
+                ('data', jsonfield.fields.JSONField(default=[])),
+                ('signature', models.CharField(default='', max_length=40, blank=True)),
+                ('submission_count', models.PositiveIntegerField(default=0)),
+                ('last_submission_time', models.DateTimeField(null=True)),
+                ('date_modified', models.DateTimeField(auto_now=True)),
+                ('asset', models.ForeignKey(related_name='report_statistics', to='kpi.Asset')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='reportstatistics',
+            unique_together=set([('asset', 'split_by')]),
+        ),
+    ]
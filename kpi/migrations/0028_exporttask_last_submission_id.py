@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kpi', '0027_reportstatistics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exporttask',
+            name='last_submission_id',
+            field=models.PositiveIntegerField(null=True),
+        ),
+    ]
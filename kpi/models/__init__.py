@@ -5,7 +5,10 @@ from kpi.models.asset import AssetSnapshot
 from kpi.models.asset_version import AssetVersion
 from kpi.models.asset_file import AssetFile
 from kpi.models.object_permission import ObjectPermission, ObjectPermissionMixin
+from kpi.models.object_permission import EffectivePermission
+from kpi.models.object_permission import PermissionPropagation
 from kpi.models.import_export_task import ImportTask, ExportTask
+from kpi.models.report_statistics import ReportStatistics
 from kpi.models.tag_uid import TagUid
 from kpi.models.authorized_application import AuthorizedApplication
 from kpi.models.authorized_application import OneTimeAuthenticationKey
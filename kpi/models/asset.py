@@ -41,7 +41,11 @@ from kpi.utils.autoname import (autoname_fields_in_place,
                                 autovalue_choices_in_place)
 from kpi.constants import ASSET_TYPES, ASSET_TYPE_BLOCK,\
     ASSET_TYPE_QUESTION, ASSET_TYPE_SURVEY, ASSET_TYPE_TEMPLATE
-from .object_permission import ObjectPermission, ObjectPermissionMixin
+from .object_permission import (
+    EffectivePermission,
+    ObjectPermission,
+    ObjectPermissionMixin,
+)
 from ..fields import KpiUidField, LazyDefaultJSONBField
 from ..utils.asset_content_analyzer import AssetContentAnalyzer
 from ..utils.sluggify import sluggify_label
@@ -1442,4 +1446,5 @@ class AssetSnapshot(models.Model, XlsExportable, FormpackXLSFormUtils, OCFormUti
 def post_delete_asset(sender, instance, **kwargs):
     # Remove all permissions associated with this object
     ObjectPermission.objects.filter_for_object(instance).delete()
+    EffectivePermission.objects.filter_for_object(instance).delete()
     # No recalculation is necessary since children will also be deleted
@@ -1,8 +1,11 @@
 import json
 import hashlib
 import datetime
+import threading
+from collections import OrderedDict
 from django.utils import timezone
 
+from django.core.cache import cache
 from django.db import models
 
 from jsonbfield.fields import JSONField as JSONBField
@@ -10,7 +13,7 @@ from reversion.models import Version
 from ..fields import KpiUidField
 from ..utils.kobo_to_xlsform import to_xlsform_structure
 
-from formpack.utils.expand_content import expand_content
+from formpack.utils.expand_content import SCHEMA_VERSION, expand_content
 
 DEFAULT_DATETIME = datetime.datetime(2010, 1, 1)
 
@@ -33,13 +36,22 @@ class AssetVersion(models.Model):
     _deployment_data = JSONBField(default=False)
     deployed = models.BooleanField(default=False)
 
+    # The formpack schema of a deployed version never changes. Up to this many
+    # are kept in memory, as JSON, in addition to the shared cache
+    FORMPACK_SCHEMA_CACHE_SIZE = 500
+    FORMPACK_SCHEMA_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+    # Schemas built by another version of formpack are not reused
+    FORMPACK_SCHEMA_CACHE_KEY = 'formpack-schema-{}-{}'
+    _formpack_schemas = OrderedDict()
+    _formpack_schemas_lock = threading.Lock()
+
     class Meta:
         ordering = ['-date_modified']
 
     def _deployed_content(self):
         if self.deployed_content is not None:
             return self.deployed_content
-        legacy_names = self._reversion_version is not None
+        legacy_names = self._reversion_version_id is not None
         if legacy_names:
             return to_xlsform_structure(self.version_content,
                                         deprecated_autoname=True)
@@ -48,12 +60,55 @@ class AssetVersion(models.Model):
                                         move_autonames=True)
 
     def to_formpack_schema(self):
+        '''
+        Return the formpack schema of this version. Those of deployed versions
+        are cached; each call returns a new copy that the caller may modify
+        '''
+        if not self.deployed:
+            return self._build_formpack_schema()
+        schema_json = self._get_cached_formpack_schema()
+        if schema_json is None:
+            schema_json = json.dumps(self._build_formpack_schema())
+            cache.set(self._get_formpack_schema_cache_key(),
+                      schema_json, self.FORMPACK_SCHEMA_CACHE_TIMEOUT)
+            self._remember_formpack_schema(schema_json)
+        return json.loads(schema_json)
+
+    def _build_formpack_schema(self):
         return {
             'content': expand_content(self._deployed_content()),
             'version': self.uid,
             'version_id_key': '__version__',
         }
 
+    def _get_formpack_schema_cache_key(self):
+        return self.FORMPACK_SCHEMA_CACHE_KEY.format(SCHEMA_VERSION, self.uid)
+
+    def _get_cached_formpack_schema(self):
+        cls = type(self)
+        with cls._formpack_schemas_lock:
+            try:
+                schema_json = cls._formpack_schemas.pop(self.uid)
+            except KeyError:
+                pass
+            else:
+                # Now the most recently used
+                cls._formpack_schemas[self.uid] = schema_json
+                return schema_json
+        schema_json = cache.get(self._get_formpack_schema_cache_key())
+        if schema_json is not None:
+            self._remember_formpack_schema(schema_json)
+        return schema_json
+
+    def _remember_formpack_schema(self, schema_json):
+        cls = type(self)
+        with cls._formpack_schemas_lock:
+            cls._formpack_schemas.pop(self.uid, None)
+            cls._formpack_schemas[self.uid] = schema_json
+            while len(cls._formpack_schemas) > self.FORMPACK_SCHEMA_CACHE_SIZE:
+                # Evict the least recently used
+                cls._formpack_schemas.popitem(last=False)
+
     @property
     def content_hash(self):
         # used to determine changes in the content from version to version
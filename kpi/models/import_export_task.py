@@ -1,6 +1,8 @@
 import re
+import json
 import pytz
 import base64
+import hashlib
 import datetime
 import requests
 import tempfile
@@ -32,7 +34,6 @@ from ..models import Collection, Asset
 from ..zip_importer import HttpContentParse
 from ..model_utils import create_assets, _load_library_content, \
                           remove_string_prefix
-from ..deployment_backends.mock_backend import MockDeploymentBackend
 
 
 # TODO: Remove lines below (38:58) when django and django-storages are upgraded
@@ -59,6 +60,43 @@ def _flush_write_buffer(self):
 S3Boto3StorageFile._flush_write_buffer = _flush_write_buffer
 
 
+class ChunkedStorageWriter(object):
+    '''
+    Wraps a file opened for writing from a Django storage, passing data on to
+    it in chunks of at least `chunk_size` bytes (except for the last one). With
+    S3, each chunk becomes one part of a multipart upload, and every part but
+    the last must be at least 5 MB. Memory use is bounded by `chunk_size`
+    '''
+    def __init__(self, output_file, chunk_size):
+        self.output_file = output_file
+        self.chunk_size = chunk_size
+        self._buffer = []
+        self._buffer_size = 0
+
+    def write(self, data):
+        self._buffer.append(data)
+        self._buffer_size += len(data)
+        if self._buffer_size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        self.output_file.write(b''.join(self._buffer))
+        self._buffer = []
+        self._buffer_size = 0
+
+    def copy_from(self, input_file):
+        ''' Copy the remaining contents of `input_file`, one chunk at a time
+        '''
+        self.flush()
+        while True:
+            chunk = input_file.read(self.chunk_size)
+            if not chunk:
+                break
+            self.output_file.write(chunk)
+
+
 def utcnow(*args, **kwargs):
     '''
     Stupid, and exists only to facilitate mocking during unit testing.
@@ -137,17 +175,30 @@ class ImportExportTask(models.Model):
         msgs = defaultdict(list)
         try:
             # This method must be implemented by a subclass
-            self._run_task(msgs)
+            if self._run_task(msgs) == self.PROCESSING:
+                # The work was handed off to other tasks, which must call
+                # `_finish()` once they are done
+                return
             self.status = self.COMPLETE
         except Exception as err:
-            msgs['error_type'] = type(err).__name__
-            msgs['error'] = err.message
-            self.status = self.ERROR
-            logging.error(
-                'Failed to run %s: %s' % (self._meta.model_name, repr(err)),
-                exc_info=True
-            )
+            self._record_error(msgs, err)
+
+        self._finish(msgs)
 
+    def _record_error(self, msgs, err):
+        msgs['error_type'] = type(err).__name__
+        msgs['error'] = err.message
+        self.status = self.ERROR
+        logging.error(
+            'Failed to run %s: %s' % (self._meta.model_name, repr(err)),
+            exc_info=True
+        )
+
+    def _finish(self, msgs):
+        '''
+        Save `self.status` along with the given messages and the processing
+        time
+        '''
         self.messages.update(msgs)
         # Record the processing time for diagnostic purposes
         self.data['processing_time_seconds'] = (
@@ -380,6 +431,16 @@ class ExportTask(ImportExportTask):
     * `fields_from_all_versions`: optional; defaults to `True`. When `False`,
                                   only fields from the latest deployed version
                                   are included
+    * `incremental`: optional; when `true`, reuse the newest completed
+                     export of the same source with identical options and
+                     form versions, and add only the submissions whose `_id`
+                     is greater than any it contains. Edits to and deletions of older submissions are
+                     not reflected. Applies to `csv` and `spss_labels`; other
+                     types are always exported in full
+    * `shards`: set internally. When `settings.EXPORT_SHARD_SIZE` is
+                non-zero, CSV exports with more submissions than that are
+                split by `_id` into shards that are rendered by separate
+                Celery tasks and then concatenated; see `_get_shards()`
     * `tag_cols_for_header`: optional; a list of tag columns in the form
         definition to include as header rows in the export. For example, given
         the following form definition:
@@ -400,6 +461,16 @@ class ExportTask(ImportExportTask):
 
     uid = KpiUidField(uid_prefix='e')
     last_submission_time = models.DateTimeField(null=True)
+    # Greatest `_id` exported. Incremental exports continue after it, since
+    # `_submission_time` only has per-second resolution
+    last_submission_id = models.PositiveIntegerField(null=True)
+    submission_count = models.PositiveIntegerField(null=True)
+    # Identifies the source, options, and form versions of the export; see
+    # `_build_signature()`
+    signature = models.CharField(
+        max_length=40, blank=True, default='', db_index=True)
+    # Number of shards still being rendered by a sharded export
+    pending_shards = models.PositiveIntegerField(null=True)
     result = PrivateFileField(upload_to=export_upload_to, max_length=380)
 
     COPY_FIELDS = (
@@ -418,8 +489,21 @@ class ExportTask(ImportExportTask):
     }
 
     TIMESTAMP_KEY = '_submission_time'
+    # Options in `data` that change the output
+    SIGNATURE_OPTIONS = (
+        'type',
+        'lang',
+        'hierarchy_in_labels',
+        'group_sep',
+        'fields_from_all_versions',
+        'tag_cols_for_header',
+    )
+    INCREMENTAL_EXPORT_TYPES = ('csv', 'spss_labels')
     # Above 244 seems to cause 'Download error' in Chrome 64/Linux
     MAXIMUM_FILENAME_LENGTH = 240
+    # Results are written to storage in chunks of this many bytes. Must be at
+    # least 5 MB, the minimum size of an S3 multipart upload part
+    WRITE_CHUNK_SIZE = 5 * 1024 * 1024
 
     @property
     def _fields_from_all_versions(self):
@@ -504,14 +588,123 @@ class ExportTask(ImportExportTask):
             'tag_cols_for_header': tag_cols_for_header,
         }
 
+    @property
+    def _incremental(self):
+        return self.data.get('incremental', 'false').lower() == 'true'
+
+    def _build_signature(self, source):
+        '''
+        Return a hash of the source URL, the options in `self.data` that affect
+        the output, and the uids of the form versions being exported. Exports
+        with the same signature have identical columns
+        '''
+        if self._fields_from_all_versions:
+            versions = source.deployed_versions
+        else:
+            versions = source.deployed_versions[:1]
+        return hashlib.sha1(json.dumps({
+            'source': self.data.get('source'),
+            'options': {
+                option: self.data.get(option)
+                for option in self.SIGNATURE_OPTIONS
+            },
+            'versions': list(versions.values_list('uid', flat=True)),
+        }, sort_keys=True)).hexdigest()
+
+    def _get_previous_export(self):
+        '''
+        Return the newest completed export by the same user with the same
+        signature that can be extended incrementally, or `None`
+        '''
+        previous_exports = type(self).objects.filter(
+            user=self.user,
+            signature=self.signature,
+            status=self.COMPLETE,
+            last_submission_id__isnull=False,
+            submission_count__isnull=False,
+        ).exclude(pk=self.pk).order_by('-date_created')
+        for previous_export in previous_exports:
+            if previous_export.result and previous_export.result.storage.exists(
+                    previous_export.result.name):
+                return previous_export
+        return None
+
+    def find_cached_export(self, source):
+        '''
+        Return a completed export by the same user with the same signature
+        (see `_build_signature()`) whose submission count and last submission
+        time still match those of the deployment of `source`, or `None`. Its
+        result can be used instead of running this export. Edits to existing
+        submissions are not detected
+        '''
+        if not source.has_perm(self.user, 'view_submissions'):
+            # Let `_run_task()` complain
+            return None
+        self.signature = self._build_signature(source)
+        cached_exports = type(self).objects.filter(
+            user=self.user,
+            signature=self.signature,
+            status=self.COMPLETE,
+            submission_count=source.deployment.submission_count,
+        ).order_by('-date_created')
+        last_submission_time = source.deployment.last_submission_time
+        if last_submission_time is not None:
+            # `_submission_time`, and therefore `self.last_submission_time`,
+            # has only per-second resolution
+            last_submission_time = last_submission_time.replace(microsecond=0)
+        for cached_export in cached_exports:
+            if cached_export.last_submission_time != last_submission_time:
+                continue
+            if cached_export.result and cached_export.result.storage.exists(
+                    cached_export.result.name):
+                return cached_export
+        return None
+
+    @staticmethod
+    def _continue_index(export, count):
+        '''
+        formpack numbers rows from 1 in the `_index` column. Make it continue
+        after `count` instead, so that rows appended to a previous export are
+        numbered consistently. Returns `False` if that is impossible.
+        formpack has no public API for this: `Export._indexes` is relied upon
+        as of the version pinned in `dependencies/pip`, and
+        `test_formpack_export_continuation` must keep passing when upgrading
+        '''
+        indexes = getattr(export, '_indexes', None)
+        if not isinstance(indexes, dict) or len(indexes) != 1:
+            # Only a single section, as in CSV, can be continued
+            return False
+        section = next(iter(indexes))
+        indexes[section] = count + 1
+        return True
+
+    @staticmethod
+    def _count_csv_header_lines(export):
+        '''
+        Return the number of lines `export.to_csv()` yields before the first
+        submission, i.e. the column labels and any tag rows
+        '''
+        return len(list(export.to_csv([])))
+
     def _record_last_submission_time(self, submission_stream):
         '''
         Internal generator that yields each submission in the given
         `submission_stream` while recording the most recent submission
-        timestamp in `self.last_submission_time`
+        timestamp in `self.last_submission_time`, the greatest `_id` in
+        `self.last_submission_id` and the number of submissions in
+        `self.submission_count`
         '''
+        if self.submission_count is None:
+            self.submission_count = 0
         # FIXME: Mongo has only per-second resolution. Brutal.
         for submission in submission_stream:
+            self.submission_count += 1
+            submission_id = submission.get('_id')
+            if submission_id is not None and (
+                    self.last_submission_id is None or
+                    submission_id > self.last_submission_id
+            ):
+                self.last_submission_id = submission_id
             try:
                 timestamp = submission[self.TIMESTAMP_KEY]
             except KeyError:
@@ -528,6 +721,177 @@ class ExportTask(ImportExportTask):
                     self.last_submission_time = timestamp
             yield submission
 
+    def _get_shards(self, source):
+        '''
+        Split the submissions of `source`, ordered by `_id`, into shards of
+        `settings.EXPORT_SHARD_SIZE` submissions. Return a list of
+        `[first _id, number of preceding submissions]` pairs, one per shard,
+        or `None` if sharding is disabled or there is only one shard
+        '''
+        shard_size = settings.EXPORT_SHARD_SIZE
+        if not shard_size or source.deployment.submission_count <= shard_size:
+            return None
+        shards = []
+        query = {}
+        while True:
+            # Each shard starts `shard_size` submissions after the first `_id`
+            # of the previous one, so that each query only skips one shard.
+            # The count above may be inaccurate, so stop only when we run out
+            first_submission = list(source.deployment.get_submissions(
+                fields=['_id'], sort={'_id': 1}, query=query,
+                start=shard_size if shards else 0, limit=1))
+            if not first_submission:
+                break
+            first_id = first_submission[0]['_id']
+            shards.append([first_id, len(shards) * shard_size])
+            query = {'_id': {'$gte': first_id}}
+        if len(shards) < 2:
+            return None
+        return shards
+
+    def _start_shards(self, shards):
+        '''
+        Create an empty file for each of the given `shards` and queue a Celery
+        task to render each of them. The file names are appended to each shard
+        in `self.data['shards']`
+        '''
+        from kpi.tasks import export_shard_in_background
+
+        for index, shard in enumerate(shards):
+            shard.append(self.result.storage.save(
+                export_upload_to(
+                    self, u'shards/{}-{}.csv'.format(self.uid, index)),
+                ContentFile('')
+            ))
+        self.data['shards'] = shards
+        self.pending_shards = len(shards)
+        self.submission_count = 0
+        self.last_submission_time = None
+        self.last_submission_id = None
+        self.save(update_fields=[
+            'data', 'signature', 'pending_shards', 'submission_count',
+            'last_submission_time', 'last_submission_id'
+        ])
+        for index in range(len(shards)):
+            export_shard_in_background.delay(self.uid, index)
+
+    def _delete_shard_files(self):
+        for shard in self.data.get('shards', []):
+            self.result.storage.delete(shard[2])
+
+    def run_shard(self, index):
+        '''
+        Render the shard at `index` of `self.data['shards']`. The task that
+        renders the last remaining shard also merges all of them into
+        `self.result`. Suitable to be called by Celery
+        '''
+        if self.status != self.PROCESSING:
+            # Another shard has failed
+            return
+        try:
+            self._render_shard(index)
+            self._complete_shard(index)
+        except Exception as err:
+            msgs = defaultdict(list)
+            self._record_error(msgs, err)
+            self._finish(msgs)
+            self._delete_shard_files()
+
+    def _render_shard(self, index):
+        source_type, source = _resolve_url_to_asset_or_collection(
+            self.data['source'])
+        shards = self.data['shards']
+        first_id, preceding_count, shard_name = shards[index]
+        query = {'_id': {'$gte': first_id}}
+        if index + 1 < len(shards):
+            query['_id']['$lt'] = shards[index + 1][0]
+        pack, submission_stream = build_formpack(
+            source,
+            use_all_form_versions=self._fields_from_all_versions,
+            submission_filters={'query': query, 'sort': {'_id': 1}}
+        )
+        # Count only the submissions in this shard; `_complete_shard()` adds
+        # them up
+        self.submission_count = 0
+        self.last_submission_time = None
+        self.last_submission_id = None
+        submission_stream = self._record_last_submission_time(
+            submission_stream)
+
+        options = self._build_export_options(pack)
+        export = pack.export(**options)
+        if not self._continue_index(export, preceding_count):
+            raise Exception('`_index` cannot be continued across shards')
+        # Only the first shard includes the header lines
+        header_line_count = 0
+        if index > 0:
+            header_line_count = self._count_csv_header_lines(export)
+        lines = export.to_csv(submission_stream)
+        for _ in range(header_line_count):
+            next(lines)
+        with self.result.storage.open(shard_name, 'wb') as output_file:
+            writer = ChunkedStorageWriter(output_file, self.WRITE_CHUNK_SIZE)
+            for line in lines:
+                writer.write((line + u"\r\n").encode('utf-8'))
+            writer.flush()
+
+    def _complete_shard(self, index):
+        with transaction.atomic():
+            export_task = type(self).objects.select_for_update().get(
+                pk=self.pk)
+            if export_task.status != self.PROCESSING:
+                # Another shard has failed and has already cleaned up
+                self.result.storage.delete(self.data['shards'][index][2])
+                return
+            export_task.pending_shards -= 1
+            export_task.submission_count += self.submission_count
+            if self.last_submission_time is not None and (
+                export_task.last_submission_time is None or
+                self.last_submission_time > export_task.last_submission_time
+            ):
+                export_task.last_submission_time = self.last_submission_time
+            if self.last_submission_id is not None and (
+                export_task.last_submission_id is None or
+                self.last_submission_id > export_task.last_submission_id
+            ):
+                export_task.last_submission_id = self.last_submission_id
+            export_task.save(update_fields=[
+                'pending_shards', 'submission_count', 'last_submission_time',
+                'last_submission_id'])
+        if export_task.pending_shards == 0:
+            export_task._merge_shards()
+
+    def _merge_shards(self):
+        '''
+        Concatenate the files of all shards, in order, into `self.result` and
+        mark the export as complete
+        '''
+        source_type, source = _resolve_url_to_asset_or_collection(
+            self.data['source'])
+        # Only needed for the file name; no submissions are read
+        pack, _ = build_formpack(source, [], self._fields_from_all_versions)
+        export = pack.export(**self._build_export_options(pack))
+        self._create_result_file(self._build_export_filename(export, 'csv'))
+        with self.result.storage.open(self.result.name, 'wb') as output_file:
+            writer = ChunkedStorageWriter(output_file, self.WRITE_CHUNK_SIZE)
+            for shard in self.data['shards']:
+                with self.result.storage.open(shard[2], 'rb') as shard_file:
+                    writer.copy_from(shard_file)
+        self._delete_shard_files()
+        # Restore the FileField to its typical state
+        self.result.open('rb')
+        self.remove_excess(self.user, self.data['source'])
+        self.status = self.COMPLETE
+        self._finish(defaultdict(list))
+
+    def _create_result_file(self, filename):
+        self.result.save(filename, ContentFile(''))
+        # FileField files are opened read-only by default and must be
+        # closed and reopened to allow writing
+        # https://code.djangoproject.com/ticket/13809
+        self.result.close()
+        self.result.file.close()
+
     def _run_task(self, messages):
         '''
         Generate the export and store the result in the `self.result`
@@ -562,61 +926,90 @@ class ExportTask(ImportExportTask):
         # Take this opportunity to do some housekeeping
         self.log_and_mark_stuck_as_errored(self.user, source_url)
 
-        if isinstance(source.deployment, MockDeploymentBackend):
-            # Currently used only for unit testing (`MockDeploymentBackend`)
-            # TODO: Have the KC backend also implement `_get_submissions()`?
-            submission_stream = source.deployment.get_submissions()
-        else:
-            submission_stream = None
-
+        self.signature = self._build_signature(source)
+        previous_export = None
+        if self._incremental and export_type in self.INCREMENTAL_EXPORT_TYPES:
+            previous_export = self._get_previous_export()
+        if export_type == 'csv' and previous_export is None:
+            shards = self._get_shards(source)
+            if shards:
+                self._start_shards(shards)
+                return self.PROCESSING
+
+        submission_filters = {}
+        if previous_export is not None:
+            # Only submissions received since the previous export are read.
+            # `_submission_time` cannot tell apart those received in the same
+            # second as the last exported one
+            submission_filters['query'] = {
+                '_id': {'$gt': previous_export.last_submission_id}
+            }
         pack, submission_stream = build_formpack(
-            source, submission_stream, self._fields_from_all_versions)
+            source,
+            use_all_form_versions=self._fields_from_all_versions,
+            submission_filters=submission_filters
+        )
+        export = pack.export(**self._build_export_options(pack))
+        if previous_export is not None and export_type == 'csv' and \
+                not self._continue_index(
+                    export, previous_export.submission_count):
+            # Fall back to a full export
+            previous_export = None
+            pack, submission_stream = build_formpack(
+                source, use_all_form_versions=self._fields_from_all_versions)
+            export = pack.export(**self._build_export_options(pack))
+        if previous_export is not None:
+            self.last_submission_time = previous_export.last_submission_time
+            self.last_submission_id = previous_export.last_submission_id
+            self.submission_count = previous_export.submission_count
 
         # Wrap the submission stream in a generator that records the most
         # recent timestamp
         submission_stream = self._record_last_submission_time(
             submission_stream)
 
-        options = self._build_export_options(pack)
-        export = pack.export(**options)
-        filename = self._build_export_filename(export, export_type)
-        self.result.save(filename, ContentFile(''))
-        # FileField files are opened read-only by default and must be
-        # closed and reopened to allow writing
-        # https://code.djangoproject.com/ticket/13809
-        self.result.close()
-        self.result.file.close()
+        self._create_result_file(
+            self._build_export_filename(export, export_type))
         with self.result.storage.open(self.result.name, 'wb') as output_file:
+            writer = ChunkedStorageWriter(output_file, self.WRITE_CHUNK_SIZE)
+            if previous_export is not None:
+                # Start with everything exported previously
+                with previous_export.result.storage.open(
+                        previous_export.result.name, 'rb') as previous_file:
+                    writer.copy_from(previous_file)
             if export_type == 'csv':
-                for line in export.to_csv(submission_stream):
-                    output_file.write((line + u"\r\n").encode('utf-8'))
-            elif export_type == 'xls':
+                lines = export.to_csv(submission_stream)
+                if previous_export is not None:
+                    # The previous export already has the header lines
+                    header_line_count = self._count_csv_header_lines(export)
+                    for _ in range(header_line_count):
+                        next(lines)
+                for line in lines:
+                    writer.write((line + u"\r\n").encode('utf-8'))
+                writer.flush()
+            elif export_type == 'spss_labels' and previous_export is not None:
+                # Labels do not depend on submissions; the copy is complete
+                pass
+            else:
                 # XLSX export actually requires a filename (limitation of
-                # pyexcelerate?)
+                # pyexcelerate?), and the SPSS labels ZIP file must be
+                # seekable while it is written, which a multipart upload is
+                # not. Render to a temporary file, then copy it in chunks
                 with tempfile.NamedTemporaryFile(
-                        prefix='export_xlsx', mode='rb'
-                ) as xlsx_output_file:
-                    export.to_xlsx(xlsx_output_file.name, submission_stream)
-                    # TODO: chunk again once
-                    # https://github.com/jschneier/django-storages/issues/449
-                    # is fixed
-                    # TODO: Check if monkey-patch (line 57) can restore writing
-                    # by chunk
-                    '''
-                    while True:
-                        chunk = xlsx_output_file.read(5 * 1024 * 1024)
-                        if chunk:
-                            output_file.write(chunk)
-                        else:
-                            break
-                    '''
-                    output_file.write(xlsx_output_file.read())
-            elif export_type == 'spss_labels':
-                export.to_spss_labels(output_file)
+                        prefix='export_{}'.format(export_type)
+                ) as temporary_file:
+                    if export_type == 'xls':
+                        export.to_xlsx(temporary_file.name, submission_stream)
+                    elif export_type == 'spss_labels':
+                        export.to_spss_labels(temporary_file)
+                    temporary_file.seek(0)
+                    writer.copy_from(temporary_file)
 
         # Restore the FileField to its typical state
         self.result.open('rb')
-        self.save(update_fields=['last_submission_time'])
+        self.save(update_fields=[
+            'last_submission_time', 'last_submission_id', 'submission_count',
+            'signature'])
 
         # Now that a new export has completed successfully, remove any old
         # exports in excess of the per-user, per-form limit
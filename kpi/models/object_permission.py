@@ -9,6 +9,8 @@ from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.auth.models import User, AnonymousUser, Permission
 from django.core.exceptions import ValidationError, ImproperlyConfigured
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
 
 from ..fields import KpiUidField
 from ..deployment_backends.kc_access.utils import (
@@ -86,8 +88,10 @@ def get_objects_for_user(user, perms, klass=None):
             codename = perm
         codenames.add(codename)
         if app_label is not None:
-            new_ctype = ContentType.objects.get(app_label=app_label,
-                                                permission__codename=codename)
+            new_ctype = ContentType.objects.get_for_id(
+                permission_registry.get_content_type_id(
+                    permission_registry.get_id_by_app_label(
+                        app_label, codename)))
             if ctype is not None and ctype != new_ctype:
                 raise ValidationError("Computed ContentTypes do not match "
                                       "(%s != %s)" % (ctype, new_ctype))
@@ -116,23 +120,33 @@ def get_objects_for_user(user, perms, klass=None):
     # django.contrib.auth.models.AnonymousUser object doesn't work for
     # queries, and it's nice to be able to pass in request.user blindly.
     if user.is_anonymous():
-        user = get_anonymous_user()
+        user_id = settings.ANONYMOUS_USER_ID
+    else:
+        user_id = user.pk
 
-    # Now we should extract list of pk values for which we would filter queryset
-    user_obj_perms_queryset = (ObjectPermission.objects
-        .filter(user=user)
-        .filter(permission__content_type=ctype)
-        .filter(permission__codename__in=codenames)
-        .filter(deny=False))
+    # Filter the queryset with a subquery so that the database plans
+    # everything at once and no list of pks is ever sent back and forth
+    permission_ids = permission_registry.get_ids(ctype, codenames)
+    if len(permission_ids) < len(codenames):
+        # Nobody can have a permission that does not exist
+        return queryset.none()
+    user_obj_perms_queryset = ObjectPermission.objects.filter(
+        user_id=user_id,
+        content_type=ctype,
+        permission_id__in=permission_ids,
+        deny=False
+    )
 
     if len(codenames) > 1:
-        counts = user_obj_perms_queryset.values('object_id').annotate(
-            object_pk_count=models.Count('object_id'))
-        user_obj_perms_queryset = counts.filter(object_pk_count__gte=len(codenames))
+        # Each permission may be both assigned and inherited; count it once
+        user_obj_perms_queryset = user_obj_perms_queryset.values(
+            'object_id'
+        ).annotate(
+            object_perm_count=models.Count('permission_id', distinct=True)
+        ).filter(object_perm_count__gte=len(codenames))
 
-    values = user_obj_perms_queryset.values_list('object_id', flat=True)
-    values = list(values)
-    objects = queryset.filter(pk__in=values)
+    objects = queryset.filter(
+        pk__in=user_obj_perms_queryset.order_by().values('object_id'))
 
     return objects
 
@@ -154,6 +168,136 @@ def get_anonymous_user():
     return user
 
 
+class PermissionRegistry(object):
+    ''' Process-wide cache of `Permission` ids and codenames, which only
+    change when migrations run. Everything is loaded with a single query on
+    first use. A lookup that misses reloads once, in case permissions were
+    created after loading; `clear()` is also called after every migration.
+    Use the module-level `permission_registry` instance '''
+    def __init__(self):
+        self._loaded = None
+
+    def clear(self):
+        self._loaded = None
+
+    def _load(self):
+        ids = {}
+        ids_by_app_label = {}
+        codenames = {}
+        for pk, content_type_id, app_label, codename in \
+                Permission.objects.values_list(
+                    'pk', 'content_type_id', 'content_type__app_label',
+                    'codename'
+                ):
+            ids[(content_type_id, codename)] = pk
+            ids_by_app_label[(app_label, codename)] = pk
+            codenames[pk] = (content_type_id, codename)
+        # Assign in one step so that concurrent readers never see a partially
+        # loaded registry
+        self._loaded = (ids, ids_by_app_label, codenames)
+        return self._loaded
+
+    def _lookup(self, index, key):
+        loaded = self._loaded or self._load()
+        try:
+            return loaded[index][key]
+        except KeyError:
+            pass
+        try:
+            return self._load()[index][key]
+        except KeyError:
+            raise Permission.DoesNotExist(
+                'Permission matching {} does not exist.'.format(key))
+
+    @staticmethod
+    def _get_content_type_id(model_or_content_type):
+        if isinstance(model_or_content_type, ContentType):
+            return model_or_content_type.pk
+        return ContentType.objects.get_for_model(model_or_content_type).pk
+
+    def get_id(self, model_or_content_type, codename):
+        ''' Return the pk of the `Permission` with `codename` for a model,
+        model instance, or `ContentType` '''
+        return self._lookup(0, (
+            self._get_content_type_id(model_or_content_type), codename))
+
+    def get_ids(self, model_or_content_type, codenames):
+        ''' Like `get_id()`, but silently skips missing permissions '''
+        content_type_id = self._get_content_type_id(model_or_content_type)
+        ids = []
+        for codename in codenames:
+            try:
+                ids.append(self._lookup(0, (content_type_id, codename)))
+            except Permission.DoesNotExist:
+                continue
+        return ids
+
+    def get_id_by_app_label(self, app_label, codename):
+        return self._lookup(1, (app_label, codename))
+
+    def get_content_type_id(self, permission_id):
+        return self._lookup(2, permission_id)[0]
+
+    def get_codename(self, permission_id):
+        return self._lookup(2, permission_id)[1]
+
+    def get_share_ids(self, model_or_content_type):
+        ''' Return a dictionary mapping the pk of each `change_` permission
+        of a model to the pk of its `share_` counterpart '''
+        content_type_id = self._get_content_type_id(model_or_content_type)
+        ids = (self._loaded or self._load())[0]
+        share_ids = {}
+        for (ct_id, codename), pk in ids.iteritems():
+            if ct_id != content_type_id or not codename.startswith('change_'):
+                continue
+            share_codename = re.sub('^change_', 'share_', codename, 1)
+            try:
+                share_ids[pk] = ids[(content_type_id, share_codename)]
+            except KeyError:
+                continue
+        return share_ids
+
+    def get_delete_ids(self, model_or_content_type):
+        content_type_id = self._get_content_type_id(model_or_content_type)
+        return [
+            pk for (ct_id, codename), pk
+            in (self._loaded or self._load())[0].iteritems()
+            if ct_id == content_type_id and codename.startswith('delete_')
+        ]
+
+    def get_allowed_anonymous_ids(self, model_or_content_type):
+        ''' Return the pks of the permissions of a model that are listed in
+        `settings.ALLOWED_ANONYMOUS_PERMISSIONS` '''
+        content_type_id = self._get_content_type_id(model_or_content_type)
+        content_type = ContentType.objects.get_for_id(content_type_id)
+        codenames = []
+        for perm in settings.ALLOWED_ANONYMOUS_PERMISSIONS:
+            app_label, codename = perm_parse(perm)
+            if app_label == content_type.app_label:
+                codenames.append(codename)
+        return set(self.get_ids(content_type, codenames))
+
+    def translate_parent_id(self, model, parent_permission_id):
+        ''' Translate the pk of a permission on a parent object into the pk
+        of the corresponding permission on `model`, according to
+        `model.MAPPED_PARENT_PERMISSIONS`. Returns `None` if `model` does not
+        inherit that permission '''
+        parent_codename = self.get_codename(parent_permission_id)
+        try:
+            codename = model.MAPPED_PARENT_PERMISSIONS[parent_codename]
+        except KeyError:
+            return None
+        return self.get_id(model, codename)
+
+
+permission_registry = PermissionRegistry()
+
+
+@receiver(post_migrate)
+def clear_permission_registry(sender, **kwargs):
+    permission_registry.clear()
+
+
 class ObjectPermissionManager(models.Manager):
     def _rewrite_query_args(self, method, content_object, **kwargs):
         ''' Rewrite content_object into object_id and content_type, then pass
@@ -189,6 +333,66 @@ class ObjectPermissionManager(models.Manager):
         )
 
 
+class EffectivePermissionManager(ObjectPermissionManager):
+    def refresh_for_objects(self, objects):
+        ''' Rebuild the stored effective permissions of every object in
+        `objects` from its `ObjectPermission` records. Runs one query per
+        content type to read the records, plus one DELETE and one INSERT.
+        Objects may be of mixed types, but each must use
+        `ObjectPermissionMixin` '''
+        objects_by_content_type = defaultdict(dict)
+        for obj in objects:
+            content_type = ContentType.objects.get_for_model(obj)
+            objects_by_content_type[content_type][obj.pk] = obj
+        objects_and_perm_rows = []
+        for content_type, objects_by_pk in objects_by_content_type.iteritems():
+            perm_rows_by_object_id = defaultdict(list)
+            for object_id, user_id, permission_id, deny in \
+                    ObjectPermission.objects.filter(
+                        content_type=content_type,
+                        object_id__in=objects_by_pk.keys()
+                    ).values_list(
+                        'object_id', 'user_id', 'permission_id', 'deny'
+                    ):
+                perm_rows_by_object_id[object_id].append((
+                    user_id,
+                    permission_registry.get_codename(permission_id),
+                    deny
+                ))
+            for object_id, obj in objects_by_pk.iteritems():
+                objects_and_perm_rows.append(
+                    (obj, perm_rows_by_object_id[object_id]))
+        self.replace_for_objects(objects_and_perm_rows)
+
+    def replace_for_objects(
+            self, objects_and_perm_rows, stale_already_deleted=False):
+        ''' Store the effective permissions resolved from already-loaded
+        `ObjectPermission` data. `objects_and_perm_rows` is an iterable of
+        (obj, perm_rows) tuples, where `perm_rows` lists (user_id, codename,
+        deny) for every `ObjectPermission` of `obj`. Pass
+        `stale_already_deleted=True` if the caller has deleted the existing
+        records of these objects already '''
+        object_ids_by_content_type = defaultdict(list)
+        objects_to_create = []
+        for obj, perm_rows in objects_and_perm_rows:
+            content_type = ContentType.objects.get_for_model(obj)
+            object_ids_by_content_type[content_type].append(obj.pk)
+            for user_id, codename in obj._calculate_effective_perms(perm_rows):
+                objects_to_create.append(EffectivePermission(
+                    content_type=content_type,
+                    object_id=obj.pk,
+                    user_id=user_id,
+                    codename=codename
+                ))
+        if not stale_already_deleted:
+            for content_type, object_ids in \
+                    object_ids_by_content_type.iteritems():
+                self.filter(
+                    content_type=content_type, object_id__in=object_ids
+                ).delete()
+        self.bulk_create(objects_to_create)
+
+
 class ObjectPermission(models.Model):
     ''' An application of an auth.Permission instance to a specific
     content_object. Call ObjectPermission.objects.get_for_object() or
@@ -217,7 +421,8 @@ class ObjectPermission(models.Model):
             'object_id', 'content_type')
 
     def save(self, *args, **kwargs):
-        if self.permission.content_type_id is not self.content_type_id:
+        if permission_registry.get_content_type_id(
+                self.permission_id) != self.content_type_id:
             raise ValidationError('The content type of the permission does '
                 'not match that of the object.')
         super(ObjectPermission, self).save(*args, **kwargs)
@@ -234,6 +439,227 @@ class ObjectPermission(models.Model):
         )
 
 
+class EffectivePermission(models.Model):
+    ''' A denormalized, fully-resolved grant of a permission `codename` to a
+    user on a specific content_object. Deny records have already been applied,
+    and calculated permissions (`share_*`, `delete_*`) are included. Anonymous
+    users only receive rows for `settings.ALLOWED_ANONYMOUS_PERMISSIONS`.
+    These records are derived from `ObjectPermission` and must only be written
+    by `EffectivePermission.objects.refresh_for_objects()`. '''
+    user = models.ForeignKey('auth.User', related_name='+')
+    codename = models.CharField(max_length=100)
+    object_id = models.PositiveIntegerField()
+    content_type = models.ForeignKey(ContentType, related_name='+')
+    content_object = GenericForeignKey('content_type', 'object_id')
+    objects = EffectivePermissionManager()
+
+    class Meta:
+        # Also provides the index used by `ObjectPermissionMixin.has_perm()`
+        unique_together = ('content_type', 'object_id', 'codename', 'user')
+
+    def __unicode__(self):
+        return u'{} granted to {}'.format(self.codename, self.user_id)
+
+
+class PermissionPropagationManager(ObjectPermissionManager):
+    @staticmethod
+    def _get_ancestors(obj, include_self):
+        ''' Return a queryset of the MPTT ancestors of `obj`, or of its
+        parent if `obj` itself is not part of the tree, or `None` if there are
+        none '''
+        if hasattr(obj, 'get_ancestors'):
+            return obj.get_ancestors(include_self=include_self)
+        if obj.parent_id is not None:
+            return obj.parent.get_ancestors(include_self=True)
+        return None
+
+    def _filter_ancestors(self, ancestors):
+        return self.filter(
+            content_type=ContentType.objects.get_for_model(ancestors.model),
+            object_id__in=ancestors.order_by().values('pk')
+        )
+
+    def filter_pending_for_object(self, obj):
+        ''' Return the scheduled propagations whose completion will change
+        the inherited permissions of `obj` '''
+        ancestors = self._get_ancestors(obj, include_self=False)
+        if ancestors is None:
+            return self.none()
+        return self._filter_ancestors(ancestors)
+
+    def is_pending_for_object(self, obj):
+        if not settings.ASYNC_PERMISSION_PROPAGATION:
+            return False
+        return self.filter_pending_for_object(obj).exists()
+
+    def schedule(self, obj):
+        ''' Schedule the recalculation of all descendants of `obj` in the
+        background, unless a recalculation of `obj` or any of its ancestors is
+        already waiting to run, in which case that one will include our
+        changes. Must be called inside the transaction that changed the
+        permissions: the pending record is locked until that transaction
+        commits, so the task cannot start before our changes are visible '''
+        pending = list(self._filter_ancestors(
+            self._get_ancestors(obj, include_self=True)
+        ).select_for_update())
+        if pending:
+            return pending[0]
+        propagation, created = self.get_or_create_for_object(obj)
+        if created:
+            # Avoid circular import
+            from kpi.tasks import propagate_permissions_in_background
+            propagate_permissions_in_background.apply_async(
+                args=(propagation.pk,),
+                countdown=settings.PERMISSION_PROPAGATION_DELAY
+            )
+        return propagation
+
+
+class PermissionPropagation(models.Model):
+    ''' A pending background recalculation of the inherited permissions of
+    all descendants of content_object. At most one exists per object; changes
+    made while it is pending are merged into it. See
+    `ObjectPermissionMixin._propagate_perms_to_descendants()` '''
+    object_id = models.PositiveIntegerField()
+    content_type = models.ForeignKey(ContentType, related_name='+')
+    content_object = GenericForeignKey('content_type', 'object_id')
+    date_created = models.DateTimeField(auto_now_add=True)
+    objects = PermissionPropagationManager()
+
+    class Meta:
+        unique_together = ('content_type', 'object_id')
+
+    def run(self):
+        ''' Recalculate the descendants of `content_object`, then remove this
+        pending record in the same transaction: it stays pending while the
+        recalculation runs, and is kept if the recalculation fails. Called by
+        the Celery task '''
+        with transaction.atomic():
+            # Wait for any transaction that merged its changes into this
+            # propagation to commit. Until we commit, new changes wait for us
+            # and then schedule a propagation of their own
+            list(type(self).objects.select_for_update().filter(
+                pk=self.pk).values_list('pk', flat=True))
+            obj = self.content_object
+            if obj is not None:
+                if hasattr(obj, 'get_root'):
+                    # Serialize propagations within the same tree
+                    list(type(obj).objects.select_for_update().filter(
+                        pk=obj.get_root().pk).values_list('pk', flat=True))
+                type(obj).objects.get(
+                    pk=obj.pk).recalculate_descendants_perms()
+            self.delete()
+
+    def __unicode__(self):
+        return u'pending propagation for {} {}'.format(
+            self.content_type.model, self.object_id)
+
+
+class ObjectPermissionResolver(object):
+    ''' Answers `has_perm()` and `get_perms()` for a single user from memory.
+    `EffectivePermission` records are loaded for many objects at once by
+    `prefetch()`, or for one object on its first use. Permission changes made
+    after loading are not noticed, so an instance should not outlive a
+    request. '''
+    def __init__(self, user):
+        self.user = user
+        if isinstance(user, AnonymousUser) or (
+            user.pk == settings.ANONYMOUS_USER_ID
+        ):
+            self.is_anonymous = True
+            self.user_ids = (settings.ANONYMOUS_USER_ID,)
+        else:
+            self.is_anonymous = False
+            # The public's access also counts
+            self.user_ids = (user.pk, settings.ANONYMOUS_USER_ID)
+        # {(content_type_id, object_id): {user_id: set of codenames}}
+        self._perms = {}
+        # {(perm, model): (app_label, codename)}
+        self._parsed_perms = {}
+
+    @staticmethod
+    def _get_key(obj):
+        return ContentType.objects.get_for_model(obj).pk, obj.pk
+
+    def _parse_perm(self, perm, obj):
+        try:
+            return self._parsed_perms[(perm, type(obj))]
+        except KeyError:
+            parsed_perm = perm_parse(perm, obj)
+            self._parsed_perms[(perm, type(obj))] = parsed_perm
+            return parsed_perm
+
+    def prefetch(self, objects):
+        ''' Load the effective permissions of the user (and of the anonymous
+        user) for every object in `objects` using a single query. Objects
+        loaded previously are skipped '''
+        object_ids_by_content_type_id = defaultdict(list)
+        for obj in objects:
+            key = self._get_key(obj)
+            if key in self._perms:
+                continue
+            self._perms[key] = defaultdict(set)
+            object_ids_by_content_type_id[key[0]].append(key[1])
+        if not object_ids_by_content_type_id:
+            return
+        objects_query = models.Q()
+        for content_type_id, object_ids in \
+                object_ids_by_content_type_id.iteritems():
+            objects_query |= models.Q(
+                content_type_id=content_type_id, object_id__in=object_ids)
+        for content_type_id, object_id, user_id, codename in \
+                EffectivePermission.objects.filter(
+                    objects_query, user_id__in=self.user_ids
+                ).values_list(
+                    'content_type_id', 'object_id', 'user_id', 'codename'
+                ):
+            self._perms[(content_type_id, object_id)][user_id].add(codename)
+
+    def _get_perms_by_user_id(self, obj):
+        key = self._get_key(obj)
+        if key not in self._perms:
+            self.prefetch([obj])
+        return self._perms[key]
+
+    def has_perm(self, obj, perm):
+        ''' Same as `user.has_perm(perm, obj)` when authenticating with
+        `kpi.backends.ObjectPermissionBackend` '''
+        app_label, codename = self._parse_perm(perm, obj)
+        if self.is_anonymous:
+            # Is an anonymous user allowed to have this permission?
+            fq_permission = '{}.{}'.format(app_label, codename)
+            if not fq_permission in settings.ALLOWED_ANONYMOUS_PERMISSIONS:
+                return False
+        else:
+            # Inactive users are denied immediately, but treat superusers the
+            # way django.contrib.auth does
+            if not self.user.is_active:
+                return False
+            if self.user.is_superuser:
+                return True
+        if codename.startswith('share_') and \
+                not obj.editors_can_change_permissions:
+            return False
+        perms_by_user_id = self._get_perms_by_user_id(obj)
+        for user_id in self.user_ids:
+            if codename in perms_by_user_id[user_id]:
+                return True
+        return False
+
+    def has_perms(self, obj, perms):
+        for perm in perms:
+            if not self.has_perm(obj, perm):
+                return False
+        return True
+
+    def get_perms(self, obj):
+        ''' Same as `obj.get_perms(user)` '''
+        codenames = self._get_perms_by_user_id(obj)[self.user_ids[0]]
+        if obj.editors_can_change_permissions:
+            return list(codenames)
+        return [c for c in codenames if not c.startswith('share_')]
+
+
 class ObjectPermissionMixin(object):
     ''' A mixin class that adds the methods necessary for object-level
     permissions to a model (either models.Model or MPTTModel). The model must
@@ -282,32 +708,64 @@ class ObjectPermissionMixin(object):
         else:
             return False
 
+    # Inherited permissions only depend on these fields; saving changes to
+    # anything else does not require recalculation
+    PERMISSION_TRACKED_FIELDS = ('owner_id', 'parent_id')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(ObjectPermissionMixin, cls).from_db(
+            db, field_names, values)
+        instance._remember_permission_tracked_fields()
+        return instance
+
+    def _remember_permission_tracked_fields(self):
+        ''' Store the current values of `PERMISSION_TRACKED_FIELDS`, skipping
+        any that are deferred so as not to load them from the database '''
+        self._saved_permission_tracked_fields = {
+            attname: self.__dict__[attname]
+            for attname in self.PERMISSION_TRACKED_FIELDS
+            if attname in self.__dict__
+        }
+        # Also detect copies made by resetting the primary key
+        self._saved_permission_tracked_fields['pk'] = self.pk
+
+    def _permission_tracked_fields_changed(self):
+        ''' Return `True` unless this object was loaded from the database and
+        none of `PERMISSION_TRACKED_FIELDS` have changed since then '''
+        if self._state.adding or self.pk is None:
+            return True
+        try:
+            saved_values = self._saved_permission_tracked_fields
+        except AttributeError:
+            return True
+        for attname in ('pk',) + self.PERMISSION_TRACKED_FIELDS:
+            if attname not in saved_values or \
+                    saved_values[attname] != getattr(self, attname):
+                return True
+        return False
+
     @transaction.atomic
     def save(self, *args, **kwargs):
+        needs_recalculation = self._permission_tracked_fields_changed()
         # Make sure we exist in the database before proceeding
         super(ObjectPermissionMixin, self).save(*args, **kwargs)
+        if not needs_recalculation:
+            # A trivial modification, e.g. a collection was renamed
+            return
         # Recalculate self and all descendants, re-fetching ourself first to
         # guard against stale MPTT values
         fresh_self = type(self).objects.get(pk=self.pk)
-        # TODO: Don't do this when the modification is trivial, e.g. a
-        # collection was renamed
         fresh_self._recalculate_inherited_perms()
-        fresh_self.recalculate_descendants_perms()
+        fresh_self._propagate_perms_to_descendants()
+        self._remember_permission_tracked_fields()
 
     def _filter_anonymous_perms(self, unfiltered_set):
         ''' Restrict a set of tuples in the format (user_id, permission_id) to
         only those permissions that apply to the content_type of this object
         and are listed in settings.ALLOWED_ANONYMOUS_PERMISSIONS. '''
-        content_type = ContentType.objects.get_for_model(self)
-        # Translate settings.ALLOWED_ANONYMOUS_PERMISSIONS to primary keys
-        codenames = set()
-        for perm in settings.ALLOWED_ANONYMOUS_PERMISSIONS:
-            app_label, codename = perm_parse(perm)
-            if app_label == content_type.app_label:
-                codenames.add(codename)
-        allowed_permissions = Permission.objects.filter(
-            content_type=content_type, codename__in=codenames
-        ).values_list('pk', flat=True)
+        allowed_permissions = permission_registry.get_allowed_anonymous_ids(
+            self)
         filtered_set = copy.copy(unfiltered_set)
         for user_id, permission_id in unfiltered_set:
             if user_id == settings.ANONYMOUS_USER_ID:
@@ -315,6 +773,65 @@ class ObjectPermissionMixin(object):
                     filtered_set.remove((user_id, permission_id))
         return filtered_set
 
+    def _get_allowed_anonymous_codenames(self):
+        ''' Return the set of codenames in settings.ALLOWED_ANONYMOUS_PERMISSIONS
+        that apply to the app of this object '''
+        codenames = set()
+        for perm in settings.ALLOWED_ANONYMOUS_PERMISSIONS:
+            app_label, codename = perm_parse(perm)
+            if app_label == self._meta.app_label:
+                codenames.add(codename)
+        return codenames
+
+    def _calculate_effective_perms(self, perm_rows):
+        ''' Resolve `perm_rows`, an iterable of (user_id, codename, deny)
+        tuples for every `ObjectPermission` of this object, into a set of
+        (user_id, codename) effective grants. Follows the same rules as
+        `_get_effective_perms()` but does not query the database. `share_`
+        permissions are included for every editor regardless of
+        `editors_can_change_permissions`; readers of `EffectivePermission`
+        apply that flag themselves, since it is often toggled on unsaved
+        instances. '''
+        grant_perms = set()
+        deny_perms = set()
+        for user_id, codename, deny in perm_rows:
+            if deny:
+                deny_perms.add((user_id, codename))
+            else:
+                grant_perms.add((user_id, codename))
+        effective_perms = grant_perms.difference(deny_perms)
+        # Everyone with change_ should also get share_
+        for user_id, codename in list(effective_perms):
+            if not codename.startswith('change_'):
+                continue
+            share_codename = re.sub('^change_', 'share_', codename, 1)
+            if share_codename in self.CALCULATED_PERMISSIONS:
+                effective_perms.add((user_id, share_codename))
+        # The owner has the delete_ permission
+        if self.owner_id is not None:
+            for codename in self.CALCULATED_PERMISSIONS:
+                if codename.startswith('delete_'):
+                    effective_perms.add((self.owner_id, codename))
+        # Anonymous users may not have everything calculated above
+        allowed_anonymous_codenames = self._get_allowed_anonymous_codenames()
+        return {
+            (user_id, codename) for user_id, codename in effective_perms
+            if user_id != settings.ANONYMOUS_USER_ID or
+            codename in allowed_anonymous_codenames
+        }
+
+    def refresh_effective_perms(self):
+        ''' Rebuild the `EffectivePermission` records for this object. Must be
+        called whenever this object's `ObjectPermission` records change '''
+        EffectivePermission.objects.refresh_for_objects([self])
+
+    def _exclude_masked_effective_perms(self, queryset):
+        ''' `share_` permissions are stored for all editors; hide them when
+        editors may not change permissions '''
+        if self.editors_can_change_permissions:
+            return queryset
+        return queryset.exclude(codename__startswith='share_')
+
     def _get_effective_perms(
         self, user=None, codename=None, include_calculated=True
     ):
@@ -351,7 +868,6 @@ class ObjectPermissionMixin(object):
                 return effective_perms
 
         # Add on the calculated permissions
-        content_type = ContentType.objects.get_for_model(self)
         if codename in self.CALCULATED_PERMISSIONS:
             # A sepecific query for a calculated permission should not return
             # any explicitly assigned permissions, e.g. share_ should not
@@ -364,45 +880,35 @@ class ObjectPermissionMixin(object):
                 codename is None or codename.startswith('share_')
         ):
             # Everyone with change_ should also get share_
-            change_permissions = Permission.objects.filter(
-                content_type=content_type,
-                codename__startswith='change_'
-            )
-            for change_permission in change_permissions:
-                share_permission_codename = re.sub(
-                    '^change_', 'share_', change_permission.codename, 1)
+            for change_permission_id, share_permission_id in \
+                    permission_registry.get_share_ids(self).iteritems():
                 if (codename is not None and
-                        share_permission_codename != codename
+                        permission_registry.get_codename(
+                            share_permission_id) != codename
                 ):
                     # If the caller specified `codename`, skip anything that
                     # doesn't match exactly. Necessary because `Asset` has
                     # `*_submissions` in addition to `*_asset`
                     continue
-                share_permission = Permission.objects.get(
-                    content_type=content_type,
-                    codename=share_permission_codename
-                )
                 for user_id, permission_id in effective_perms_copy:
-                    if permission_id == change_permission.pk:
-                        effective_perms.add((user_id, share_permission.pk))
+                    if permission_id == change_permission_id:
+                        effective_perms.add((user_id, share_permission_id))
         # The owner has the delete_ permission
-        if self.owner is not None and (
-                user is None or user.pk == self.owner.pk) and (
+        if self.owner_id is not None and (
+                user is None or user.pk == self.owner_id) and (
                 codename is None or codename.startswith('delete_')
         ):
-            delete_permissions = Permission.objects.filter(
-                content_type=content_type,
-                codename__startswith='delete_'
-            )
-            for delete_permission in delete_permissions:
+            for delete_permission_id in permission_registry.get_delete_ids(
+                    self):
                 if (codename is not None and
-                        delete_permission.codename != codename
+                        permission_registry.get_codename(
+                            delete_permission_id) != codename
                 ):
                     # If the caller specified `codename`, skip anything that
                     # doesn't match exactly. Necessary because `Asset` has
                     # `delete_submissions` in addition to `delete_asset`
                     continue
-                effective_perms.add((self.owner.pk, delete_permission.pk))
+                effective_perms.add((self.owner_id, delete_permission_id))
         # We may have calculated more permissions for anonymous users
         # than they are allowed to have. Remove them.
         if user is None or user.pk == settings.ANONYMOUS_USER_ID:
@@ -414,7 +920,8 @@ class ObjectPermissionMixin(object):
     def recalculate_descendants_perms(self):
         ''' Recalculate the inherited permissions of all descendants. Expects
         either self.get_mixed_children() or self.get_children() to exist. The
-        former will be used preferentially if it exists. '''
+        former will be used preferentially if it exists. `Collection`
+        overrides this with a set-based version that uses its MPTT fields '''
 
         GET_CHILDREN_METHODS = ('get_mixed_children', 'get_children')
         can_have_children = False
@@ -444,7 +951,7 @@ class ObjectPermissionMixin(object):
                 if hasattr(parent, method):
                     break
             children = getattr(parent, method)().only(
-                'pk', 'owner', 'parent')
+                'pk', 'owner', 'parent', 'editors_can_change_permissions')
             # Delete stale permissions once per parent, instead of per-child
             # TODO: Um, don't have two loops?
             delete_pks_by_content_type = {}
@@ -485,13 +992,26 @@ class ObjectPermissionMixin(object):
                 )
                 objects_to_create += new_permissions
             ObjectPermission.objects.bulk_create(objects_to_create)
+            EffectivePermission.objects.refresh_for_objects(children)
+
+    def _propagate_perms_to_descendants(self):
+        ''' Recalculate the inherited permissions of all descendants now or,
+        if `settings.ASYNC_PERMISSION_PROPAGATION` is enabled, in a Celery
+        task. In the latter case, descendants keep their old permissions
+        until the task completes; `PermissionPropagation.objects.
+        is_pending_for_object()` reports whether that is the case. `self`
+        should be fresh from the database '''
+        if settings.ASYNC_PERMISSION_PROPAGATION and \
+                hasattr(self, 'get_descendants'):
+            PermissionPropagation.objects.schedule(self)
+        else:
+            self.recalculate_descendants_perms()
 
     def _recalculate_inherited_perms(
             self,
             parent_effective_perms=None,
             stale_already_deleted=False,
-            return_instead_of_creating=False,
-            translate_perm={} # mutable default parameter serves as cache
+            return_instead_of_creating=False
     ):
         ''' Copy all of our parent's effective permissions to ourself,
         marking the copies as inherited permissions. The owner's rights are
@@ -508,17 +1028,15 @@ class ObjectPermissionMixin(object):
             # if we use it when we're not supposed to
             objects_to_return = []
         # The owner gets every assignable permission
-        if self.owner is not None:
-            for perm in Permission.objects.filter(
-                content_type=content_type,
-                codename__in=self.get_assignable_permissions()
-            ):
+        if self.owner_id is not None:
+            for permission_id in permission_registry.get_ids(
+                    content_type, self.get_assignable_permissions()):
                 new_permission = ObjectPermission()
                 new_permission.content_object = self
                 # `user_id` instead of `user` is another workaround for
                 # migrations
                 new_permission.user_id = self.owner_id
-                new_permission.permission = perm
+                new_permission.permission_id = permission_id
                 new_permission.inherited = True
                 new_permission.uid = new_permission._meta.get_field(
                     'uid').generate_uid()
@@ -534,32 +1052,18 @@ class ObjectPermissionMixin(object):
                 parent_effective_perms = self.parent._get_effective_perms(
                     include_calculated=False)
             # All our parent's effective permissions become our inherited
-            # permissions. Store translations in the translate_perm dictionary
-            # to minimize invocations of the Django machinery
+            # permissions
             for user_id, permission_id in parent_effective_perms:
                 if user_id == self.owner_id:
                     # The owner already has every assignable permission
                     continue
                 if hasattr(self, 'MAPPED_PARENT_PERMISSIONS'):
-                    try:
-                        translated_id = translate_perm[permission_id]
-                    except KeyError:
-                        parent_perm = Permission.objects.get(pk=permission_id)
-                        try:
-                            translated_codename = \
-                                self.MAPPED_PARENT_PERMISSIONS[
-                                    parent_perm.codename]
-                        except KeyError:
-                            # We haven't been configured to inherit this
-                            # permission from our parent, so skip it
-                            continue
-                        translated_id = Permission.objects.get(
-                            content_type__app_label=\
-                                parent_perm.content_type.app_label,
-                            codename=translated_codename
-                        ).pk
-                        translate_perm[permission_id] = translated_id
-                    permission_id = translated_id
+                    permission_id = permission_registry.translate_parent_id(
+                        type(self), permission_id)
+                    if permission_id is None:
+                        # We haven't been configured to inherit this
+                        # permission from our parent, so skip it
+                        continue
                 elif content_type != ContentType.objects.get_for_model(
                         self.parent
                 ):
@@ -581,6 +1085,7 @@ class ObjectPermissionMixin(object):
                     new_permission.save()
         if return_instead_of_creating:
             return objects_to_return
+        self.refresh_effective_perms()
 
     def _get_implied_perms(self, explicit_perm, reverse=False):
         """ Determine which permissions are implied by `explicit_perm` based on
@@ -629,7 +1134,8 @@ class ObjectPermissionMixin(object):
             :param perm str: The `codename` of the `Permission`
             :param deny bool: When `True`, break inheritance from parent object
             :param defer_recalc bool: When `True`, skip recalculating
-                descendants
+                descendants and refreshing the effective permissions of this
+                object
             :param skip_kc bool: When `True`, skip assignment of applicable KC
                 permissions
         """
@@ -652,17 +1158,15 @@ class ObjectPermissionMixin(object):
                 )
             # Get the User database representation for AnonymousUser
             user_obj = get_anonymous_user()
-        perm_model = Permission.objects.get(
-            content_type__app_label=app_label,
-            codename=codename
-        )
+        permission_id = permission_registry.get_id_by_app_label(
+            app_label, codename)
         existing_perms = ObjectPermission.objects.filter_for_object(
             self,
             user=user_obj,
         )
         identical_existing_perm = existing_perms.filter(
             inherited=False,
-            permission_id=perm_model.pk,
+            permission_id=permission_id,
             deny=deny,
         )
         if identical_existing_perm.exists():
@@ -670,12 +1174,14 @@ class ObjectPermissionMixin(object):
             return identical_existing_perm.first()
         # Remove any explicitly-defined contradictory grants or denials
         contradictory_perms = existing_perms.filter(user=user_obj,
-            permission_id=perm_model.pk,
+            permission_id=permission_id,
             deny=not deny,
             inherited=False
         )
-        contradictory_codenames = list(contradictory_perms.values_list(
-            'permission__codename', flat=True))
+        contradictory_codenames = [
+            permission_registry.get_codename(pk) for pk in
+            contradictory_perms.values_list('permission_id', flat=True)
+        ]
         contradictory_perms.delete()
         # Check if any KC permissions should be removed as well
         if deny and not skip_kc:
@@ -685,7 +1191,7 @@ class ObjectPermissionMixin(object):
         new_permission = ObjectPermission.objects.create(
             content_object=self,
             user=user_obj,
-            permission_id=perm_model.pk,
+            permission_id=permission_id,
             deny=deny,
             inherited=False
         )
@@ -702,66 +1208,68 @@ class ObjectPermissionMixin(object):
         # permission. In that case, don't recalculate here.
         if defer_recalc:
             return new_permission
+        self.refresh_effective_perms()
         # Recalculate all descendants, re-fetching ourself first to guard
         # against stale MPTT values
         fresh_self = type(self).objects.get(pk=self.pk)
-        fresh_self.recalculate_descendants_perms()
+        fresh_self._propagate_perms_to_descendants()
         return new_permission
 
     def get_perms(self, user_obj):
         ''' Return a list of codenames of all effective grant permissions that
         user_obj has on this object. '''
-        user_perm_ids = self._get_effective_perms(user=user_obj)
-        perm_ids = [x[1] for x in user_perm_ids]
-        return Permission.objects.filter(pk__in=perm_ids).values_list(
-            'codename', flat=True)
+        if isinstance(user_obj, AnonymousUser):
+            user_id = settings.ANONYMOUS_USER_ID
+        else:
+            user_id = user_obj.pk
+        return self._exclude_masked_effective_perms(
+            EffectivePermission.objects.filter_for_object(self, user_id=user_id)
+        ).values_list('codename', flat=True)
 
     def get_users_with_perms(self, attach_perms=False):
         ''' Return a QuerySet of all users with any effective grant permission
         on this object. If attach_perms=True, then return a dict with
         users as the keys and lists of their permissions as the values. '''
-        user_perm_ids = self._get_effective_perms()
+        effective_perms = self._exclude_masked_effective_perms(
+            EffectivePermission.objects.filter_for_object(self))
         if attach_perms:
-            user_perm_dict = {}
-            for user_id, perm_id in user_perm_ids:
-                perm_list = user_perm_dict.get(user_id, [])
-                perm_list.append(Permission.objects.get(pk=perm_id).codename)
-                user_perm_dict[user_id] = perm_list
+            user_perm_dict = defaultdict(list)
+            for user_id, codename in effective_perms.values_list(
+                    'user_id', 'codename'):
+                user_perm_dict[user_id].append(codename)
             # Resolve user ids into actual user objects
-            user_perm_dict = {User.objects.get(pk=key): value for (key, value)
-                in user_perm_dict.iteritems()}
-            return user_perm_dict
+            return {user: user_perm_dict[user.pk] for user in
+                User.objects.filter(pk__in=user_perm_dict.keys())}
         else:
-            # Use a set to avoid duplicate users
-            user_ids = {x[0] for x in user_perm_ids}
-            return User.objects.filter(pk__in=user_ids)
+            return User.objects.filter(
+                pk__in=effective_perms.values('user_id'))
 
     def has_perm(self, user_obj, perm):
         ''' Does user_obj have perm on this object? (True/False) '''
         app_label, codename = perm_parse(perm, self)
-        is_anonymous = False
-        if isinstance(user_obj, AnonymousUser):
-            # Get the User database representation for AnonymousUser
-            user_obj = get_anonymous_user()
-        if user_obj.pk == settings.ANONYMOUS_USER_ID:
-            is_anonymous = True
-        # Treat superusers the way django.contrib.auth does
-        if user_obj.is_active and user_obj.is_superuser:
-            return True
-        # Look for matching permissions
-        result = len(self._get_effective_perms(
-            user=user_obj,
-            codename=codename
-        )) == 1
-        if not result and not is_anonymous:
-            # The user-specific test failed, but does the public have access?
-            result = self.has_perm(AnonymousUser(), perm)
-        if result and is_anonymous:
+        if isinstance(user_obj, AnonymousUser) or (
+            user_obj.pk == settings.ANONYMOUS_USER_ID
+        ):
             # Is an anonymous user allowed to have this permission?
             fq_permission = '{}.{}'.format(app_label, codename)
             if not fq_permission in settings.ALLOWED_ANONYMOUS_PERMISSIONS:
                 return False
-        return result
+            user_ids = [settings.ANONYMOUS_USER_ID]
+        else:
+            # Treat superusers the way django.contrib.auth does
+            if user_obj.is_active and user_obj.is_superuser:
+                return True
+            # The public's access also counts
+            user_ids = [user_obj.pk, settings.ANONYMOUS_USER_ID]
+        if codename.startswith('share_') and \
+                not self.editors_can_change_permissions:
+            return False
+        # Look for matching permissions
+        return EffectivePermission.objects.filter_for_object(
+            self,
+            user_id__in=user_ids,
+            codename=codename
+        ).exists()
 
     @transaction.atomic
     def remove_perm(self, user_obj, perm, defer_recalc=False, skip_kc=False):
@@ -779,7 +1287,8 @@ class ObjectPermissionMixin(object):
             :type user_obj: :py:class:`User` or :py:class:`AnonymousUser`
             :param perm str: The `codename` of the `Permission`
             :param defer_recalc bool: When `True`, skip recalculating
-                descendants
+                descendants and refreshing the effective permissions of this
+                object
             :param skip_kc bool: When `True`, skip assignment of applicable KC
                 permissions
         """
@@ -820,7 +1329,8 @@ class ObjectPermissionMixin(object):
         # permission. In that case, don't recalculate here.
         if defer_recalc:
             return
+        self.refresh_effective_perms()
         # Recalculate all descendants, re-fetching ourself first to guard
         # against stale MPTT values
         fresh_self = type(self).objects.get(pk=self.pk)
-        fresh_self.recalculate_descendants_perms()
+        fresh_self._propagate_perms_to_descendants()
@@ -0,0 +1,172 @@
+import json
+import hashlib
+
+from jsonfield import JSONField
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+from kobo.apps.reports.report_data import build_formpack, get_report_stats
+
+
+class ReportStatistics(models.Model):
+    '''
+    The statistics of the fields of a deployed asset, as returned by
+    `kobo.apps.reports.report_data.get_report_stats()`, stored so that
+    reports do not read every submission on each request. Fields are added
+    as they are first requested. The submission count, the time of the
+    newest submission, and the deployed versions at the time of the last
+    calculation tell whether they are still current
+    '''
+    asset = models.ForeignKey('Asset', related_name='report_statistics',
+                              on_delete=models.CASCADE)
+    # The name of the select one question used to split the statistics, if
+    # any
+    split_by = models.CharField(max_length=255, blank=True, default='')
+    data = JSONField(default=[])
+    # A hash of the uids of the deployed versions
+    signature = models.CharField(max_length=40, blank=True, default='')
+    submission_count = models.PositiveIntegerField(default=0)
+    last_submission_time = models.DateTimeField(null=True)
+    date_modified = models.DateTimeField(auto_now=True)
+
+    REFRESH_CACHE_KEY = 'report-statistics-refresh-{}'
+    # Set from `_get_watermark()`
+    WATERMARK_ATTRIBUTES = ('signature', 'submission_count',
+                            'last_submission_time')
+
+    class Meta:
+        unique_together = ('asset', 'split_by')
+
+    @classmethod
+    def get_stats(cls, asset, split_by=None, field_names=None):
+        '''
+        Return the statistics of the fields of `asset` named in `field_names`,
+        or of all its fields if `None`. Only fields that were never requested
+        before are calculated now; out-of-date statistics are returned as they
+        are and refreshed in the background, see `schedule_refresh()`
+        '''
+        try:
+            statistics = cls.objects.get(asset=asset, split_by=split_by or '')
+        except cls.DoesNotExist:
+            statistics = cls(asset=asset, split_by=split_by or '')
+        known_field_names = None
+        if field_names is None:
+            field_names = known_field_names = statistics._get_field_names()
+        stats_by_name = dict((stat['name'], stat) for stat in statistics.data)
+        missing_field_names = [
+            name for name in field_names if name not in stats_by_name]
+        if missing_field_names and known_field_names is None:
+            # Names that are not fields of `asset` would never be stored
+            known_field_names = set(statistics._get_field_names())
+            missing_field_names = [name for name in missing_field_names
+                                   if name in known_field_names]
+        if missing_field_names:
+            statistics.add_fields(missing_field_names)
+            stats_by_name = dict(
+                (stat['name'], stat) for stat in statistics.data)
+        elif not statistics.is_current():
+            cls.schedule_refresh(asset)
+        return [stats_by_name[name] for name in field_names
+                if name in stats_by_name]
+
+    @classmethod
+    def schedule_refresh(cls, asset):
+        '''
+        Refresh, in the background, the existing statistics of `asset`. New
+        submissions that arrive within `REPORT_STATISTICS_REFRESH_DELAY`
+        seconds are counted by the same refresh
+        '''
+        # Avoid circular import
+        from kpi.tasks import refresh_report_statistics
+        if not cls.objects.filter(asset=asset).exists():
+            # Nobody has looked at the reports yet
+            return
+        delay = settings.REPORT_STATISTICS_REFRESH_DELAY
+        if cache.add(cls.REFRESH_CACHE_KEY.format(asset.uid), True, delay):
+            refresh_report_statistics.apply_async(
+                args=(asset.uid,), countdown=delay)
+
+    def _get_watermark(self):
+        deployment = self.asset.deployment
+        return {
+            'signature': hashlib.sha1(json.dumps(list(
+                self.asset.deployed_versions.values_list('uid', flat=True)
+            ))).hexdigest(),
+            'submission_count': deployment.submission_count,
+            'last_submission_time': deployment.last_submission_time,
+        }
+
+    def is_current(self, watermark=None):
+        if self.pk is None:
+            return False
+        if watermark is None:
+            watermark = self._get_watermark()
+        return all(
+            getattr(self, attribute) == value
+            for attribute, value in watermark.items()
+        )
+
+    def _get_field_names(self):
+        ''' Names of all the fields of the deployed versions of the asset '''
+        pack, _ = build_formpack(self.asset, submission_stream=[])
+        return [field.name for field in
+                pack.get_fields_for_versions(versions=pack.versions.keys())]
+
+    def _calculate(self, field_names):
+        ''' Read only the submission fields needed by `field_names`, and
+        return what the JSON field loads (lists, not tuples), so that fresh
+        and stored statistics are the same '''
+        return json.loads(json.dumps(
+            get_report_stats(self.asset, field_names=field_names,
+                             split_by=self.split_by or None),
+            cls=DjangoJSONEncoder
+        ))
+
+    def _save(self, watermark=None):
+        if watermark is not None:
+            for attribute, value in watermark.items():
+                setattr(self, attribute, value)
+        defaults = dict(
+            (attribute, getattr(self, attribute))
+            for attribute in self.WATERMARK_ATTRIBUTES
+        )
+        defaults['data'] = self.data
+        # Another request may have calculated the same statistics meanwhile
+        self.pk = type(self).objects.update_or_create(
+            asset=self.asset, split_by=self.split_by, defaults=defaults
+        )[0].pk
+
+    def add_fields(self, field_names):
+        '''
+        Calculate and store the statistics of `field_names`, which have none
+        yet. The others keep their watermark: if they are out of date, they
+        all remain so until the next refresh
+        '''
+        watermark = self._get_watermark()
+        if self.pk is not None and not self.is_current(watermark):
+            type(self).schedule_refresh(self.asset)
+            watermark = None
+        self.data = self.data + self._calculate(field_names)
+        self._save(watermark)
+
+    def refresh(self, force=False):
+        '''
+        Recalculate and save the statistics of the stored fields unless they
+        are current. Return `True` if they were recalculated
+        '''
+        # Taken before reading the submissions: one that arrives during the
+        # calculation causes another refresh later instead of being missed
+        watermark = self._get_watermark()
+        if not force and self.is_current(watermark):
+            return False
+        self.data = self._calculate([stat['name'] for stat in self.data])
+        self._save(watermark)
+        return True
+
+    def __unicode__(self):
+        return u'report statistics for {}{}'.format(
+            self.asset.uid,
+            u' split by {}'.format(self.split_by) if self.split_by else u''
+        )
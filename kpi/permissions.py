@@ -6,6 +6,7 @@ from rest_framework import exceptions, permissions
 from rest_framework_extensions.settings import extensions_api_settings
 
 from kpi.models.asset import Asset
+from kpi.models.object_permission import ObjectPermissionResolver
 
 
 # FIXME: Move to `object_permissions` module.
@@ -33,6 +34,24 @@ def get_perm_name(perm_name_prefix, model_instance):
     return perm_name
 
 
+def get_permission_resolver(request):
+    '''
+    Get the :py:class:`ObjectPermissionResolver` for `request.user`, creating
+    it on first use so that every permission check made while handling
+    `request` shares the same in-memory permissions.
+
+    :param request: The current request.
+    :type request: :py:class:`rest_framework.request.Request` or
+        :py:class:`django.http.HttpRequest`
+    :rtype: :py:class:`ObjectPermissionResolver`
+    '''
+    resolver = getattr(request, '_permission_resolver', None)
+    if resolver is None or resolver.user != request.user:
+        resolver = ObjectPermissionResolver(request.user)
+        request._permission_resolver = resolver
+    return resolver
+
+
 # FIXME: Name is no longer accurate.
 class IsOwnerOrReadOnly(permissions.DjangoObjectPermissions):
 
@@ -49,6 +68,24 @@ class IsOwnerOrReadOnly(permissions.DjangoObjectPermissions):
     perms_map['OPTIONS'] = perms_map['GET']
     perms_map['HEAD'] = perms_map['GET']
 
+    def has_object_permission(self, request, view, obj):
+        # Same logic as `DjangoObjectPermissions`, but the checks are answered
+        # by the request's permission resolver instead of `user.has_perms()`
+        resolver = get_permission_resolver(request)
+        model_cls = type(obj)
+        perms = self.get_required_object_permissions(request.method, model_cls)
+        if resolver.has_perms(obj, perms):
+            return True
+        # If the user does not have permissions we need to determine if
+        # they have read permissions to see 403, or not, and simply see a 404
+        if request.method in permissions.SAFE_METHODS:
+            raise Http404
+        read_perms = self.get_required_object_permissions('GET', model_cls)
+        if not resolver.has_perms(obj, read_perms):
+            raise Http404
+        # Has read permissions.
+        return False
+
 
 class PostMappedToChangePermission(IsOwnerOrReadOnly):
     '''
@@ -151,14 +188,15 @@ class SubmissionsPermissions(AssetNestedObjectsPermissions):
         asset_uid = self._get_parents_query_dict(request).get("asset")
         asset = get_object_or_404(Asset, uid=asset_uid)
         permission = self.get_required_permission(request.method, view.action)
+        resolver = get_permission_resolver(request)
 
         # We don't want to make a difference between non-existing assets vs non permitted assets
         # to avoid users to be able guess asset existence
-        if not asset.has_perm(request.user, permission):
+        if not resolver.has_perm(asset, permission):
             # Except if users can read submissions, we want to show them Access Denied
             if request.method not in permissions.SAFE_METHODS:
                 read_permission = self.get_required_permission("GET")
-                can_read = asset.has_perm(request.user, read_permission)
+                can_read = resolver.has_perm(asset, read_permission)
                 if can_read:
                     return False
 
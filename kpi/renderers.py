@@ -50,6 +50,34 @@ class XFormRenderer(XMLRenderer):
                                                  relationship="snapshot")
 
 
+class SubmissionJSONRenderer(renderers.JSONRenderer):
+
+    def stream(self, submissions, paginator=None):
+        """
+        Yield the JSON representation of the `submissions` iterable piece by
+        piece, holding only one submission in memory at a time. If a
+        `SubmissionKeysetPagination` is given, the list is wrapped the same way
+        as by its `get_paginated_response()`
+        """
+        separators = (renderers.SHORT_SEPARATORS if self.compact
+                      else renderers.LONG_SEPARATORS)
+        if paginator is not None:
+            submissions = paginator.stream_submissions(submissions)
+            yield '{"results":'
+        yield '['
+        for index, submission in enumerate(submissions):
+            if index:
+                yield separators[0]
+            yield json.dumps(submission,
+                             cls=self.encoder_class,
+                             ensure_ascii=self.ensure_ascii,
+                             separators=separators)
+        yield ']'
+        if paginator is not None:
+            # Known only once all the submissions have been read
+            yield ',"next":{}}}'.format(json.dumps(paginator.get_next_link()))
+
+
 class SubmissionXMLRenderer(DRFXMLRenderer):
 
     def render(self, data, accepted_media_type=None, renderer_context=None):
@@ -58,6 +86,17 @@ class SubmissionXMLRenderer(DRFXMLRenderer):
         else:
             return data
 
+    def stream(self, submissions, paginator=None):
+        """
+        Like `render()` for lists, but yields one submission at a time.
+        `paginator` is always `None`: `SubmissionViewSet.list()` rejects
+        cursors with the XML format before the response starts
+        """
+        yield '<root>'
+        for submission in submissions:
+            yield submission
+        yield '</root>'
+
 
 class XlsRenderer(renderers.BaseRenderer):
     media_type = 'application/xls'
@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
+import base64
 import datetime
 import json
 import pytz
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
 
 import constance
 from django.contrib.auth.models import User, Permission
@@ -12,10 +13,18 @@ from django.core.urlresolvers import get_script_prefix, resolve, Resolver404
 from django.db import transaction
 from django.db.utils import ProgrammingError
 from django.utils.six.moves.urllib import parse as urlparse
+from django.utils.translation import ugettext as _
 from django.conf import settings
+from bson import json_util
 from rest_framework import serializers, exceptions
-from rest_framework.pagination import LimitOffsetPagination, PageNumberPagination
+from rest_framework.pagination import (
+    BasePagination,
+    LimitOffsetPagination,
+    PageNumberPagination,
+)
+from rest_framework.response import Response
 from rest_framework.reverse import reverse_lazy, reverse
+from rest_framework.utils.urls import replace_query_param
 from taggit.models import Tag
 from bossoidc.models import Keycloak as KeycloakModel
 
@@ -30,6 +39,7 @@ from .models import CollectionChildrenQuerySet
 from .models import UserCollectionSubscription
 from .models import ImportTask, ExportTask
 from .models import ObjectPermission
+from .models import PermissionPropagation
 from .models.object_permission import get_anonymous_user, get_objects_for_user
 from .models.asset import ASSET_TYPES
 from .models import TagUid
@@ -38,6 +48,7 @@ from .forms import USERNAME_REGEX, USERNAME_MAX_LENGTH
 from .forms import USERNAME_INVALID_MESSAGE
 from .utils.gravatar_url import gravatar_url
 
+from .deployment_backends.backends import DEPLOYMENT_BACKENDS
 from .deployment_backends.kc_access.utils import get_kc_profile_data
 from .deployment_backends.kc_access.utils import set_kc_require_auth
 
@@ -59,6 +70,103 @@ class TinyPaginated(PageNumberPagination):
     page_size = 50
 
 
+class SubmissionKeysetPagination(BasePagination):
+    """
+    Keyset pagination of a deployment's submissions on `_id`. Instead of
+    skipping `start` submissions, each page requests the submissions whose
+    `_id` is greater than the last one of the previous page, so that deep
+    pages cost no more than the first. That `_id` is passed to the client as
+    an opaque token in the `next` URL, in the `cursor` query parameter. An
+    empty `cursor` requests the first page
+    """
+    cursor_query_param = 'cursor'
+
+    def paginate_filters(self, filters, request):
+        """
+        Return a copy of `filters`, the keyword arguments for
+        `get_submissions()`, that requests the page given by `cursor`
+        """
+        self.request = request
+        filters = dict(filters)
+        cursor = filters.pop(self.cursor_query_param, '')
+        for param in ('start', 'sort'):
+            if param in filters:
+                raise exceptions.ValidationError({
+                    param: _('Cannot be combined with `{}`.').format(
+                        self.cursor_query_param)
+                })
+        query = filters.get('query', {})
+        if isinstance(query, basestring):
+            try:
+                query = json.loads(query, object_hook=json_util.object_hook)
+            except ValueError:
+                raise exceptions.ValidationError(
+                    {'query': _('Value must be valid JSON.')}
+                )
+        if cursor:
+            after_cursor = {'$gt': self.decode_cursor(cursor)}
+            if '_id' in query:
+                query = {'$and': [query, {'_id': after_cursor}]}
+            else:
+                query = dict(query, _id=after_cursor)
+        filters['query'] = query
+        filters['sort'] = {'_id': 1}
+        self.limit = int(filters['limit'])
+        if self.limit < 1:
+            # An empty page would link to itself
+            raise exceptions.ValidationError(
+                {'limit': _('A positive integer is required.')}
+            )
+        # Ask for one more submission than fits on the page to find out
+        # whether there is a next page
+        filters['limit'] = self.limit + 1
+        return filters
+
+    def stream_submissions(self, submissions):
+        """
+        Yield the submissions of the page from `submissions`, which must come
+        from `get_submissions()` called with the filters returned by
+        `paginate_filters()`. `get_next_link()` is available once the page
+        has been read
+        """
+        self.has_next = False
+        self.last_id = None
+        for index, submission in enumerate(submissions):
+            if index == self.limit:
+                self.has_next = True
+                break
+            self.last_id = submission['_id']
+            yield submission
+
+    def paginate_submissions(self, submissions):
+        return list(self.stream_submissions(submissions))
+
+    def encode_cursor(self, submission_id):
+        return base64.urlsafe_b64encode(json.dumps(submission_id))
+
+    def decode_cursor(self, cursor):
+        try:
+            return json.loads(base64.urlsafe_b64decode(str(cursor)))
+        except (TypeError, ValueError):
+            raise exceptions.ValidationError(
+                {self.cursor_query_param: _('Invalid cursor.')})
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.last_id)
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+
 class WritableJSONField(serializers.Field):
 
     """ Serializer for JSONField -- required to make field writable"""
@@ -523,6 +631,7 @@ class AssetSerializer(serializers.HyperlinkedModelSerializer):
     ancestors = AncestorCollectionsSerializer(
         many=True, read_only=True, source='get_ancestors_or_none')
     permissions = ObjectPermissionNestedSerializer(many=True, read_only=True)
+    permissions_pending = serializers.SerializerMethodField()
     tag_string = serializers.CharField(required=False, allow_blank=True)
     version_id = serializers.CharField(read_only=True)
     version__content_hash = serializers.CharField(read_only=True)
@@ -583,6 +692,7 @@ class AssetSerializer(serializers.HyperlinkedModelSerializer):
                   'xls_link',
                   'name',
                   'permissions',
+                  'permissions_pending',
                   'settings',)
         extra_kwargs = {
             'parent': {
@@ -638,6 +748,11 @@ class AssetSerializer(serializers.HyperlinkedModelSerializer):
     def get_version_count(self, obj):
         return obj.asset_versions.count()
 
+    def get_permissions_pending(self, obj):
+        ''' Whether changes to the permissions of a parent collection have not
+        yet been propagated to this asset '''
+        return PermissionPropagation.objects.is_pending_for_object(obj)
+
     def get_xls_link(self, obj):
         return reverse('asset-xls', args=(obj.uid,), request=self.context.get('request', None))
 
@@ -873,8 +988,26 @@ class ExportTaskSerializer(serializers.HyperlinkedModelSerializer):
         }
 
 
+class AssetListListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        ''' Let each deployment backend fetch the submission counts of all
+        its assets at once, instead of one query per asset '''
+        assets = data.all() if hasattr(data, 'all') else data
+        assets = list(assets)
+        assets_by_backend = defaultdict(list)
+        for asset in assets:
+            if asset.has_deployment:
+                assets_by_backend[
+                    asset._deployment_data['backend']].append(asset)
+        for backend, backend_assets in assets_by_backend.items():
+            DEPLOYMENT_BACKENDS[backend].prefetch_submission_stats(
+                backend_assets)
+        return super(AssetListListSerializer, self).to_representation(assets)
+
+
 class AssetListSerializer(AssetSerializer):
     class Meta(AssetSerializer.Meta):
+        list_serializer_class = AssetListListSerializer
         # WARNING! If you're changing something here, please update
         # `Asset.optimize_queryset_for_list()`; otherwise, you'll cause an
         # additional database query for each asset in the list.
@@ -1118,6 +1251,7 @@ class CollectionSerializer(serializers.HyperlinkedModelSerializer):
         ).optimize_for_list()
     )
     permissions = ObjectPermissionSerializer(many=True, read_only=True)
+    permissions_pending = serializers.SerializerMethodField()
     downloads = serializers.SerializerMethodField()
     tag_string = serializers.CharField(required=False)
     access_type = serializers.SerializerMethodField()
@@ -1137,6 +1271,7 @@ class CollectionSerializer(serializers.HyperlinkedModelSerializer):
                   'ancestors',
                   'children',
                   'permissions',
+                  'permissions_pending',
                   'access_type',
                   'discoverable_when_public',
                   'tag_string',)
@@ -1153,6 +1288,11 @@ class CollectionSerializer(serializers.HyperlinkedModelSerializer):
     def _get_tag_names(self, obj):
         return obj.tags.names()
 
+    def get_permissions_pending(self, obj):
+        ''' Whether changes to the permissions of an ancestor have not yet
+        been propagated to this collection '''
+        return PermissionPropagation.objects.is_pending_for_object(obj)
+
     def get_downloads(self, obj):
         request = self.context.get('request', None)
         obj_url = reverse(
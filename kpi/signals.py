@@ -2,9 +2,12 @@
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from rest_framework.authtoken.models import Token
 
 from kobo.apps.hook.models.hook import Hook
 from taggit.models import Tag
+from .deployment_backends.kc_access.proxy import TOKEN_CACHE_KEY
 from .models import TagUid
 from .model_utils import grant_default_model_level_perms
 
@@ -33,6 +36,12 @@ def tag_uid_post_save(sender, instance, created, raw, **kwargs):
     TagUid.objects.get_or_create(tag=instance)
 
 
+@receiver([post_save, post_delete], sender=Token)
+def forget_cached_kc_token(sender, instance, **kwargs):
+    ''' Requests to KC must use the new token, or none at all '''
+    cache.delete(TOKEN_CACHE_KEY.format(instance.user_id))
+
+
 @receiver([post_save, post_delete], sender=Hook)
 def update_kc_xform_has_kpi_hooks(sender, instance, **kwargs):
     """
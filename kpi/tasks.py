@@ -2,7 +2,15 @@ from __future__ import absolute_import
 from celery import shared_task
 from django.core.management import call_command
 from django.conf import settings
-from .models import ImportTask, ExportTask
+from rest_framework import serializers
+
+from kpi.utils.log import logging
+from .models import (
+    ImportTask,
+    ExportTask,
+    PermissionPropagation,
+    ReportStatistics,
+)
 
 @shared_task
 def update_search_index():
@@ -18,6 +26,45 @@ def export_in_background(export_task_uid):
     export_task = ExportTask.objects.get(uid=export_task_uid)
     export_task.run()
 
+@shared_task
+def export_shard_in_background(export_task_uid, shard_index):
+    export_task = ExportTask.objects.get(uid=export_task_uid)
+    export_task.run_shard(shard_index)
+
+@shared_task(bind=True, max_retries=5)
+def propagate_permissions_in_background(self, propagation_pk):
+    try:
+        propagation = PermissionPropagation.objects.get(pk=propagation_pk)
+    except PermissionPropagation.DoesNotExist:
+        # The transaction that scheduled us may not have committed yet. If it
+        # never does, it was rolled back and there is nothing to do
+        if self.request.retries < self.max_retries:
+            raise self.retry(countdown=settings.PERMISSION_PROPAGATION_DELAY)
+        return
+    propagation.run()
+
+@shared_task
+def refresh_report_statistics(asset_uid=None):
+    ''' Refresh the out-of-date report statistics of the asset with
+    `asset_uid`, or of all assets if `None` '''
+    statistics = ReportStatistics.objects.select_related('asset')
+    if asset_uid is not None:
+        statistics = statistics.filter(asset__uid=asset_uid)
+    for report_statistics in statistics.iterator():
+        if not report_statistics.asset.has_deployment:
+            report_statistics.delete()
+            continue
+        try:
+            report_statistics.refresh()
+        except serializers.ValidationError:
+            # The `split_by` question no longer exists
+            report_statistics.delete()
+        except Exception as e:
+            logging.error(
+                'Failed to refresh {}: {}'.format(report_statistics, repr(e)),
+                exc_info=True
+            )
+
 @shared_task
 def sync_kobocat_xforms(username=None, quiet=True):
     call_command('sync_kobocat_xforms', username=username, quiet=quiet)
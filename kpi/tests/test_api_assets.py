@@ -577,6 +577,33 @@ class AssetExportTaskTest(APITestCase):
             response = self.client.get(detail_response.data['result'])
             self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
+    def test_identical_export_is_cached(self):
+        detail_response = self.test_owner_can_create_export()
+        post_url = reverse('exporttask-list')
+        task_data = {
+            'source': reverse('asset-detail', args=[self.asset.uid]),
+            'type': 'csv',
+        }
+        response = self.client.post(post_url, task_data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['uid'], detail_response.data['uid'])
+        self.assertEqual(response.data['status'], 'complete')
+        self.assertEqual(ExportTask.objects.count(), 1)
+
+        # Different options
+        task_data['lang'] = '_xml'
+        response = self.client.post(post_url, task_data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        del task_data['lang']
+
+        # New submissions
+        submissions = self.asset.deployment.get_submissions()
+        submissions.append(dict(submissions[0], q1='Nada'))
+        self.asset.deployment.mock_submissions(submissions)
+        response = self.client.post(post_url, task_data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotEqual(response.data['uid'], detail_response.data['uid'])
+
 
 class AssetFileTest(APITestCase):
     fixtures = ['test_data']
@@ -71,6 +71,13 @@ class BaseTestCase(APITestCase):
         self.asset.deployment.mock_submissions(self.submissions)
         self.submission_url = self.asset.deployment.submission_list_url
 
+    @staticmethod
+    def _get_list_data(response):
+        """
+        The submission list is streamed, so it has no `response.data`
+        """
+        return json.loads(b''.join(response.streaming_content))
+
     def _log_in_as_another_user(self):
         """
         Helper to switch user from `someuser` to `anotheruser`.
@@ -113,7 +120,7 @@ class SubmissionApiTests(BaseTestCase):
     def test_list_submissions_owner(self):
         response = self.client.get(self.submission_url, {"format": "json"})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, self.submissions)
+        self.assertEqual(self._get_list_data(response), self.submissions)
 
     def test_list_submissions_owner_with_params(self):
         """
@@ -154,7 +161,7 @@ class SubmissionApiTests(BaseTestCase):
             asset.deployment.submission_list_url, {'format': 'json'}
         )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), limit)
+        self.assertEqual(len(self._get_list_data(response)), limit)
         # Limit specified in query parameters should not be able to exceed
         # server-wide limit
         response = self.client.get(
@@ -162,7 +169,60 @@ class SubmissionApiTests(BaseTestCase):
             {'limit': limit + excess, 'format': 'json'}
         )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), limit)
+        self.assertEqual(len(self._get_list_data(response)), limit)
+
+    def test_list_submissions_with_cursor(self):
+        v_uid = self.asset.latest_deployed_version.uid
+        submissions = [
+            {'__version__': v_uid, '_id': i, 'q1': 'a{}'.format(i)}
+            for i in range(5, 0, -1)
+        ]
+        self.asset.deployment.mock_submissions(submissions)
+        response = self.client.get(
+            self.submission_url, {'format': 'json', 'cursor': '', 'limit': 2})
+        pages = []
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            data = self._get_list_data(response)
+            pages.append([submission['_id'] for submission in data['results']])
+            if data['next'] is None:
+                break
+            response = self.client.get(data['next'])
+        self.assertEqual(pages, [[1, 2], [3, 4], [5]])
+
+        # Filters still apply
+        response = self.client.get(self.submission_url, {
+            'format': 'json',
+            'cursor': '',
+            'limit': 1,
+            'query': '{"_id": {"$lt": 4}, "q1": {"$gt": "a1"}}',
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = self._get_list_data(response)
+        self.assertEqual(data['results'][0]['_id'], 2)
+        data = self._get_list_data(self.client.get(data['next']))
+        self.assertEqual(data['results'][0]['_id'], 3)
+        self.assertIsNone(data['next'])
+
+    def test_list_submissions_with_invalid_cursor(self):
+        for params in (
+            {'format': 'json', 'cursor': 'not a cursor'},
+            {'format': 'json', 'cursor': '', 'start': 1},
+            {'format': 'json', 'cursor': '', 'limit': 0},
+            {'format': 'json', 'cursor': '', 'limit': -1},
+            {'format': 'xml', 'cursor': ''},
+        ):
+            response = self.client.get(self.submission_url, params)
+            self.assertEqual(response.status_code,
+                             status.HTTP_400_BAD_REQUEST)
+
+    def test_list_submissions_xml(self):
+        self.asset.deployment.mock_submissions(['<a>1</a>', '<b>2</b>'])
+        response = self.client.get(self.submission_url, {'format': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content),
+                         b'<root><a>1</a><b>2</b></root>')
 
     def test_list_submissions_not_shared_other(self):
         self._log_in_as_another_user()
@@ -174,7 +234,7 @@ class SubmissionApiTests(BaseTestCase):
         self._log_in_as_another_user()
         response = self.client.get(self.submission_url, {"format": "json"})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, self.submissions)
+        self.assertEqual(self._get_list_data(response), self.submissions)
 
     def test_list_submissions_anonymous(self):
         self.client.logout()
@@ -1,11 +1,13 @@
 import json
 import hashlib
 import unittest
+import mock
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
 from copy import deepcopy
 
-from formpack.utils.expand_content import SCHEMA_VERSION
+from formpack.utils.expand_content import SCHEMA_VERSION, expand_content
 
 from ..models import Asset
 from ..models import AssetVersion
@@ -105,3 +107,52 @@ class AssetVersionTestCase(TestCase):
         new_asset.settings['description'] = 'Loco el que lee'
         new_asset.save()
         self.assertEqual(new_asset.latest_version.content_hash, expected_hash)
+
+    def test_formpack_schema_is_cached(self):
+        asset = Asset.objects.create(asset_type='survey', content={
+            'survey': [{'type': 'note', 'label': 'Read me', 'name': 'n1'}]
+        })
+        asset.deploy(backend='mock', active=True)
+        version = asset.latest_deployed_version
+        expected_schema = json.loads(json.dumps(
+            version._build_formpack_schema()))
+        cache.clear()
+        AssetVersion._formpack_schemas.clear()
+        with mock.patch('kpi.models.asset_version.expand_content',
+                        wraps=expand_content) as patched_expand_content:
+            schema = version.to_formpack_schema()
+            self.assertEqual(schema, expected_schema)
+            # Modifying a returned schema does not affect the cached one
+            schema['version_id_key'] = '__inferred_version__'
+            self.assertEqual(
+                AssetVersion.objects.get(pk=version.pk).to_formpack_schema(),
+                expected_schema
+            )
+            # Another process would find it in the shared cache
+            AssetVersion._formpack_schemas.clear()
+            self.assertEqual(version.to_formpack_schema(), expected_schema)
+            self.assertEqual(patched_expand_content.call_count, 1)
+
+            # Versions that are not deployed are not cached
+            asset.save()
+            asset.latest_version.to_formpack_schema()
+            asset.latest_version.to_formpack_schema()
+            self.assertEqual(patched_expand_content.call_count, 3)
+
+    def test_formpack_schema_cache_is_bounded(self):
+        asset = Asset.objects.create(asset_type='survey', content={
+            'survey': [{'type': 'note', 'label': 'Read me', 'name': 'n1'}]
+        })
+        uids = []
+        for _ in range(3):
+            asset.save()
+            asset.deploy(backend='mock', active=True)
+            asset.latest_deployed_version.to_formpack_schema()
+            uids.append(asset.latest_deployed_version.uid)
+        # Reload them from the shared cache into an empty memory cache
+        AssetVersion._formpack_schemas.clear()
+        with mock.patch.object(AssetVersion, 'FORMPACK_SCHEMA_CACHE_SIZE', 2):
+            for version in asset.deployed_versions.order_by('date_modified'):
+                version.to_formpack_schema()
+        self.assertEqual(len(AssetVersion._formpack_schemas), 2)
+        self.assertIn(uids[-1], AssetVersion._formpack_schemas)
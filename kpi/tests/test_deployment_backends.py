@@ -1,9 +1,14 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
+import mock
 import pytest
 
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+from kpi.deployment_backends.kobocat_backend import KobocatDeploymentBackend
 from kpi.models.asset import Asset
 from kpi.models.asset_version import AssetVersion
 
@@ -98,3 +103,53 @@ class MockDeployment(TestCase):
         self.assertTrue(self.asset.has_deployment)
         self.asset.deployment.delete()
         self.assertFalse(self.asset.has_deployment)
+
+
+class KobocatSubmissionStatsTestCase(TestCase):
+    fixtures = ['test_data']
+
+    def setUp(self):
+        self.user = User.objects.get(username='someuser')
+        self.assets = [
+            Asset.objects.create(owner=self.user, _deployment_data={
+                'backend': 'kobocat',
+                'backend_response': {'id_string': 'form_{}'.format(i)},
+            })
+            for i in range(3)
+        ]
+        cache.clear()
+
+    def _prefetch(self, submission_stats):
+        # Fresh instances, as in a new request
+        assets = [Asset.objects.get(pk=asset.pk) for asset in self.assets]
+        with mock.patch(
+                'kpi.deployment_backends.kobocat_backend.get_submission_stats',
+                return_value=submission_stats
+        ) as get_submission_stats:
+            KobocatDeploymentBackend.prefetch_submission_stats(assets)
+        return assets, get_submission_stats
+
+    def test_prefetch_submission_stats(self):
+        now = timezone.now()
+        assets, get_submission_stats = self._prefetch({
+            (self.user.pk, 'form_0'): (5, now),
+            (self.user.pk, 'form_1'): (7, None),
+        })
+        self.assertEqual(get_submission_stats.call_count, 1)
+        self.assertEqual(
+            set(get_submission_stats.call_args[0][0]),
+            set((self.user.pk, 'form_{}'.format(i)) for i in range(3))
+        )
+        self.assertEqual(
+            [asset.deployment.submission_count for asset in assets],
+            [5, 7, 0]
+        )
+        self.assertEqual(assets[0].deployment.last_submission_time, now)
+
+        # The shared cache answers until it expires
+        assets, get_submission_stats = self._prefetch({})
+        self.assertFalse(get_submission_stats.called)
+        self.assertEqual(
+            [asset.deployment.submission_count for asset in assets],
+            [5, 7, 0]
+        )
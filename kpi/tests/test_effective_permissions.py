@@ -0,0 +1,206 @@
+from django.contrib.auth.models import AnonymousUser, Permission, User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from ..models.asset import Asset
+from ..models.collection import Collection
+from ..models.object_permission import (
+    EffectivePermission,
+    ObjectPermissionResolver,
+    permission_registry,
+)
+from ..serializers import AssetListSerializer
+
+
+class EffectivePermissionsTestCase(TestCase):
+    fixtures = ['test_data']
+
+    def setUp(self):
+        self.admin = User.objects.get(username='admin')
+        self.someuser = User.objects.get(username='someuser')
+        self.collection = Collection.objects.create(
+            owner=self.admin, name='effective')
+        self.asset = Asset.objects.create(owner=self.admin)
+
+    def _stored_codenames(self, obj, user):
+        return sorted(EffectivePermission.objects.filter_for_object(
+            obj, user=user).values_list('codename', flat=True))
+
+    def test_owner_permissions_are_stored(self):
+        self.assertListEqual(
+            self._stored_codenames(self.asset, self.admin),
+            sorted(self.asset.get_perms(self.admin))
+        )
+        self.assertIn(
+            'delete_asset', self._stored_codenames(self.asset, self.admin))
+
+    def test_assign_and_remove_update_store(self):
+        self.asset.assign_perm(self.someuser, 'change_asset')
+        self.assertListEqual(
+            self._stored_codenames(self.asset, self.someuser),
+            ['change_asset', 'share_asset', 'view_asset']
+        )
+        self.asset.remove_perm(self.someuser, 'view_asset')
+        self.assertListEqual(
+            self._stored_codenames(self.asset, self.someuser), [])
+
+    def test_inherited_permissions_follow_parent(self):
+        self.asset.parent = self.collection
+        self.asset.save()
+        self.collection.assign_perm(self.someuser, 'view_collection')
+        self.assertListEqual(
+            self._stored_codenames(self.asset, self.someuser), ['view_asset'])
+        # Moving the asset out of the collection revokes inherited access
+        self.asset.parent = None
+        self.asset.save()
+        self.assertListEqual(
+            self._stored_codenames(self.asset, self.someuser), [])
+
+    def test_anonymous_permissions_are_restricted(self):
+        self.asset.assign_perm(AnonymousUser(), 'view_asset')
+        self.assertTrue(self.someuser.has_perm('view_asset', self.asset))
+        self.assertFalse(self.someuser.has_perm('change_asset', self.asset))
+        self.assertListEqual(
+            list(self.asset.get_perms(AnonymousUser())), ['view_asset'])
+
+    def test_has_perm_is_a_single_query(self):
+        self.asset.assign_perm(self.someuser, 'view_asset')
+        # Warm the `ContentType` cache used by `perm_parse()`
+        self.asset.has_perm(self.someuser, 'view_asset')
+        with self.assertNumQueries(1):
+            self.assertTrue(self.asset.has_perm(self.someuser, 'view_asset'))
+        with self.assertNumQueries(1):
+            self.assertFalse(
+                self.asset.has_perm(self.someuser, 'change_asset'))
+
+    def test_permissions_are_deleted_with_object(self):
+        self.asset.assign_perm(self.someuser, 'view_asset')
+        asset_pk = self.asset.pk
+        self.asset.delete()
+        self.assertFalse(EffectivePermission.objects.filter(
+            content_type__model='asset', object_id=asset_pk).exists())
+
+
+class ObjectPermissionResolverTestCase(TestCase):
+    fixtures = ['test_data']
+
+    def setUp(self):
+        self.admin = User.objects.get(username='admin')
+        self.someuser = User.objects.get(username='someuser')
+        self.anotheruser = User.objects.get(username='anotheruser')
+        self.assets = [Asset.objects.create(owner=self.admin)
+                       for _ in range(3)]
+        self.assets[0].assign_perm(self.someuser, 'change_asset')
+        self.assets[1].assign_perm(AnonymousUser(), 'view_asset')
+
+    def test_prefetch_is_a_single_query(self):
+        resolver = ObjectPermissionResolver(self.someuser)
+        # Warm the `ContentType` cache
+        resolver._get_key(self.assets[0])
+        with self.assertNumQueries(1):
+            resolver.prefetch(self.assets)
+        with self.assertNumQueries(0):
+            self.assertTrue(resolver.has_perm(self.assets[0], 'change_asset'))
+            self.assertTrue(resolver.has_perm(self.assets[1], 'view_asset'))
+            self.assertFalse(resolver.has_perm(self.assets[2], 'view_asset'))
+            self.assertListEqual(
+                sorted(resolver.get_perms(self.assets[0])),
+                sorted(self.assets[0].get_perms(self.someuser))
+            )
+
+    def test_resolver_matches_has_perm(self):
+        for user in (self.admin, self.someuser, self.anotheruser,
+                     AnonymousUser()):
+            resolver = ObjectPermissionResolver(user)
+            resolver.prefetch(self.assets)
+            for asset in self.assets:
+                for codename in (Asset.ASSIGNABLE_PERMISSIONS +
+                                 Asset.CALCULATED_PERMISSIONS):
+                    self.assertEqual(
+                        resolver.has_perm(asset, codename),
+                        asset.has_perm(user, codename),
+                        msg='{} {} {}'.format(user, codename, asset.uid)
+                    )
+
+    def test_asset_list_query_count_is_fixed(self):
+        request = Request(APIRequestFactory().get('/'))
+        request.user = self.someuser
+
+        def serialize(assets):
+            queryset = Asset.optimize_queryset_for_list(
+                Asset.objects.filter(pk__in=[asset.pk for asset in assets]))
+            data = AssetListSerializer(
+                queryset, many=True, context={'request': request}).data
+            self.assertEqual(len(data), len(assets))
+
+        with CaptureQueriesContext(connection) as context:
+            serialize(self.assets[:1])
+        more_assets = self.assets + [Asset.objects.create(owner=self.admin)
+                                     for _ in range(3)]
+        for asset in more_assets:
+            asset.assign_perm(self.anotheruser, 'view_asset')
+        with self.assertNumQueries(len(context.captured_queries)):
+            serialize(more_assets)
+
+    def test_share_permission_is_masked(self):
+        asset = self.assets[0]
+        resolver = ObjectPermissionResolver(self.someuser)
+        self.assertTrue(resolver.has_perm(asset, 'share_asset'))
+        asset.editors_can_change_permissions = False
+        self.assertFalse(resolver.has_perm(asset, 'share_asset'))
+        self.assertNotIn('share_asset', resolver.get_perms(asset))
+
+
+class PermissionRegistryTestCase(TestCase):
+    fixtures = ['test_data']
+
+    def setUp(self):
+        self.admin = User.objects.get(username='admin')
+        self.someuser = User.objects.get(username='someuser')
+        self.collection = Collection.objects.create(
+            owner=self.admin, name='registry')
+        self.asset = Asset.objects.create(
+            owner=self.admin, parent=self.collection)
+
+    def test_lookups_match_database(self):
+        for permission in Permission.objects.filter(
+                content_type__app_label='kpi'):
+            self.assertEqual(
+                permission_registry.get_id(
+                    permission.content_type, permission.codename),
+                permission.pk
+            )
+            self.assertEqual(
+                permission_registry.get_codename(permission.pk),
+                permission.codename
+            )
+        self.assertEqual(
+            permission_registry.translate_parent_id(
+                Asset, permission_registry.get_id(
+                    Collection, 'change_collection')),
+            permission_registry.get_id(Asset, 'change_asset')
+        )
+        self.assertIsNone(permission_registry.translate_parent_id(
+            Asset, permission_registry.get_id(Collection, 'add_collection')))
+        with self.assertRaises(Permission.DoesNotExist):
+            permission_registry.get_id(Asset, 'fly_asset')
+
+    def test_recalculation_does_not_query_permissions(self):
+        self.collection.assign_perm(self.someuser, 'change_collection')
+        with CaptureQueriesContext(connection) as context:
+            self.asset._recalculate_inherited_perms()
+            self.asset._get_effective_perms()
+            self.asset.assign_perm(
+                self.someuser, 'view_submissions', skip_kc=True)
+        for query in context.captured_queries:
+            self.assertNotIn(Permission._meta.db_table, query['sql'])
+
+    def test_clear(self):
+        permission_registry.get_id(Asset, 'view_asset')
+        permission_registry.clear()
+        with self.assertNumQueries(1):
+            permission_registry.get_id(Asset, 'view_asset')
+            permission_registry.get_id(Collection, 'view_collection')
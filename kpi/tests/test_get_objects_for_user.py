@@ -0,0 +1,106 @@
+import os
+import unittest
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from ..models.asset import Asset
+from ..models.object_permission import (
+    ObjectPermission,
+    get_objects_for_user,
+    permission_registry,
+)
+
+
+class GetObjectsForUserTestCase(TestCase):
+    fixtures = ['test_data']
+
+    def setUp(self):
+        self.admin = User.objects.get(username='admin')
+        self.someuser = User.objects.get(username='someuser')
+        self.assets = [Asset.objects.create(owner=self.admin)
+                       for _ in range(3)]
+
+    def test_single_and_multiple_permissions(self):
+        self.assets[0].assign_perm(self.someuser, 'change_asset')
+        self.assets[1].assign_perm(self.someuser, 'view_asset')
+        self.assertListEqual(
+            sorted(get_objects_for_user(
+                self.someuser, 'view_asset', Asset
+            ).values_list('pk', flat=True)),
+            [self.assets[0].pk, self.assets[1].pk]
+        )
+        self.assertListEqual(
+            list(get_objects_for_user(
+                self.someuser, ['kpi.view_asset', 'kpi.change_asset']
+            ).values_list('pk', flat=True)),
+            [self.assets[0].pk]
+        )
+
+    def test_inherited_and_assigned_permission_counts_once(self):
+        self.assets[2].assign_perm(self.someuser, 'view_asset')
+        ObjectPermission.objects.create(
+            content_object=self.assets[2],
+            user=self.someuser,
+            permission_id=permission_registry.get_id(Asset, 'view_asset'),
+            inherited=True
+        )
+        self.assertFalse(get_objects_for_user(
+            self.someuser, ['view_asset', 'change_asset'], Asset).exists())
+
+    def test_anonymous_user(self):
+        self.assets[0].assign_perm(AnonymousUser(), 'view_asset')
+        self.assertListEqual(
+            list(get_objects_for_user(
+                AnonymousUser(), 'view_asset', Asset
+            ).values_list('pk', flat=True)),
+            [self.assets[0].pk]
+        )
+
+
+@unittest.skipUnless(
+    os.environ.get('KPI_RUN_BENCHMARKS', 'False') == 'True',
+    'set KPI_RUN_BENCHMARKS=True to run'
+)
+class GetObjectsForUserBenchmarkTestCase(TestCase):
+    ''' The matching pks must stay in the database no matter how many
+    objects a user can access '''
+    fixtures = ['test_data']
+
+    PERMISSION_COUNT = 100000
+
+    def setUp(self):
+        self.someuser = User.objects.get(username='someuser')
+        admin = User.objects.get(username='admin')
+        self.assets = [Asset.objects.create(owner=admin) for _ in range(5)]
+        asset_ct = ContentType.objects.get_for_model(Asset)
+        view_asset_id = permission_registry.get_id(asset_ct, 'view_asset')
+        uid_field = ObjectPermission._meta.get_field('uid')
+        first_object_id = max(asset.pk for asset in self.assets) + 1
+        # Most rows point at objects that do not exist, which does not matter
+        # to the query
+        object_ids = [asset.pk for asset in self.assets] + list(range(
+            first_object_id,
+            first_object_id + self.PERMISSION_COUNT - len(self.assets)
+        ))
+        ObjectPermission.objects.bulk_create(
+            ObjectPermission(
+                content_type=asset_ct,
+                object_id=object_id,
+                user=self.someuser,
+                permission_id=view_asset_id,
+                uid=uid_field.generate_uid()
+            ) for object_id in object_ids
+        )
+
+    def test_100k_permissions(self):
+        with CaptureQueriesContext(connection) as context:
+            count = get_objects_for_user(
+                self.someuser, 'view_asset', Asset).count()
+        self.assertEqual(count, len(self.assets))
+        self.assertEqual(len(context.captured_queries), 1)
+        # No pk list is embedded in the SQL
+        self.assertLess(len(context.captured_queries[0]['sql']), 2000)
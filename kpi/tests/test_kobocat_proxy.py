@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import mock
+import requests
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.authtoken.models import Token
+
+from kpi.deployment_backends.kc_access.proxy import (
+    get_kc_latency_histograms,
+    get_kc_session,
+    get_kc_token_key,
+    record_kc_latency,
+    reset_kc_latency_histograms,
+    send_kc_request,
+)
+
+
+class KobocatProxyTestCase(TestCase):
+    fixtures = ['test_data']
+
+    def setUp(self):
+        self.user = User.objects.get(username='someuser')
+        cache.clear()
+        reset_kc_latency_histograms()
+
+    def test_session_is_shared(self):
+        self.assertIs(get_kc_session(), get_kc_session())
+
+    def test_token_is_cached(self):
+        token_key = get_kc_token_key(self.user)
+        self.assertEqual(token_key, Token.objects.get(user=self.user).key)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_kc_token_key(self.user), token_key)
+        # A new token replaces the cached one
+        Token.objects.filter(user=self.user).delete()
+        new_token = Token.objects.create(user=self.user)
+        self.assertEqual(get_kc_token_key(self.user), new_token.key)
+
+    def test_latency_histograms(self):
+        url = 'http://kc.example.com/api/v1/data/12/34/validation_status'
+        record_kc_latency('PATCH', url + '?lang=fr', 0.2)
+        record_kc_latency('PATCH', url.replace('34', '35'), 0.2)
+        record_kc_latency('PATCH', url, 40)
+        histograms = get_kc_latency_histograms()
+        histogram = histograms['PATCH /api/v1/data/{id}/{id}/validation_status']
+        self.assertEqual(histogram['count'], 3)
+        self.assertAlmostEqual(histogram['total'], 40.4)
+        buckets = dict(histogram['buckets'])
+        self.assertEqual(buckets[0.25], 2)
+        self.assertEqual(buckets[None], 1)
+        reset_kc_latency_histograms()
+        self.assertEqual(get_kc_latency_histograms(), {})
+
+    def test_send_kc_request(self):
+        response = requests.Response()
+        response.status_code = 200
+        with mock.patch('requests.adapters.HTTPAdapter.send',
+                        return_value=response) as send:
+            send_kc_request(requests.Request(
+                method='GET', url='http://kc.example.com/api/v1/user'),
+                self.user)
+            send_kc_request(requests.Request(
+                method='GET', url='http://kc.example.com/api/v1/user'),
+                AnonymousUser())
+        authenticated_request, anonymous_request = [
+            args[0] for args, kwargs in send.call_args_list]
+        self.assertEqual(
+            authenticated_request.headers['Authorization'],
+            'Token {}'.format(get_kc_token_key(self.user))
+        )
+        self.assertNotIn('Authorization', anonymous_request.headers)
+        self.assertEqual(
+            get_kc_latency_histograms()['GET /api/v1/user']['count'], 2)
@@ -5,13 +5,17 @@ from copy import deepcopy
 import json
 from collections import OrderedDict
 
+import mock
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
 from django.test import TestCase
 
 from kobo.apps.reports import report_data
 from formpack import FormPack
 
-from kpi.models import Asset
+from kpi.models import Asset, ReportStatistics
 
 from formpack.utils import json_hash
 
@@ -237,3 +241,83 @@ class MockDataReports(TestCase):
         self.assertEqual(self.asset.asset_versions.count(), 2)
         self.assertTrue(self.asset.has_deployment)
         self.assertEqual(self.asset.deployment.submission_count, 4)
+
+    def test_report_statistics_are_stored(self):
+        with mock.patch(
+                'kpi.models.report_statistics.get_report_stats',
+                wraps=report_data.get_report_stats
+        ) as get_report_stats:
+            stats = ReportStatistics.get_stats(self.asset)
+            self.assertEqual(len(stats), 17)
+            self.assertEqual(
+                ReportStatistics.get_stats(self.asset), stats)
+            self.assertEqual(get_report_stats.call_count, 1)
+
+            # A new submission makes the statistics out of date. They are
+            # still returned at once, and refreshed in the background
+            submissions = self.asset.deployment.get_submissions()
+            new_submission = deepcopy(submissions[0])
+            new_submission['Select_one'] = 'option_2'
+            self.asset.deployment.mock_submissions(
+                submissions + [new_submission])
+            cache.delete(
+                ReportStatistics.REFRESH_CACHE_KEY.format(self.asset.uid))
+            with mock.patch(
+                    'kpi.tasks.refresh_report_statistics.apply_async'
+            ) as apply_async:
+                self.assertEqual(
+                    ReportStatistics.get_stats(self.asset), stats)
+            self.assertEqual(get_report_stats.call_count, 1)
+            apply_async.assert_called_once_with(
+                args=(self.asset.uid,),
+                countdown=settings.REPORT_STATISTICS_REFRESH_DELAY
+            )
+
+            report_statistics = ReportStatistics.objects.get(asset=self.asset)
+            self.assertTrue(report_statistics.refresh())
+            self.assertEqual(get_report_stats.call_count, 2)
+            stats = ReportStatistics.get_stats(self.asset)
+            self.assertEqual(get_report_stats.call_count, 2)
+        select_one_stats = [
+            stat for stat in stats if stat['name'] == 'Select_one'][0]
+        self.assertEqual(list(select_one_stats['data']['frequencies']), [3, 2])
+        report_statistics = ReportStatistics.objects.get(asset=self.asset)
+        self.assertEqual(report_statistics.submission_count, 5)
+        self.assertTrue(report_statistics.is_current())
+
+    def test_report_statistics_are_calculated_by_field(self):
+        with mock.patch(
+                'kpi.models.report_statistics.get_report_stats',
+                wraps=report_data.get_report_stats
+        ) as get_report_stats:
+            stats = ReportStatistics.get_stats(
+                self.asset, field_names=['Select_one'])
+            self.assertEqual([stat['name'] for stat in stats], ['Select_one'])
+            self.assertEqual(
+                get_report_stats.call_args[1]['field_names'], ['Select_one'])
+            # Only the missing field is calculated
+            stats = ReportStatistics.get_stats(
+                self.asset, field_names=['Select_one', 'Text'])
+            self.assertEqual(
+                [stat['name'] for stat in stats], ['Select_one', 'Text'])
+            self.assertEqual(get_report_stats.call_count, 2)
+            self.assertEqual(
+                get_report_stats.call_args[1]['field_names'], ['Text'])
+            ReportStatistics.get_stats(self.asset, field_names=['Text'])
+            self.assertEqual(get_report_stats.call_count, 2)
+
+    def test_reports_endpoint_uses_report_statistics(self):
+        self.client.login(username='someuser', password='someuser')
+        url = reverse('reports-detail', args=(self.asset.uid,))
+        response = self.client.get(url, {'names': 'Select_one,Text'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [stat['name'] for stat in response.data['list']],
+            ['Select_one', 'Text']
+        )
+        self.assertEqual(
+            list(response.data['list'][0]['data']['frequencies']), [3, 1])
+        self.assertIn('style', response.data['list'][0])
+        # The statistics of every field were stored for later requests
+        report_statistics = ReportStatistics.objects.get(asset=self.asset)
+        self.assertEqual(len(report_statistics.data), 17)
@@ -83,3 +83,20 @@ class ConflictingVersionsMockDataExports(TestCase):
             sub_id = values[field_column_numbers[self.submission_id_field]]
             results[sub_id] = fields_values
         self.assertEqual(results, self.expected_results)
+
+    def test_inferred_versions_match_full_submissions(self):
+        '''
+        Reading only the known version keys of the submissions fetched by
+        `build_formpack()` must infer the same versions as examining every
+        key of complete submissions
+        '''
+        def _inferred_versions(submission_stream):
+            return dict(
+                (submission['_id'], submission['__inferred_version__'])
+                for submission in submission_stream
+            )
+        _, fetched_stream = report_data.build_formpack(self.asset)
+        self.assertEqual(
+            _inferred_versions(fetched_stream),
+            _inferred_versions(self.submission_stream)
+        )
@@ -3,6 +3,7 @@ from __future__ import unicode_literals
 
 import os
 import mock
+import resource
 import xlrd
 import zipfile
 import datetime
@@ -13,10 +14,12 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
 from django.test import TestCase
+from django.test.utils import override_settings
 
 from kobo.apps.reports import report_data
 from formpack import FormPack
 
+from kpi.deployment_backends.mock_backend import MockDeploymentBackend
 from kpi.models import Asset, ExportTask
 
 
@@ -551,6 +554,24 @@ class MockDataExports(TestCase):
         self.run_csv_export_test(
             expected_lines, {'fields_from_all_versions': 'false'})
 
+    def test_build_formpack_requests_only_needed_fields(self):
+        with mock.patch.object(
+                MockDeploymentBackend, 'get_submissions', autospec=True,
+                side_effect=MockDeploymentBackend.get_submissions
+        ) as get_submissions:
+            _, submission_stream = report_data.build_formpack(
+                self.asset,
+                field_names=['Do_you_descend_from_unicellular_organism']
+            )
+            submissions = list(submission_stream)
+        self.assertEqual(len(submissions), len(self.submissions))
+        fields = get_submissions.call_args[1]['fields']
+        for field in ('Do_you_descend_from_unicellular_organism', '_id',
+                      '_uuid', '_submission_time', '__version__'):
+            self.assertIn(field, fields)
+        self.assertNotIn('start', fields)
+        self.assertNotIn('start', submissions[0])
+
     def test_export_exceeding_api_submission_limit(self):
         """
         Make sure the limit on count of submissions returned by the API does
@@ -581,3 +602,215 @@ class MockDataExports(TestCase):
         export_task._run_task(messages)
         # Don't forget to add one for the header row!
         self.assertEqual(len(list(export_task.result)), limit + excess + 1)
+
+    def test_incremental_csv_export(self):
+        def run_export(incremental=True):
+            export_task = ExportTask()
+            export_task.user = self.user
+            export_task.data = {
+                'source': reverse('asset-detail', args=[self.asset.uid]),
+                'type': 'csv',
+                'incremental': 'true' if incremental else 'false',
+            }
+            messages = defaultdict(list)
+            export_task._run_task(messages)
+            self.assertFalse(messages)
+            export_task.status = ExportTask.COMPLETE
+            export_task.save()
+            return export_task
+
+        self.asset.deployment.mock_submissions(self.submissions[:2])
+        first_export = run_export()
+        self.assertEqual(first_export.submission_count, 2)
+
+        self.asset.deployment.mock_submissions(self.submissions)
+        with mock.patch.object(
+                MockDeploymentBackend, 'get_submissions',
+                autospec=True,
+                side_effect=MockDeploymentBackend.get_submissions
+        ) as get_submissions:
+            second_export = run_export()
+        # Only the submission received after the first export was requested
+        self.assertEqual(
+            get_submissions.call_args[1]['query'], {'_id': {'$gt': 62}})
+        self.assertEqual(second_export.signature, first_export.signature)
+        self.assertEqual(second_export.submission_count, 3)
+        self.assertEqual(second_export.last_submission_id, 63)
+        self.assertEqual(
+            second_export.last_submission_time,
+            first_export.last_submission_time.replace(
+                hour=9, minute=42, second=11)
+        )
+        full_export = run_export(incremental=False)
+        self.assertEqual(list(second_export.result), list(full_export.result))
+
+    def test_formpack_export_continuation(self):
+        '''
+        Incremental and sharded CSV exports rely on formpack behavior that is
+        not part of its public API; see `ExportTask._continue_index()`
+        '''
+        export_task = ExportTask(data={})
+
+        def build_export(submissions):
+            pack, submission_stream = report_data.build_formpack(
+                self.asset, submission_stream=submissions)
+            return (pack.export(**export_task._build_export_options(pack)),
+                    submission_stream)
+
+        submissions = self.asset.deployment.get_submissions()
+        export, submission_stream = build_export(submissions)
+        full_lines = list(export.to_csv(submission_stream))
+
+        # Append all but the first submission, as an incremental export would
+        export, submission_stream = build_export(submissions[1:])
+        self.assertTrue(ExportTask._continue_index(export, 1))
+        header_line_count = ExportTask._count_csv_header_lines(export)
+        self.assertEqual(header_line_count, 1)
+        lines = list(export.to_csv(submission_stream))
+        self.assertEqual(lines[:header_line_count],
+                         full_lines[:header_line_count])
+        self.assertEqual(lines[header_line_count:],
+                         full_lines[header_line_count + 1:])
+
+    def test_incremental_export_of_submissions_in_the_same_second(self):
+        def run_export(incremental=True):
+            export_task = ExportTask()
+            export_task.user = self.user
+            export_task.data = {
+                'source': reverse('asset-detail', args=[self.asset.uid]),
+                'type': 'csv',
+                'incremental': 'true' if incremental else 'false',
+            }
+            messages = defaultdict(list)
+            export_task._run_task(messages)
+            self.assertFalse(messages)
+            export_task.status = ExportTask.COMPLETE
+            export_task.save()
+            return export_task
+
+        self.asset.deployment.mock_submissions(self.submissions[:2])
+        first_export = run_export()
+        # Received after the first export, but within the same second as the
+        # last submission it contains
+        late_submission = dict(
+            self.submissions[2],
+            _submission_time=self.submissions[1]['_submission_time'])
+        self.asset.deployment.mock_submissions(
+            self.submissions[:2] + [late_submission])
+        second_export = run_export()
+        self.assertEqual(second_export.submission_count, 3)
+        full_export = run_export(incremental=False)
+        self.assertEqual(list(second_export.result), list(full_export.result))
+
+    def test_incremental_export_requires_same_options(self):
+        export_task = ExportTask()
+        export_task.user = self.user
+        export_task.data = {
+            'source': reverse('asset-detail', args=[self.asset.uid]),
+            'type': 'csv',
+        }
+        signature = export_task._build_signature(self.asset)
+        export_task.data['lang'] = 'English'
+        self.assertNotEqual(export_task._build_signature(self.asset), signature)
+        del export_task.data['lang']
+        # Deploying a new version changes the versions being exported
+        self.asset.save()
+        self.asset.deploy(backend='mock', active=True)
+        self.assertNotEqual(export_task._build_signature(self.asset), signature)
+
+    def test_sharded_csv_export(self):
+        def create_export():
+            return ExportTask.objects.create(user=self.user, data={
+                'source': reverse('asset-detail', args=[self.asset.uid]),
+                'type': 'csv',
+            })
+
+        export_task = create_export()
+        with override_settings(EXPORT_SHARD_SIZE=2), mock.patch(
+                'kpi.tasks.export_shard_in_background.delay') as delay:
+            export_task.run()
+        self.assertEqual(delay.call_count, 2)
+        export_task = ExportTask.objects.get(pk=export_task.pk)
+        self.assertEqual(export_task.status, ExportTask.PROCESSING)
+        self.assertEqual(
+            [shard[:2] for shard in export_task.data['shards']],
+            [[61, 0], [63, 2]]
+        )
+        # Shards may finish in any order
+        for args, kwargs in reversed(delay.call_args_list):
+            ExportTask.objects.get(uid=args[0]).run_shard(args[1])
+
+        export_task = ExportTask.objects.get(pk=export_task.pk)
+        self.assertEqual(export_task.status, ExportTask.COMPLETE)
+        self.assertEqual(export_task.pending_shards, 0)
+        self.assertEqual(export_task.submission_count, 3)
+        for shard in export_task.data['shards']:
+            self.assertFalse(export_task.result.storage.exists(shard[2]))
+        unsharded_export = create_export()
+        unsharded_export.run()
+        self.assertIsNone(unsharded_export.pending_shards)
+        self.assertEqual(
+            list(export_task.result), list(unsharded_export.result))
+
+
+@unittest.skipUnless(
+    os.environ.get('KPI_RUN_BENCHMARKS', 'False') == 'True',
+    'set KPI_RUN_BENCHMARKS=True to run'
+)
+class ExportMemoryCeilingTestCase(TestCase):
+    '''
+    Exporting a huge number of submissions must not hold them, or the output,
+    in memory
+    '''
+    fixtures = ['test_data']
+
+    SUBMISSION_COUNT = 1000000
+    # Allowed growth of the peak resident set size, in bytes
+    MEMORY_CEILING = 150 * 1024 * 1024
+
+    def setUp(self):
+        self.user = User.objects.get(username='someuser')
+        self.asset = Asset.objects.create(
+            name='Very many submissions',
+            owner=self.user,
+            content={'survey': [
+                {'name': 'q', 'type': 'integer'},
+                {'name': 'note', 'type': 'text'},
+            ]},
+        )
+        self.asset.deploy(backend='mock', active=True)
+
+    def _generate_submissions(self):
+        version_uid = self.asset.latest_deployed_version.uid
+        for i in range(self.SUBMISSION_COUNT):
+            yield {
+                '__version__': version_uid,
+                '_id': i,
+                '_submission_time': '2018-01-01T00:00:00',
+                'q': i,
+                'note': 'submission number {}'.format(i),
+            }
+
+    def test_csv_export_memory_ceiling(self):
+        export_task = ExportTask()
+        export_task.user = self.user
+        export_task.data = {
+            'source': reverse('asset-detail', args=[self.asset.uid]),
+            'type': 'csv'
+        }
+        messages = defaultdict(list)
+        # `ru_maxrss` is in kilobytes on Linux
+        peak_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        with mock.patch.object(
+            MockDeploymentBackend,
+            'get_submissions',
+            side_effect=lambda *args, **kwargs: self._generate_submissions()
+        ):
+            export_task._run_task(messages)
+        peak_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        self.assertLess(peak_after - peak_before, self.MEMORY_CEILING)
+        line_count = 0
+        for _ in export_task.result:
+            line_count += 1
+        # Don't forget to add one for the header row!
+        self.assertEqual(line_count, self.SUBMISSION_COUNT + 1)
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import copy
+import os
+import time
 import unittest
 
 from django.test import TestCase
@@ -156,3 +159,117 @@ class MongoBase64Decoding(TestCase):
         decoded = list(get_instances_from_mongo())
         expected_results = decoded_results
         self.assertEqual(decoded, expected_results)
+
+
+def generate_encoded_submissions(count, question_count=200):
+    '''
+    Return `count` submissions shaped like those KC stores in Mongo: metadata,
+    `question_count` questions in groups, some of which have names with dots,
+    and a repeating group
+    '''
+    submissions = []
+    for i in range(count):
+        submission = {
+            '__version__': 'vPtjMxE37b4kgqoCBFEkeb',
+            '_attachments': [],
+            '_geolocation': [None, None],
+            '_id': i,
+            '_notes': [],
+            '_status': 'submitted_via_web',
+            '_submission_time': '2017-12-20T07:19:38',
+            '_tags': [],
+            '_uuid': 'f9753a6e-abd3-47e3-a218-9ad1adfa2688',
+            '_validation_status': {},
+            'formhub/uuid': 'c1aae157497d477aa3443b2ca9306e2e',
+            'meta/instanceID': 'uuid:f9753a6e-abd3-47e3-a218-9ad1adfa2688',
+        }
+        for question in range(question_count):
+            if question % 10 == 0:
+                name = 'groupLg=={}/qLg=={}'.format(question // 20, question)
+            else:
+                name = 'group{}/q{}'.format(question // 20, question)
+            submission[name] = str(i * question)
+        submission['repeatLg==group'] = [
+            {'repeatLg==group/childLg==q': str(j), 'repeat.group/other': 'x'}
+            for j in range(3)
+        ]
+        submissions.append(submission)
+    return submissions
+
+
+class MongoKeyTranslation(TestCase):
+    '''
+    `to_readable_dict()` and `to_safe_dict()` remember key translations; make
+    sure they still agree with translating every key from scratch
+    '''
+
+    @staticmethod
+    def uncached_to_readable_dict(d):
+        for key, value in list(d.items()):
+            if type(value) == list:
+                value = [MongoKeyTranslation.uncached_to_readable_dict(e)
+                         if type(e) == dict else e for e in value]
+            elif type(value) == dict:
+                value = MongoKeyTranslation.uncached_to_readable_dict(value)
+            if MongoHelper._is_attribute_encoded(key):
+                del d[key]
+                d[MongoHelper.decode(key)] = value
+        return d
+
+    def test_readable_dict_matches_uncached(self):
+        submissions = generate_encoded_submissions(3)
+        expected = [self.uncached_to_readable_dict(copy.deepcopy(submission))
+                    for submission in submissions]
+        for attempt in range(2):
+            decoded = [MongoHelper.to_readable_dict(copy.deepcopy(submission))
+                       for submission in submissions]
+            self.assertEqual(decoded, expected)
+        self.assertEqual(expected[0]['repeat.group'][0]['repeat.group/child.q'],
+                         '0')
+
+    def test_safe_dict_round_trip(self):
+        submission = MongoHelper.to_readable_dict(
+            generate_encoded_submissions(1)[0])
+        submission['$dollar.key'] = 'yes'
+        submission['_validation_status.uid'] = 'validation_status_approved'
+        for attempt in range(2):
+            safe = MongoHelper.to_safe_dict(copy.deepcopy(submission))
+            self.assertEqual(safe['JA==dollarLg==key'], 'yes')
+            self.assertEqual(safe['_validation_status']['uid'],
+                             'validation_status_approved')
+            self.assertEqual(safe['groupLg==0/qLg==0'], '0')
+
+    def test_cache_is_bounded(self):
+        original_size = MongoHelper.KEY_CACHE_SIZE
+        MongoHelper.KEY_CACHE_SIZE = 10
+        try:
+            for i in range(25):
+                MongoHelper.to_readable_dict({'keyLg=={}'.format(i): i})
+                self.assertLessEqual(len(MongoHelper._readable_keys), 10)
+        finally:
+            MongoHelper.KEY_CACHE_SIZE = original_size
+
+
+@unittest.skipUnless(
+    os.environ.get('KPI_RUN_BENCHMARKS', 'False') == 'True',
+    'set KPI_RUN_BENCHMARKS=True to run'
+)
+class MongoKeyTranslationBenchmark(TestCase):
+    SUBMISSION_COUNT = 2000
+
+    def test_to_readable_dict_speed(self):
+        submissions = generate_encoded_submissions(self.SUBMISSION_COUNT)
+        copies = [copy.deepcopy(submissions) for attempt in range(2)]
+
+        start = time.time()
+        for submission in copies[0]:
+            MongoKeyTranslation.uncached_to_readable_dict(submission)
+        uncached_time = time.time() - start
+
+        start = time.time()
+        for submission in copies[1]:
+            MongoHelper.to_readable_dict(submission)
+        cached_time = time.time() - start
+
+        self.assertEqual(copies[0], copies[1])
+        self.assertLess(cached_time, uncached_time)
@@ -0,0 +1,269 @@
+import os
+import unittest
+
+import mock
+from django.contrib.auth.models import AnonymousUser, User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from ..models.asset import Asset
+from ..models.collection import Collection
+from ..models.object_permission import (
+    EffectivePermission,
+    ObjectPermission,
+    ObjectPermissionMixin,
+    PermissionPropagation,
+)
+
+
+class PermissionsTreeMixin(object):
+    ''' Build synthetic trees and compare the set-based
+    `Collection.recalculate_descendants_perms()` against the parent-by-parent
+    walk of `ObjectPermissionMixin` '''
+
+    def _build_tree(self, depth, fan_out, user_count):
+        users = [
+            User.objects.create(username='bench_{}_{}'.format(user_count, i))
+            for i in range(user_count)
+        ]
+        root = Collection.objects.create(owner=self.admin, name='root')
+        root.assign_perm(AnonymousUser(), 'view_collection', defer_recalc=True)
+        level = [root]
+        for current_depth in range(depth):
+            next_level = []
+            for parent in level:
+                for i in range(fan_out):
+                    child = Collection(
+                        owner=self.admin, name='c', parent=parent)
+                    child.save()
+                    Asset.objects.create(owner=self.admin, parent=child)
+                    next_level.append(child)
+            level = next_level
+        # Spread grants across the tree, and deny one user somewhere in the
+        # middle so that the deny has to stop inheritance
+        for i, user in enumerate(users):
+            root.assign_perm(
+                user, 'change_collection' if i % 2 else 'view_collection',
+                defer_recalc=True
+            )
+        middle = root.get_children()[0]
+        middle.assign_perm(users[0], 'view_collection', deny=True,
+                           defer_recalc=True)
+        root.refresh_effective_perms()
+        return root
+
+    def _snapshot(self):
+        return (
+            set(ObjectPermission.objects.values_list(
+                'content_type_id', 'object_id', 'user_id', 'permission_id',
+                'deny', 'inherited'
+            )),
+            set(EffectivePermission.objects.values_list(
+                'content_type_id', 'object_id', 'user_id', 'codename'
+            )),
+        )
+
+    def _count_queries(self, method, root):
+        ''' Return the number of queries, excluding INSERTs. `bulk_create()`
+        splits INSERTs into batches on some database backends, so they are
+        not counted '''
+        root = Collection.objects.get(pk=root.pk)
+        with CaptureQueriesContext(connection) as context:
+            method(root)
+        return len([
+            query for query in context.captured_queries
+            if not query['sql'].lstrip().upper().startswith('INSERT')
+        ])
+
+    def _assert_matches_walk(self, depth, fan_out, user_count):
+        root = self._build_tree(depth, fan_out, user_count)
+        walk_queries = self._count_queries(
+            ObjectPermissionMixin.recalculate_descendants_perms, root)
+        expected = self._snapshot()
+        set_queries = self._count_queries(
+            Collection.recalculate_descendants_perms, root)
+        self.assertEqual(self._snapshot(), expected)
+        self.assertLess(set_queries, walk_queries)
+        root.delete()
+
+
+class PermissionsRecalculationTestCase(PermissionsTreeMixin, TestCase):
+    fixtures = ['test_data']
+
+    def setUp(self):
+        self.admin = User.objects.get(username='admin')
+
+    def test_set_based_recalculation(self):
+        self._assert_matches_walk(3, 2, 3)
+
+    def test_deny_stops_inheritance(self):
+        root = self._build_tree(2, 2, 2)
+        denied_user = User.objects.get(username='bench_2_0')
+        middle = root.get_children()[0]
+        root.recalculate_descendants_perms()
+        self.assertTrue(root.has_perm(denied_user, 'view_collection'))
+        self.assertFalse(middle.has_perm(denied_user, 'view_collection'))
+        for child in middle.get_children():
+            self.assertFalse(child.has_perm(denied_user, 'view_collection'))
+            for asset in child.assets.all():
+                self.assertFalse(asset.has_perm(denied_user, 'view_asset'))
+        other_child = root.get_children()[1]
+        self.assertTrue(
+            other_child.assets.first().has_perm(denied_user, 'view_asset'))
+
+
+@unittest.skipUnless(
+    os.environ.get('KPI_RUN_BENCHMARKS', 'False') == 'True',
+    'set KPI_RUN_BENCHMARKS=True to run'
+)
+class PermissionsRecalculationBenchmarkTestCase(PermissionsTreeMixin, TestCase):
+    ''' Same comparison over trees of varying depth, fan-out, and number of
+    users '''
+    fixtures = ['test_data']
+
+    # (depth, fan-out, users)
+    TREE_SHAPES = (
+        (2, 2, 2),
+        (3, 3, 3),
+        (4, 3, 5),
+    )
+
+    def setUp(self):
+        self.admin = User.objects.get(username='admin')
+
+    def test_tree_shapes(self):
+        for depth, fan_out, user_count in self.TREE_SHAPES:
+            self._assert_matches_walk(depth, fan_out, user_count)
+
+
+@override_settings(ASYNC_PERMISSION_PROPAGATION=True)
+class AsyncPermissionPropagationTestCase(TestCase):
+    fixtures = ['test_data']
+
+    def setUp(self):
+        patcher = mock.patch(
+            'kpi.tasks.propagate_permissions_in_background.apply_async')
+        self.apply_async = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.admin = User.objects.get(username='admin')
+        self.someuser = User.objects.get(username='someuser')
+        self.anotheruser = User.objects.get(username='anotheruser')
+        self.parent = Collection.objects.create(
+            owner=self.admin, name='parent')
+        self.child = Collection.objects.create(
+            owner=self.admin, name='child', parent=self.parent)
+        self.asset = Asset.objects.create(owner=self.admin, parent=self.child)
+        for propagation in PermissionPropagation.objects.all():
+            propagation.run()
+        self.apply_async.reset_mock()
+
+    def test_propagation_is_deferred_and_coalesced(self):
+        self.parent.assign_perm(self.someuser, 'view_collection')
+        self.child.assign_perm(self.anotheruser, 'view_collection')
+        self.parent.assign_perm(self.anotheruser, 'change_collection')
+        # The change to `child` and the second change to `parent` were merged
+        # into the first propagation
+        self.assertEqual(self.apply_async.call_count, 1)
+        propagation = PermissionPropagation.objects.get()
+        self.assertEqual(propagation.content_object, self.parent)
+        # Descendants keep their old permissions until the task runs
+        self.assertFalse(self.asset.has_perm(self.someuser, 'view_asset'))
+        self.assertTrue(
+            PermissionPropagation.objects.is_pending_for_object(self.asset))
+        self.assertTrue(
+            PermissionPropagation.objects.is_pending_for_object(self.child))
+        self.assertFalse(
+            PermissionPropagation.objects.is_pending_for_object(self.parent))
+
+        propagation.run()
+        self.assertFalse(PermissionPropagation.objects.exists())
+        self.assertFalse(
+            PermissionPropagation.objects.is_pending_for_object(self.asset))
+        self.assertTrue(self.asset.has_perm(self.someuser, 'view_asset'))
+        self.assertTrue(self.asset.has_perm(self.anotheruser, 'change_asset'))
+
+    def test_failed_propagation_stays_pending(self):
+        self.parent.assign_perm(self.someuser, 'view_collection')
+        propagation = PermissionPropagation.objects.get()
+        with mock.patch.object(
+                Collection, 'recalculate_descendants_perms',
+                side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                propagation.run()
+        self.assertTrue(
+            PermissionPropagation.objects.is_pending_for_object(self.asset))
+        self.assertFalse(self.asset.has_perm(self.someuser, 'view_asset'))
+        # The retry succeeds
+        propagation.run()
+        self.assertFalse(PermissionPropagation.objects.exists())
+        self.assertTrue(self.asset.has_perm(self.someuser, 'view_asset'))
+
+    def test_asset_changes_are_not_deferred(self):
+        self.asset.assign_perm(self.someuser, 'view_asset')
+        self.assertFalse(self.apply_async.called)
+        self.assertTrue(self.asset.has_perm(self.someuser, 'view_asset'))
+
+
+class AssetSaveQueryCountTestCase(TestCase):
+    ''' Saving changes that do not affect ownership or the hierarchy, e.g. a
+    form builder autosave, must not recalculate permissions '''
+    fixtures = ['test_data']
+
+    PERMISSION_TABLES = (
+        ObjectPermission._meta.db_table,
+        EffectivePermission._meta.db_table,
+    )
+
+    def setUp(self):
+        self.admin = User.objects.get(username='admin')
+        self.someuser = User.objects.get(username='someuser')
+        self.collection = Collection.objects.create(
+            owner=self.admin, name='parent')
+        self.collection.assign_perm(self.someuser, 'change_collection')
+        asset = Asset.objects.create(owner=self.admin, parent=self.collection)
+        self.asset = Asset.objects.get(pk=asset.pk)
+
+    def _save_and_capture(self, asset):
+        with CaptureQueriesContext(connection) as context:
+            asset.save()
+        permission_queries = [
+            query for query in context.captured_queries
+            if any(table in query['sql'] for table in self.PERMISSION_TABLES)
+        ]
+        return len(context.captured_queries), len(permission_queries)
+
+    def test_trivial_save_skips_recalculation(self):
+        self.asset.name = 'renamed'
+        self.asset.settings = {'description': 'autosaved'}
+        trivial_queries, permission_queries = self._save_and_capture(
+            self.asset)
+        self.assertEqual(permission_queries, 0)
+        # Saving again without changes behaves the same
+        self.assertEqual(self._save_and_capture(self.asset)[1], 0)
+
+        self.asset.parent = None
+        moved_queries, permission_queries = self._save_and_capture(self.asset)
+        self.assertGreater(permission_queries, 0)
+        self.assertLess(trivial_queries, moved_queries)
+        self.assertFalse(self.asset.has_perm(self.someuser, 'change_asset'))
+
+    def test_owner_change_recalculates(self):
+        self.asset.owner = self.someuser
+        self.asset.save()
+        self.assertTrue(self.asset.has_perm(self.someuser, 'delete_asset'))
+        self.assertFalse(self.asset.has_perm(self.admin, 'delete_asset'))
+
+    def test_deferred_fields_are_not_loaded(self):
+        asset = Asset.objects.only('pk', 'name', 'content').get(
+            pk=self.asset.pk)
+        with self.assertNumQueries(0):
+            asset._remember_permission_tracked_fields()
+        self.assertTrue(asset._permission_tracked_fields_changed())
+
+    def test_copy_by_resetting_pk_recalculates(self):
+        self.asset.pk = None
+        self.asset.uid = ''
+        self.asset.save()
+        self.assertTrue(self.asset.has_perm(self.admin, 'delete_asset'))
+        self.assertTrue(self.asset.has_perm(self.someuser, 'change_asset'))
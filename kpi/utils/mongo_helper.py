@@ -38,6 +38,12 @@ class MongoHelper(object):
     USERFORM_ID = "_userform_id"
     DEFAULT_BATCHSIZE = 1000
 
+    # Forms reuse the same few hundred keys in every submission. Remember how
+    # up to this many keys translate instead of examining them every time
+    KEY_CACHE_SIZE = 10000
+    _readable_keys = {}
+    _safe_keys = {}
+
     @classmethod
     def to_readable_dict(cls, d):
         """
@@ -48,17 +54,24 @@ class MongoHelper(object):
         :param d: dict
         :return: dict
         """
-
-        for key, value in list(d.items()):
+        renamed_keys = []
+        for key, value in d.iteritems():
+            # Nested dicts are updated in place
             if type(value) == list:
-                value = [cls.to_readable_dict(e)
-                         if type(e) == dict else e for e in value]
+                for e in value:
+                    if type(e) == dict:
+                        cls.to_readable_dict(e)
             elif type(value) == dict:
-                value = cls.to_readable_dict(value)
+                cls.to_readable_dict(value)
 
-            if cls._is_attribute_encoded(key):
-                del d[key]
-                d[cls.decode(key)] = value
+            readable_key = cls._translate_key(
+                cls._readable_keys, key, cls._get_readable_key)
+            if readable_key != key:
+                renamed_keys.append((key, readable_key))
+
+        # Most dicts have no encoded keys and are left as they are
+        for key, readable_key in renamed_keys:
+            d[readable_key] = d.pop(key)
 
         return d
 
@@ -110,7 +123,9 @@ class MongoHelper(object):
                     # if it is not an int don't convert it
                     pass
 
-            if cls._is_nested_reserved_attribute(key):
+            is_nested_reserved_attribute, safe_key = cls._translate_key(
+                cls._safe_keys, key, cls._get_safe_key)
+            if is_nested_reserved_attribute:
                 # If we want to write into Mongo, we need to transform the dot delimited string into a dict
                 # Otherwise, for reading, Mongo query engine reads dot delimited string as a nested object.
                 # Drawback, if a user uses a reserved property with dots, it will be converted as well.
@@ -132,12 +147,48 @@ class MongoHelper(object):
                     # elements
                     d[first_part].update(cls.to_safe_dict(tree[first_part]))
 
-            elif cls.is_attribute_invalid(key):
+            elif safe_key != key:
                 del d[key]
-                d[cls.encode(key)] = value
+                d[safe_key] = value
 
         return d
 
+    @classmethod
+    def _translate_key(cls, cache, key, translate):
+        """
+        Return `translate(key)`, remembering the result in `cache`. The cache
+        is emptied when it reaches `KEY_CACHE_SIZE`
+
+        :param cache: dict
+        :param key: string
+        :param translate: callable
+        """
+        try:
+            return cache[key]
+        except KeyError:
+            if len(cache) >= cls.KEY_CACHE_SIZE:
+                cache.clear()
+            translated = cache[key] = translate(key)
+            return translated
+
+    @classmethod
+    def _get_readable_key(cls, key):
+        if cls._is_attribute_encoded(key):
+            return cls.decode(key)
+        return key
+
+    @classmethod
+    def _get_safe_key(cls, key):
+        """
+        :return: tuple. Whether `key` is a nested reserved attribute, and the
+            key to use in Mongo otherwise
+        """
+        if cls._is_nested_reserved_attribute(key):
+            return True, key
+        if cls.is_attribute_invalid(key):
+            return False, cls.encode(key)
+        return False, key
+
     @classmethod
     def encode(cls, key):
         """
@@ -5,6 +5,7 @@ import base64
 import copy
 import datetime
 import json
+from collections import OrderedDict
 from hashlib import md5
 from itertools import chain
 
@@ -17,7 +18,12 @@ from django.contrib.auth.models import User
 from django.db import transaction
 from django.db.models import Q
 from django.forms import model_to_dict
-from django.http import Http404, HttpResponseBadRequest, HttpResponseRedirect
+from django.http import (
+    Http404,
+    HttpResponseBadRequest,
+    HttpResponseRedirect,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, resolve_url
 from django.template.response import TemplateResponse
 from django.utils.http import is_safe_url
@@ -57,6 +63,7 @@ from .constants import (
     CLONE_COMPATIBLE_TYPES,
     CLONE_FROM_VERSION_ID_ARG_NAME,
     COLLECTION_CLONE_FIELDS,
+    INSTANCE_FORMAT_TYPE_JSON,
     X_OPENROSA_ACCEPT_CONTENT_LENGTH
 )
 from .deployment_backends.backends import DEPLOYMENT_BACKENDS
@@ -80,6 +87,7 @@ from .models import (
     ImportTask,
     ObjectPermission,
     OneTimeAuthenticationKey,
+    ReportStatistics,
     UserCollectionSubscription
 )
 from .models.authorized_application import ApplicationTokenAuthentication
@@ -89,6 +97,7 @@ from .permissions import (
     IsOwnerOrReadOnly,
     PostMappedToChangePermission,
     get_perm_name,
+    get_permission_resolver,
     SubmissionsPermissions
 )
 from .renderers import (
@@ -96,6 +105,7 @@ from .renderers import (
     SSJsonRenderer,
     XFormRenderer,
     XMLRenderer,
+    SubmissionJSONRenderer,
     SubmissionXMLRenderer,
     XlsRenderer,
 )
@@ -118,6 +128,7 @@ from .serializers import (
     ObjectPermissionSerializer,
     OneTimeAuthenticationKeySerializer,
     SitewideMessageSerializer,
+    SubmissionKeysetPagination,
     TagListSerializer,
     TagSerializer,
     UserCollectionSubscriptionSerializer,
@@ -174,7 +185,8 @@ class ObjectPermissionViewSet(NoUpdateModelViewSet):
             share_permission = 'share_submissions'
         else:
             share_permission = 'share_{}'.format(model_name)
-        return affected_object.has_perm(self.request.user, share_permission)
+        return get_permission_resolver(self.request).has_perm(
+            affected_object, share_permission)
 
     def perform_create(self, serializer):
         # Make sure the requesting user has the share_ permission on
@@ -228,7 +240,8 @@ class CollectionViewSet(viewsets.ModelViewSet):
         original_uid = self.request.data[CLONE_ARG_NAME]
         original_collection = get_object_or_404(Collection, uid=original_uid)
         view_perm = get_perm_name('view', original_collection)
-        if not self.request.user.has_perm(view_perm, original_collection):
+        if not get_permission_resolver(self.request).has_perm(
+                original_collection, view_perm):
             raise Http404
         else:
             # Copy the essential data from the original collection.
@@ -574,6 +587,7 @@ class ExportTaskViewSet(NoUpdateModelViewSet):
             'lang',
             'hierarchy_in_labels',
             'fields_from_all_versions',
+            'incremental',
         )
         task_data = {}
         for opt in valid_options:
@@ -595,9 +609,20 @@ class ExportTaskViewSet(NoUpdateModelViewSet):
         if not source.has_deployment:
             raise exceptions.ValidationError(
                 {'source': 'The specified asset must be deployed.'})
+        export_task = ExportTask(user=request.user, data=task_data)
+        # Nothing to do if an identical export of the same submissions exists
+        cached_export = export_task.find_cached_export(source)
+        if cached_export is not None:
+            return Response({
+                'uid': cached_export.uid,
+                'url': reverse(
+                    'exporttask-detail',
+                    kwargs={'uid': cached_export.uid},
+                    request=request),
+                'status': cached_export.status
+            }, status.HTTP_200_OK)
         # Create a new export task
-        export_task = ExportTask.objects.create(user=request.user,
-                                                data=task_data)
+        export_task.save()
         # Have Celery run the export in the background
         export_in_background.delay(export_task_uid=export_task.uid)
         return Response({
@@ -697,7 +722,8 @@ class AssetFileViewSet(NestedViewSetMixin, NoUpdateModelViewSet):
 
     def perform_create(self, serializer):
         asset = Asset.objects.get(uid=self.get_parents_query_dict()['asset'])
-        if not self.request.user.has_perm('change_asset', asset):
+        if not get_permission_resolver(self.request).has_perm(
+                asset, 'change_asset'):
             raise exceptions.PermissionDenied()
         serializer.save(
             asset=asset,
@@ -706,7 +732,8 @@ class AssetFileViewSet(NestedViewSetMixin, NoUpdateModelViewSet):
 
     def perform_destroy(self, *args, **kwargs):
         asset = Asset.objects.get(uid=self.get_parents_query_dict()['asset'])
-        if not self.request.user.has_perm('change_asset', asset):
+        if not get_permission_resolver(self.request).has_perm(
+                asset, 'change_asset'):
             raise exceptions.PermissionDenied()
         return super(AssetFileViewSet, self).perform_destroy(*args, **kwargs)
 
@@ -754,6 +781,32 @@ class HookSignalViewSet(NestedViewSetMixin, viewsets.ViewSet):
     >           "instance_id": {integer}
     >        }
 
+    Tells the hooks to post several instances at once (e.g. after a bulk import).
+    <pre class="prettyprint">
+    <b>POST</b> /assets/<code>{uid}</code>/hook-signal/bulk/
+    </pre>
+
+
+    > Example
+    >
+    >       curl -X POST https://[kpi-url]/assets/aSAvYreNzVEkrWg5Gdcvg/hook-signal/bulk/
+
+
+    > **Expected payload**
+    >
+    >        {
+    >           "instance_ids": [{integer}]
+    >        }
+
+    > **Response**
+    >
+    >        {
+    >           "detail": {string},
+    >           "accepted": [{integer}],
+    >           "already_submitted": [{integer}],
+    >           "not_found": [{integer}]
+    >        }
+
     """
     parent_model = Asset
 
@@ -774,7 +827,10 @@ class HookSignalViewSet(NestedViewSetMixin, viewsets.ViewSet):
 
         instance = None
         try:
-            instance = asset.deployment.get_submission(instance_id)
+            # Only the id is needed to check the instance exists
+            instance = asset.deployment.get_submission(
+                instance_id,
+                fields=[asset.deployment.INSTANCE_ID_FIELDNAME])
         except ValueError:
             raise Http404
 
@@ -783,6 +839,8 @@ class HookSignalViewSet(NestedViewSetMixin, viewsets.ViewSet):
                 instance.get(asset.deployment.INSTANCE_ID_FIELDNAME) == instance_id):
             raise Http404
 
+        ReportStatistics.schedule_refresh(asset)
+
         if HookUtils.call_services(asset, instance_id):
             # Follow Open Rosa responses by default
             response_status_code = status.HTTP_202_ACCEPTED
@@ -801,6 +859,69 @@ class HookSignalViewSet(NestedViewSetMixin, viewsets.ViewSet):
 
         return Response(response, status=response_status_code)
 
+    @list_route(methods=["POST"])
+    def bulk(self, request, *args, **kwargs):
+        """
+        Triggers hook services of the Asset for several instances at once.
+        Instances are checked with one query, whatever their number.
+
+        :param request:
+        :return:
+        """
+        asset_uid = self.get_parents_query_dict().get("asset")
+        asset = get_object_or_404(self.parent_model, uid=asset_uid)
+
+        instances_ids = request.data.get("instance_ids")
+        if not isinstance(instances_ids, list) or not instances_ids:
+            raise exceptions.ValidationError(
+                {'instance_ids': _('A non-empty list of integers is required.')})
+        if len(instances_ids) > settings.HOOK_SIGNAL_BULK_MAX_SIZE:
+            raise exceptions.ValidationError(
+                {'instance_ids': _('Ensure this list has at most {} items.').format(
+                    settings.HOOK_SIGNAL_BULK_MAX_SIZE)})
+        try:
+            # Remove duplicates but keep order
+            instances_ids = list(OrderedDict.fromkeys(
+                int(instance_id) for instance_id in instances_ids))
+        except (TypeError, ValueError):
+            raise exceptions.ValidationError(
+                {'instance_ids': _('A non-empty list of integers is required.')})
+
+        # Check which instances really belong to Asset.
+        id_fieldname = asset.deployment.INSTANCE_ID_FIELDNAME
+        submissions = asset.deployment.get_submissions(
+            INSTANCE_FORMAT_TYPE_JSON, instances_ids=instances_ids,
+            fields=[id_fieldname])
+        existing_instances_ids = set(
+            submission.get(id_fieldname) for submission in submissions)
+        found_instances_ids = [instance_id for instance_id in instances_ids
+                               if instance_id in existing_instances_ids]
+        if not found_instances_ids:
+            raise Http404
+
+        ReportStatistics.schedule_refresh(asset)
+
+        accepted_instances_ids = HookUtils.call_services_bulk(
+            asset, found_instances_ids)
+        accepted = set(accepted_instances_ids)
+        response = {
+            "accepted": accepted_instances_ids,
+            "already_submitted": [instance_id for instance_id in found_instances_ids
+                                  if instance_id not in accepted],
+            "not_found": [instance_id for instance_id in instances_ids
+                          if instance_id not in existing_instances_ids],
+        }
+        if accepted_instances_ids:
+            response_status_code = status.HTTP_202_ACCEPTED
+            response["detail"] = _(
+                "We got and saved your data, but may not have fully processed it. You should not try to resubmit.")
+        else:
+            response_status_code = status.HTTP_409_CONFLICT
+            response["detail"] = _(
+                "Your data for these instances has been already submitted.")
+
+        return Response(response, status=response_status_code)
+
 
 class SubmissionViewSet(NestedViewSetMixin, viewsets.ViewSet):
     """
@@ -827,6 +948,14 @@ class SubmissionViewSet(NestedViewSetMixin, viewsets.ViewSet):
     >
     >       curl -X GET https://[kpi-url]/assets/aSAvYreNzVEkrWg5Gdcvg/submissions/
 
+    Large projects can be paged through efficiently with `cursor`, in JSON
+    only. Send an empty `cursor` to get the first `limit` submissions, ordered
+    by `_id`, in `results`. Follow the `next` URL for the following page; it is
+    `null` on the last page. `start` and `sort` cannot be used with `cursor`.
+    <pre class="prettyprint">
+    <b>GET</b> /assets/<code>{asset_uid}</code>/submissions/?format=json&cursor=&limit=100
+    </pre>
+
     ## CRUD
 
     * `uid` - is the unique identifier of a specific asset
@@ -935,7 +1064,7 @@ class SubmissionViewSet(NestedViewSetMixin, viewsets.ViewSet):
     """
     parent_model = Asset
     renderer_classes = (renderers.BrowsableAPIRenderer,
-                        renderers.JSONRenderer,
+                        SubmissionJSONRenderer,
                         SubmissionXMLRenderer
                         )
     permission_classes = (SubmissionsPermissions,)
@@ -985,7 +1114,31 @@ class SubmissionViewSet(NestedViewSetMixin, viewsets.ViewSet):
                 {'limit': _('A valid integer is required')}
             )
         filters['limit'] = min(limit, settings.SUBMISSION_LIST_LIMIT)
+        paginator = None
+        if SubmissionKeysetPagination.cursor_query_param in filters:
+            if format_type != INSTANCE_FORMAT_TYPE_JSON:
+                raise exceptions.ValidationError({
+                    SubmissionKeysetPagination.cursor_query_param: _(
+                        'Only available with the JSON format.')
+                })
+            paginator = SubmissionKeysetPagination()
+            filters = paginator.paginate_filters(filters, request)
         submissions = deployment.get_submissions(format_type=format_type, **filters)
+        renderer = request.accepted_renderer
+        if hasattr(renderer, 'stream'):
+            # Send submissions as they are read instead of holding the whole
+            # page in memory
+            content_type = request.accepted_media_type
+            if renderer.charset:
+                content_type = '{}; charset={}'.format(
+                    content_type, renderer.charset)
+            return StreamingHttpResponse(
+                renderer.stream(submissions, paginator),
+                content_type=content_type
+            )
+        if paginator is not None:
+            return paginator.get_paginated_response(
+                paginator.paginate_submissions(submissions))
         return Response(list(submissions))
 
     def retrieve(self, request, pk, *args, **kwargs):
@@ -1501,12 +1654,14 @@ class AssetViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
     def permissions(self, request, uid):
         target_asset = self.get_object()
         source_asset = get_object_or_404(Asset, uid=request.data.get(CLONE_ARG_NAME))
-        user = request.user
+        resolver = get_permission_resolver(request)
+        # Load the permissions of both assets with a single query
+        resolver.prefetch([target_asset, source_asset])
         response = {}
         http_status = status.HTTP_204_NO_CONTENT
 
-        if user.has_perm('share_asset', target_asset) and \
-            user.has_perm('view_asset', source_asset):
+        if resolver.has_perm(target_asset, 'share_asset') and \
+            resolver.has_perm(source_asset, 'view_asset'):
             if not target_asset.copy_permissions_from(source_asset):
                 http_status = status.HTTP_400_BAD_REQUEST
                 response = {"detail": "Source and destination objects don't seem to have the same type"}